@@ -1,6 +1,9 @@
 # backfill_data.py
+import argparse
+import io
 import psycopg2
 import random
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, timedelta
 import time
 
@@ -14,73 +17,205 @@ except ImportError:
 # --- НАСТРОЙКИ ГЕНЕРАЦИИ ---
 START_YEAR = 2006
 END_YEAR = 2024 # Мы заполним данные до конца прошлого года
+MIN_ORDERS = 5   # заказов в месяц (до применения профиля)
+MAX_ORDERS = 20
+
+# Таблица контрольных точек: каждый загруженный месяц записывается в той же транзакции,
+# что и его данные, поэтому повторный запуск продолжает с места остановки.
+SETUP_SQL = """
+CREATE TABLE IF NOT EXISTS classicmodels.backfill_checkpoint (
+    month         DATE PRIMARY KEY,
+    orders        INTEGER NOT NULL,
+    orderdetails  INTEGER NOT NULL,
+    payments      INTEGER NOT NULL,
+    completed_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE SEQUENCE IF NOT EXISTS classicmodels.backfill_ordernumber_seq;
+"""
+
+# Последовательность выдаёт номера заказов параллельным потокам без пересечений.
+# Перед запуском подтягиваем её к MAX(orderNumber), чтобы не столкнуться с существующими заказами.
+SYNC_SEQUENCE_SQL = """
+SELECT setval('classicmodels.backfill_ordernumber_seq',
+              GREATEST((SELECT COALESCE(MAX(orderNumber), 0) FROM classicmodels.orders),
+                       (SELECT last_value FROM classicmodels.backfill_ordernumber_seq)));
+"""
+
+# Сезонные множители объёма по месяцам (пик перед Новым годом, спад летом)
+SEASONAL = [0.8, 0.8, 0.9, 1.0, 1.0, 0.9, 0.8, 0.8, 1.0, 1.1, 1.4, 1.6]
+
+
+def connect():
+    db_uri = DATABASE_URI.replace('postgresql+psycopg2', 'postgresql')
+    return psycopg2.connect(db_uri)
+
+
+def parse_month(value):
+    """'2006-01' -> date(2006, 1, 1)"""
+    year, month = value.split("-")
+    return date(int(year), int(month), 1)
+
+
+def month_range(start, end):
+    """Все месяцы от start до end включительно (первые числа месяцев)."""
+    months = []
+    current = start
+    while current <= end:
+        months.append(current)
+        current = date(current.year + (current.month == 12), current.month % 12 + 1, 1)
+    return months
+
+
+def orders_for_month(rng, month, args, first, last):
+    """Количество заказов в месяце по выбранному профилю объёма."""
+    base = rng.randint(args.min_orders, args.max_orders)
+    if args.profile == "growth":
+        # линейный рост от 1x в первом месяце до --growth x в последнем
+        total = (last.year - first.year) * 12 + last.month - first.month
+        done = (month.year - first.year) * 12 + month.month - first.month
+        factor = 1 + (args.growth - 1) * (done / total if total else 1)
+    elif args.profile == "seasonal":
+        factor = SEASONAL[month.month - 1]
+    else:
+        factor = 1
+    return max(1, int(round(base * factor)))
+
+
+def copy_buffer(rows):
+    """Строки -> текстовый формат COPY (значения без табуляций/переводов строк, NULL = \\N)."""
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join("\\N" if v is None else str(v) for v in row))
+        buf.write("\n")
+    buf.seek(0)
+    return buf
+
+
+def backfill_month(conn, month, n_orders, rng, customer_numbers, product_codes):
+    """
+    Собирает заказы, детали и платежи одного месяца в памяти, загружает их через COPY
+    и отмечает месяц в backfill_checkpoint — всё в одной транзакции.
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT nextval('classicmodels.backfill_ordernumber_seq') FROM generate_series(1, %s);",
+                    (n_orders,))
+        order_numbers = [row[0] for row in cur.fetchall()]
+
+        orders, details, payments = [], [], []
+        for order_number in order_numbers:
+            # Генерируем случайный день в месяце
+            day = rng.randint(1, 28) # Используем 28, чтобы избежать проблем с февралем
+            order_date = month.replace(day=day)
+            required_date = order_date + timedelta(days=rng.randint(7, 21))
+            random_customer = rng.choice(customer_numbers)
+            status = 'Shipped' # Все исторические заказы считаем выполненными
+            orders.append((order_number, order_date, required_date, status, random_customer))
+
+            products_in_order = rng.sample(product_codes, k=min(len(product_codes), rng.randint(1, 4)))
+            total_order_amount = 0
+            for i, product_code in enumerate(products_in_order):
+                quantity = rng.randint(10, 50)
+                price = round(rng.uniform(20.0, 250.0), 2)
+                total_order_amount += quantity * price
+                details.append((order_number, product_code, quantity, f"{price:.2f}", i + 1))
+
+            # номер чека из номера заказа — уникален, не конфликтует с другими платежами клиента
+            amount = round(total_order_amount * rng.uniform(0.9, 1.0), 2)
+            payments.append((random_customer, f"BKF{order_number}", order_date, f"{amount:.2f}"))
+
+        cur.copy_expert("COPY classicmodels.orders (orderNumber, orderDate, requiredDate, status, customerNumber) "
+                        "FROM STDIN", copy_buffer(orders))
+        cur.copy_expert("COPY classicmodels.orderdetails (orderNumber, productCode, quantityOrdered, priceEach, "
+                        "orderLineNumber) FROM STDIN", copy_buffer(details))
+        cur.copy_expert("COPY classicmodels.payments (customerNumber, checkNumber, paymentDate, amount) "
+                        "FROM STDIN", copy_buffer(payments))
+        cur.execute("INSERT INTO classicmodels.backfill_checkpoint (month, orders, orderdetails, payments) "
+                    "VALUES (%s, %s, %s, %s);", (month, len(orders), len(details), len(payments)))
+        conn.commit()
+        return len(orders), len(details), len(payments)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
 
-def backfill_historical_data():
+def backfill_months(months, args, first, last, customer_numbers, product_codes):
+    """Один поток: своё соединение, месяцы по порядку. Возвращает (заказы, детали, платежи, ошибки)."""
+    totals = [0, 0, 0, 0]
+    conn = connect()
+    try:
+        for month in months:
+            # своё зерно на каждый месяц: результат не зависит от распределения по потокам
+            rng = random.Random(f"{args.seed}-{month.isoformat()}")
+            n_orders = orders_for_month(rng, month, args, first, last)
+            try:
+                counts = backfill_month(conn, month, n_orders, rng, customer_numbers, product_codes)
+            except (Exception, psycopg2.Error) as error:
+                print(f"❌ Ошибка в {month:%Y-%m}: {error}")
+                totals[3] += 1
+                continue
+            for i, n in enumerate(counts):
+                totals[i] += n
+            print(f"   -> {month:%Y-%m}: {counts[0]} заказов, {counts[1]} строк, {counts[2]} платежей")
+    finally:
+        conn.close()
+    return totals
+
+
+def backfill_historical_data(args):
     """
-    Одноразовый скрипт для генерации исторических данных и заполнения пробелов.
+    Генерация исторических данных за произвольный диапазон месяцев с контрольными точками
+    и параллельной загрузкой по годам.
     """
+    first, last = parse_month(args.start), parse_month(args.end)
     conn = None
     try:
-        db_uri = DATABASE_URI.replace('postgresql+psycopg2', 'postgresql')
         print("Подключение к базе данных...")
-        conn = psycopg2.connect(db_uri)
+        conn = connect()
         cur = conn.cursor()
+        cur.execute(SETUP_SQL)
+        cur.execute(SYNC_SEQUENCE_SQL)
 
         # --- Получаем начальные данные для генерации ---
-        cur.execute("SELECT customerNumber FROM classicmodels.customers;")
+        cur.execute("SELECT customerNumber FROM classicmodels.customers ORDER BY customerNumber;")
         customer_numbers = [row[0] for row in cur.fetchall()]
 
-        cur.execute("SELECT productCode FROM classicmodels.products;")
+        cur.execute("SELECT productCode FROM classicmodels.products ORDER BY productCode;")
         product_codes = [row[0] for row in cur.fetchall()]
 
-        cur.execute("SELECT MAX(orderNumber) FROM classicmodels.orders;")
-        current_order_number = cur.fetchone()[0]
-
-        print(f"🚀 Начинаем генерацию данных с {START_YEAR} по {END_YEAR} год...")
-
-        # --- Основной цикл по годам и месяцам ---
-        for year in range(START_YEAR, END_YEAR + 1):
-            for month in range(1, 13):
-                # Генерируем случайное количество заказов в этом месяце (например, от 5 до 20)
-                orders_this_month = random.randint(5, 20)
-                
-                print(f"   -> Генерируем {orders_this_month} заказов для {year}-{month:02d}...")
-
-                for _ in range(orders_this_month):
-                    current_order_number += 1
-                    
-                    # Генерируем случайный день в месяце
-                    day = random.randint(1, 28) # Используем 28, чтобы избежать проблем с февралем
-                    order_date = date(year, month, day)
-                    required_date = order_date + timedelta(days=random.randint(7, 21))
-                    random_customer = random.choice(customer_numbers)
-                    status = 'Shipped' # Все исторические заказы считаем выполненными
-
-                    # 1. Вставляем заказ
-                    order_query = "INSERT INTO classicmodels.orders (orderNumber, orderDate, requiredDate, status, customerNumber) VALUES (%s, %s, %s, %s, %s);"
-                    cur.execute(order_query, (current_order_number, order_date, required_date, status, random_customer))
-
-                    # 2. Вставляем детали заказа
-                    products_in_order = random.sample(product_codes, k=random.randint(1, 4))
-                    total_order_amount = 0
-                    for i, product_code in enumerate(products_in_order):
-                        quantity = random.randint(10, 50)
-                        price = round(random.uniform(20.0, 250.0), 2)
-                        total_order_amount += quantity * price
-                        details_query = "INSERT INTO classicmodels.orderdetails (orderNumber, productCode, quantityOrdered, priceEach, orderLineNumber) VALUES (%s, %s, %s, %s, %s);"
-                        cur.execute(details_query, (current_order_number, product_code, quantity, price, i + 1))
-                    
-                    # 3. Вставляем платеж
-                    check_number = f"BKF{random.randint(100000, 999999)}"
-                    amount = round(total_order_amount * random.uniform(0.9, 1.0), 2)
-                    payment_query = "INSERT INTO classicmodels.payments (customerNumber, checkNumber, paymentDate, amount) VALUES (%s, %s, %s, %s);"
-                    cur.execute(payment_query, (random_customer, check_number, order_date, amount))
-
-            # Сохраняем изменения в БД после каждого года, чтобы не перегружать транзакцию
-            conn.commit()
-            print(f"✅ Данные за {year} год успешно сгенерированы и сохранены.")
-
-        print("\n🎉 Все исторические данные успешно добавлены!")
+        cur.execute("SELECT month FROM classicmodels.backfill_checkpoint WHERE month BETWEEN %s AND %s;",
+                    (first, last))
+        done = {row[0] for row in cur.fetchall()}
+        conn.commit()
+        cur.close()
+
+        months = [m for m in month_range(first, last) if m not in done]
+        print(f"🚀 Генерация данных с {first:%Y-%m} по {last:%Y-%m}: осталось {len(months)} месяцев "
+              f"(уже загружено {len(done)}), профиль '{args.profile}', потоков: {args.workers}")
+        if not months:
+            print("✅ Все месяцы диапазона уже загружены.")
+            return
+
+        # годы — единица параллелизма: каждый год идёт в своём потоке на отдельном соединении
+        by_year = {}
+        for m in months:
+            by_year.setdefault(m.year, []).append(m)
+
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            results = list(executor.map(
+                lambda year_months: backfill_months(year_months, args, first, last, customer_numbers, product_codes),
+                by_year.values()))
+        elapsed = time.time() - start
+
+        orders, details, payments, failed = (sum(r[i] for r in results) for i in range(4))
+        rows = orders + details + payments
+        print(f"\n🎉 Загружено {orders} заказов, {details} строк заказов и {payments} платежей "
+              f"за {elapsed:.1f} с ({rows / (elapsed or 1e-9):,.0f} строк/с).")
+        if failed:
+            print(f"⚠️ Месяцев с ошибками: {failed}. Запустите скрипт повторно — он продолжит с них.")
 
     except (Exception, psycopg2.Error) as error:
         print(f"❌ Ошибка: {error}")
@@ -92,5 +227,25 @@ def backfill_historical_data():
             print("Соединение с базой данных закрыто.")
 
 
+def main():
+    parser = argparse.ArgumentParser(description="Возобновляемая генерация исторических заказов через COPY.")
+    parser.add_argument("--start", default=f"{START_YEAR}-01", help=f"Первый месяц YYYY-MM (по умолчанию {START_YEAR}-01)")
+    parser.add_argument("--end", default=f"{END_YEAR}-12", help=f"Последний месяц YYYY-MM (по умолчанию {END_YEAR}-12)")
+    parser.add_argument("--profile", choices=["flat", "growth", "seasonal"], default="flat",
+                        help="Профиль объёма заказов по месяцам (по умолчанию flat)")
+    parser.add_argument("--min-orders", dest="min_orders", type=int, default=MIN_ORDERS,
+                        help=f"Минимум заказов в месяц до профиля (по умолчанию {MIN_ORDERS})")
+    parser.add_argument("--max-orders", dest="max_orders", type=int, default=MAX_ORDERS,
+                        help=f"Максимум заказов в месяц до профиля (по умолчанию {MAX_ORDERS})")
+    parser.add_argument("--growth", type=float, default=3.0,
+                        help="Для профиля growth: во сколько раз последний месяц больше первого (по умолчанию 3)")
+    parser.add_argument("--workers", type=int, default=4, help="Сколько лет загружать параллельно (по умолчанию 4)")
+    parser.add_argument("--seed", type=int, default=42, help="Зерно генератора (по умолчанию 42)")
+    args = parser.parse_args()
+    if parse_month(args.start) > parse_month(args.end):
+        parser.error("--start должен быть не позже --end")
+    backfill_historical_data(args)
+
+
 if __name__ == '__main__':
-    backfill_historical_data()
+    main()
@@ -0,0 +1,303 @@
+# compile_aggregates.py
+"""
+Компилятор предагрегаций по экспорту дашборда Superset.
+
+Читает charts/*.yaml и datasets/**/*.yaml, для каждого чарта достаёт из query_context измерения
+(groupby, оси, фильтры), метрики и time grain и подбирает наименьший набор агрегатных таблиц,
+которые отвечают на все чарты:
+  1. для каждого датасета берутся максимальные наборы измерений (набор, вложенный в другой, лишний);
+  2. два агрегата сливаются в один, если объединённый агрегат по оценке больше меньшего из двух
+     не более чем на --merge-slack — таблиц меньше, а ни один чарт не читает заметно больше строк.
+
+Оценка строк — по выгрузке датасета в CSV (--sample, по умолчанию выгрузка SQL Lab "Full Sales Data"
+из репозитория; --sample-dataset — uuid датасета, которому она соответствует): число различных комбинаций
+измерений против числа строк. Для остальных датасетов оценка "n/a", агрегаты по ним не сливаются.
+
+Результат: SQL для построения агрегатов (материализованные представления + уникальный индекс,
+обновляются так же, как в rollups.py) и отчёт о покрытии: какой чарт каким агрегатом обслуживается.
+"""
+import argparse
+import csv
+import os
+import re
+import sys
+from datetime import date
+
+from rollups import DEFAULT_EXPORT, FULL_SALES_DATA_UUID, chart_requirements, load_export, normalize_metric
+
+DEFAULT_SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sqllab_untitled_query_1_20251017T112323.csv")
+
+# time grain Superset -> единица date_trunc; день для DATE-колонок — это сама колонка
+GRAINS = {"P1D": "day", "P1W": "week", "P1M": "month", "P3M": "quarter", "P1Y": "year"}
+GRAIN_ORDER = ["day", "week", "month", "quarter", "year"]
+
+METRIC_RE = re.compile(r"^(sum|min|max|avg|count|count_distinct)\((.+)\)$")
+
+
+class Measure:
+    """Мера агрегата и выражение, которым чарт доагрегирует её."""
+
+    def __init__(self, column, build, reaggregate):
+        self.column = column            # имя колонки в агрегате
+        self.build = build              # выражение при построении (над исходным датасетом)
+        self.reaggregate = reaggregate  # выражение метрики чарта над агрегатом
+
+
+def slug(expr):
+    return re.sub(r"\W+", "_", expr).strip("_")
+
+
+def decompose(metric):
+    """
+    Нормализованная метрика -> (меры, доп. измерения, выражение над агрегатом) или None, если
+    метрика не раскладывается (медиана, перцентили, оконные функции).
+    COUNT_DISTINCT(col) раскладывается добавлением col в измерения агрегата.
+    """
+    if metric in ("count", "count(*)"):
+        return [Measure("line_count", "COUNT(*)", "SUM(line_count)")], [], "SUM(line_count)"
+    match = METRIC_RE.match(metric)
+    if not match:
+        return None
+    func, arg = match.groups()
+    if func == "count_distinct" or (func == "count" and arg.startswith("distinct")):
+        col = arg.replace("distinct", "", 1)
+        return [], [col], f"COUNT(DISTINCT {col})"
+    if func == "count":
+        m = Measure(f"count_{slug(arg)}", f"COUNT({arg})", f"SUM(count_{slug(arg)})")
+        return [m], [], m.reaggregate
+    if func == "avg":
+        s = Measure(f"sum_{slug(arg)}", f"SUM({arg})", f"SUM(sum_{slug(arg)})")
+        c = Measure(f"count_{slug(arg)}", f"COUNT({arg})", f"SUM(count_{slug(arg)})")
+        return [s, c], [], f"{s.reaggregate} / NULLIF({c.reaggregate}, 0)"
+    m = Measure(f"{func}_{slug(arg)}", f"{func.upper()}({arg})", f"{func.upper()}({func}_{slug(arg)})")
+    return [m], [], m.reaggregate
+
+
+def resolve_metric(metric, dataset):
+    """Имя сохранённой метрики датасета -> её выражение."""
+    saved = {m["metric_name"].lower(): m["expression"] for m in dataset.get("metrics") or []}
+    return normalize_metric(saved[metric]) if metric in saved else metric
+
+
+class ChartNeed:
+    def __init__(self, rel, chart, dataset):
+        req = chart_requirements(chart)
+        self.rel = rel
+        self.name = chart["slice_name"]
+        self.dataset_uuid = chart["dataset_uuid"]
+        self.row_limit = req["row_limit"]
+        self.dims = set(req["dims"])
+        self.measures = {}
+        self.rewrites = {}
+        self.reason = "строки без агрегации" if req["raw"] else None
+        time_col = dataset.get("main_dttm_col")
+        self.grain = GRAINS.get(req["grain"], "day") if time_col in self.dims else None
+        for metric in req["metrics"]:
+            parts = decompose(resolve_metric(metric, dataset))
+            if parts is None:
+                self.reason = f"метрика {metric} не раскладывается"
+                continue
+            measures, extra_dims, expr = parts
+            self.measures.update((m.column, m) for m in measures)
+            self.dims.update(extra_dims)
+            self.rewrites[metric] = expr
+
+
+class Aggregate:
+    def __init__(self, dataset, dims, charts):
+        self.dataset = dataset
+        self.dims = set(dims)
+        self.charts = list(charts)
+
+    @property
+    def measures(self):
+        out = {}
+        for c in self.charts:
+            out.update(c.measures)
+        return out
+
+    @property
+    def grain(self):
+        grains = [c.grain for c in self.charts if c.grain]
+        return min(grains, key=GRAIN_ORDER.index) if grains else None
+
+
+class SampleEstimator:
+    """Оценка числа строк агрегата по выгрузке датасета: число различных комбинаций измерений."""
+
+    def __init__(self, path, dataset_uuid):
+        self.dataset_uuid = dataset_uuid
+        self.rows = []
+        self.columns = set()
+        if path and os.path.exists(path):
+            with open(path, newline="", encoding="utf-8") as f:
+                reader = csv.DictReader(f)
+                self.columns = set(reader.fieldnames or [])
+                self.rows = list(reader)
+
+    def covers(self, dataset, dims):
+        return bool(self.rows) and dataset["uuid"] == self.dataset_uuid and set(dims) <= self.columns
+
+    def estimate(self, dataset, dims, grain=None):
+        if not self.covers(dataset, dims):
+            return None
+        time_col = dataset.get("main_dttm_col")
+
+        def key(row):
+            return tuple(truncate(row[d], grain) if d == time_col else row[d] for d in sorted(dims))
+        return len({key(r) for r in self.rows})
+
+
+def truncate(value, grain):
+    """'2003-01-06' -> начало периода grain (строкой), для оценки без базы."""
+    if grain in (None, "day"):
+        return value
+    year, month, day = value[:10].split("-")
+    if grain == "year":
+        return year
+    if grain == "quarter":
+        return f"{year}-Q{(int(month) - 1) // 3 + 1}"
+    if grain == "month":
+        return f"{year}-{month}"
+    return date(int(year), int(month), int(day)).isocalendar()[:2]
+
+
+def plan_aggregates(needs, datasets, estimator, slack):
+    """Жадный подбор агрегатов: максимальные наборы измерений, затем слияние, пока оно не раздувает объём."""
+    aggregates = []
+    by_dataset = {}
+    for need in needs:
+        by_dataset.setdefault(need.dataset_uuid, []).append(need)
+    for dataset_uuid, group in by_dataset.items():
+        dataset = datasets[dataset_uuid]
+        # максимальные наборы: чарт, чьи измерения вложены в чужой набор, своего агрегата не получает
+        group.sort(key=lambda n: -len(n.dims))
+        local = []
+        for need in group:
+            home = next((a for a in local if need.dims <= a.dims), None)
+            if home:
+                home.charts.append(need)
+            else:
+                local.append(Aggregate(dataset, need.dims, [need]))
+
+        def size(agg_dims, grain):
+            return estimator.estimate(dataset, agg_dims, grain)
+
+        merged = True
+        while merged and len(local) > 1:
+            merged = False
+            best = None
+            for i in range(len(local)):
+                for j in range(i + 1, len(local)):
+                    a, b = local[i], local[j]
+                    grain = Aggregate(dataset, (), a.charts + b.charts).grain
+                    union, sa, sb = size(a.dims | b.dims, grain), size(a.dims, a.grain), size(b.dims, b.grain)
+                    if None in (union, sa, sb) or union > min(sa, sb) * (1 + slack):
+                        continue
+                    if best is None or union < best[0]:
+                        best = (union, i, j)
+            if best:
+                _, i, j = best
+                local[i] = Aggregate(dataset, local[i].dims | local[j].dims, local[i].charts + local[j].charts)
+                del local[j]
+                merged = True
+
+        # окончательно каждый чарт читает самый маленький покрывающий его агрегат
+        for agg in local:
+            agg.charts = []
+        for need in group:
+            fits = [a for a in local if need.dims <= a.dims]
+            min(fits, key=lambda a: (size(a.dims, a.grain) or 0, len(a.dims))).charts.append(need)
+        aggregates.extend(local)
+    for n, agg in enumerate(aggregates, start=1):
+        agg.name = f"agg_{slug(agg.dataset['table_name']).lower()}_{n}"
+    return aggregates
+
+
+def source_sql(dataset):
+    if dataset.get("sql"):
+        return f"(\n{dataset['sql'].strip().rstrip(';')}\n) AS src"
+    return f"{dataset['schema']}.{dataset['table_name']} AS src"
+
+
+def aggregate_sql(agg):
+    time_col = agg.dataset.get("main_dttm_col")
+    dims = sorted(agg.dims)
+    select = []
+    for d in dims:
+        if d == time_col and agg.grain not in (None, "day"):
+            select.append(f"date_trunc('{agg.grain}', {d})::date AS {d}")
+        else:
+            select.append(d)
+    select += [f"{m.build} AS {m.column}" for m in agg.measures.values()]
+    table = f"classicmodels.{agg.name}"
+    return (f"-- charts: {', '.join(c.name for c in agg.charts)}\n"
+            f"CREATE MATERIALIZED VIEW IF NOT EXISTS {table} AS\n"
+            f"SELECT {', '.join(select)}\n"
+            f"FROM {source_sql(agg.dataset)}\n"
+            f"GROUP BY {', '.join(str(i + 1) for i in range(len(dims)))};\n"
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {agg.name}_key ON {table} ({', '.join(dims)});\n")
+
+
+def coverage_report(aggregates, uncovered, estimator):
+    lines = ["# Покрытие чартов агрегатами", "",
+             "| Чарт | Агрегат | Измерения | Метрики над агрегатом | Строк: источник -> агрегат |",
+             "|---|---|---|---|---|"]
+    source_rows = len(estimator.rows)
+    for agg in aggregates:
+        est = estimator.estimate(agg.dataset, agg.dims, agg.grain)
+        reduction = (f"{source_rows} -> {est} (x{source_rows / est:.1f})"
+                     if est else "n/a")
+        if est and source_rows / est < 2:
+            reduction += " — почти не сжимает, чарту хватит исходного датасета"
+        for c in agg.charts:
+            lines.append(f"| {c.name} | {agg.name} | {', '.join(sorted(agg.dims))} | "
+                         f"{'; '.join(c.rewrites.values()) or '-'} | {reduction} |")
+    for need in uncovered:
+        lines.append(f"| {need.name} | — ({need.reason}) | | | |")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Наименьший набор агрегатов для чартов экспорта Superset.")
+    parser.add_argument("--export-dir", dest="export_dir", default=DEFAULT_EXPORT,
+                        help="Папка экспорта дашборда (по умолчанию экспорт из репозитория)")
+    parser.add_argument("--sample", default=DEFAULT_SAMPLE,
+                        help="CSV-выгрузка датасета для оценки числа строк (по умолчанию выгрузка SQL Lab)")
+    parser.add_argument("--sample-dataset", dest="sample_dataset", default=FULL_SALES_DATA_UUID,
+                        help="uuid датасета, которому соответствует --sample (по умолчанию Full Sales Data)")
+    parser.add_argument("--merge-slack", dest="merge_slack", type=float, default=0.1,
+                        help="Допуск слияния: объединённый агрегат не больше (1+slack) x меньшего из двух (по умолчанию 0.1)")
+    parser.add_argument("--sql-out", dest="sql_out", default="chart_aggregates.sql",
+                        help="Куда записать SQL агрегатов (по умолчанию chart_aggregates.sql)")
+    parser.add_argument("--report-out", dest="report_out", default="chart_coverage.md",
+                        help="Куда записать отчёт о покрытии (по умолчанию chart_coverage.md)")
+    args = parser.parse_args()
+
+    charts, datasets = load_export(args.export_dir)
+    needs, uncovered = [], []
+    for rel, chart in sorted(charts.items()):
+        dataset = datasets.get(chart.get("dataset_uuid"))
+        if dataset is None or not chart.get("query_context"):
+            print(f"⚠️ {chart['slice_name']}: нет датасета или query_context, пропускаю", file=sys.stderr)
+            continue
+        need = ChartNeed(rel, chart, dataset)
+        (uncovered if need.reason else needs).append(need)
+
+    estimator = SampleEstimator(args.sample, args.sample_dataset)
+    aggregates = plan_aggregates(needs, datasets, estimator, args.merge_slack)
+
+    with open(args.sql_out, "w", encoding="utf-8") as f:
+        f.write("-- generated by compile_aggregates.py\n\n")
+        f.write("\n".join(aggregate_sql(agg) for agg in aggregates))
+    report = coverage_report(aggregates, uncovered, estimator)
+    with open(args.report_out, "w", encoding="utf-8") as f:
+        f.write(report)
+
+    print(report)
+    print(f"✅ Чартов: {len(needs) + len(uncovered)}, агрегатов: {len(aggregates)}, без покрытия: {len(uncovered)}")
+    print(f"   SQL -> {args.sql_out}, отчёт -> {args.report_out}")
+
+
+if __name__ == '__main__':
+    main()
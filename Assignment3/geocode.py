@@ -0,0 +1,136 @@
+# geocode.py
+"""
+Загрузка координат клиентов (latitude/longitude) одной операцией над множеством.
+
+Таблица город -> координаты хранится как данные в city_coordinates.csv (city,latitude,longitude),
+а не как по одному UPDATE на город в query.sql. Скрипт загружает CSV через COPY во временную таблицу
+и применяет все координаты одним UPDATE ... FROM — один проход по customers вместо прохода на каждый город.
+
+По умолчанию обновляются только клиенты без координат (latitude/longitude IS NULL);
+--all перезаписывает и уже заполненные. В конце печатаются города клиентов, которых нет в CSV.
+"""
+import argparse
+import csv
+import os
+
+import psycopg2
+
+# --- Импортируем строку подключения из файла config.py ---
+try:
+    from config import DATABASE_URI
+except ImportError:
+    print("❌ Ошибка: Не удалось найти файл config.py или переменную DATABASE_URI.")
+    exit()
+
+DEFAULT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "city_coordinates.csv")
+
+SETUP_SQL = """
+ALTER TABLE classicmodels.customers ADD COLUMN IF NOT EXISTS latitude NUMERIC(10, 6);
+ALTER TABLE classicmodels.customers ADD COLUMN IF NOT EXISTS longitude NUMERIC(10, 6);
+CREATE TEMP TABLE geo_staging (
+    city       TEXT NOT NULL,
+    latitude   NUMERIC(10, 6) NOT NULL,
+    longitude  NUMERIC(10, 6) NOT NULL
+) ON COMMIT DROP;
+"""
+
+# Города сравниваются без учёта регистра и пробелов по краям; при повторе города в CSV берётся последняя строка
+LOOKUP_SQL = """
+CREATE TEMP TABLE geo_lookup ON COMMIT DROP AS
+SELECT DISTINCT ON (lower(btrim(city))) lower(btrim(city)) AS city_key, latitude, longitude
+FROM (SELECT *, row_number() OVER () AS n FROM geo_staging) AS s
+ORDER BY lower(btrim(city)), n DESC;
+ANALYZE geo_lookup;
+"""
+
+# IS DISTINCT FROM: строки, где координаты уже совпадают, не переписываются (нет лишних версий строк)
+UPDATE_SQL = """
+UPDATE classicmodels.customers AS c
+SET latitude = g.latitude, longitude = g.longitude
+FROM geo_lookup AS g
+WHERE lower(btrim(c.city)) = g.city_key
+  AND (c.latitude, c.longitude) IS DISTINCT FROM (g.latitude, g.longitude)
+  {only_missing};
+"""
+
+UNMATCHED_SQL = """
+SELECT c.city, COUNT(*) AS customers
+FROM classicmodels.customers AS c
+LEFT JOIN geo_lookup AS g ON lower(btrim(c.city)) = g.city_key
+WHERE g.city_key IS NULL {only_missing}
+GROUP BY c.city
+ORDER BY customers DESC, c.city;
+"""
+
+ONLY_MISSING = "AND (c.latitude IS NULL OR c.longitude IS NULL)"
+
+
+def geocode(args):
+    conn = None
+    try:
+        db_uri = DATABASE_URI.replace('postgresql+psycopg2', 'postgresql')
+        print("Подключение к базе данных...")
+        conn = psycopg2.connect(db_uri)
+        cur = conn.cursor()
+        cur.execute(SETUP_SQL)
+        with open(args.file, encoding="utf-8") as f:
+            cur.copy_expert("COPY geo_staging (city, latitude, longitude) FROM STDIN WITH (FORMAT csv, HEADER true)", f)
+        loaded = cur.rowcount
+        cur.execute(LOOKUP_SQL)
+        cur.execute("SELECT COUNT(*) FROM geo_lookup;")
+        cities = cur.fetchone()[0]
+        print(f"📥 Загружено {loaded} строк из {args.file} ({cities} уникальных городов)")
+
+        only_missing = "" if args.all else ONLY_MISSING
+        cur.execute(UPDATE_SQL.format(only_missing=only_missing))
+        updated = cur.rowcount
+        cur.execute(UNMATCHED_SQL.format(only_missing=only_missing))
+        unmatched = cur.fetchall()
+
+        if args.dry_run:
+            conn.rollback()
+            print(f"🔎 Пробный запуск: обновилось бы {updated} клиентов, изменения откатаны.")
+        else:
+            conn.commit()
+            print(f"✅ Обновлено координат: {updated} клиентов "
+                  f"({'все' if args.all else 'только без координат'}).")
+
+        if unmatched:
+            print(f"⚠️ Городов без координат: {len(unmatched)} "
+                  f"({sum(n for _, n in unmatched)} клиентов):")
+            for city, n in unmatched:
+                print(f"   - {city!r}: {n}")
+            if args.unmatched_out:
+                with open(args.unmatched_out, "w", newline="", encoding="utf-8") as f:
+                    writer = csv.writer(f)
+                    writer.writerow(["city", "latitude", "longitude"])
+                    writer.writerows([city, "", ""] for city, _ in unmatched)
+                print(f"   Список сохранён в {args.unmatched_out} — заполните и добавьте в {os.path.basename(args.file)}.")
+        cur.close()
+
+    except (Exception, psycopg2.Error) as error:
+        print(f"❌ Ошибка при работе с PostgreSQL: {error}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn is not None:
+            conn.close()
+            print("Соединение с базой данных закрыто.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Координаты клиентов из CSV одним UPDATE ... FROM.")
+    parser.add_argument("--file", default=DEFAULT_FILE,
+                        help="CSV с колонками city,latitude,longitude (по умолчанию city_coordinates.csv)")
+    parser.add_argument("--all", action="store_true",
+                        help="Перезаписать координаты у всех клиентов, а не только у тех, где они NULL")
+    parser.add_argument("--dry-run", dest="dry_run", action="store_true",
+                        help="Посчитать изменения и откатить транзакцию")
+    parser.add_argument("--unmatched-out", dest="unmatched_out", default="",
+                        help="Сохранить города без координат в CSV-шаблон для дозаполнения")
+    args = parser.parse_args()
+    geocode(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+# ingest_static.py
+"""
+Типизированная инкрементальная загрузка статического CSV-источника для сравнения "Static vs Dynamic".
+
+Раньше статический файл лежал в таблице "static file" с paymentdate типа TEXT, и дашборд делал
+CAST(paymentdate AS DATE) при каждом обновлении. Здесь CSV потоково загружается через COPY в типизированную
+таблицу classicmodels.static_payments (DATE, NUMERIC, индекс по paymentdate).
+
+Для каждого файла в classicmodels.ingest_manifest хранится размер, mtime, сколько байт и строк уже загружено
+и отпечаток загруженной части (sha256 первых и последних 64 КиБ). При повторном запуске:
+  - размер и mtime не изменились — файл пропускается;
+  - файл вырос, а загруженная часть не изменилась — догружаются только новые строки;
+  - файл переписан — его строки удаляются и он загружается заново.
+Данные и запись манифеста фиксируются в одной транзакции. Строки, которые не разбираются
+(пустые поля, неверная дата или сумма), пишутся в <файл>.rejects.csv с номером строки и причиной.
+"""
+import argparse
+import csv
+import hashlib
+import io
+import os
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+import psycopg2
+
+# --- Импортируем строку подключения из файла config.py ---
+try:
+    from config import DATABASE_URI
+except ImportError:
+    print("❌ Ошибка: Не удалось найти файл config.py или переменную DATABASE_URI.")
+    exit()
+
+SETUP_SQL = """
+CREATE TABLE IF NOT EXISTS classicmodels.static_payments (
+    customername  TEXT NOT NULL,
+    paymentdate   DATE NOT NULL,
+    amount        NUMERIC(12, 2) NOT NULL,
+    source_file   TEXT NOT NULL,
+    source_line   INTEGER NOT NULL,
+    PRIMARY KEY (source_file, source_line)
+);
+CREATE INDEX IF NOT EXISTS static_payments_paymentdate_idx ON classicmodels.static_payments (paymentdate);
+CREATE TABLE IF NOT EXISTS classicmodels.ingest_manifest (
+    source_file   TEXT PRIMARY KEY,
+    size          BIGINT NOT NULL,
+    mtime         DOUBLE PRECISION NOT NULL,
+    bytes_loaded  BIGINT NOT NULL,
+    lines_read    INTEGER NOT NULL,
+    fingerprint   TEXT NOT NULL,
+    rows_loaded   BIGINT NOT NULL,
+    rows_rejected BIGINT NOT NULL,
+    loaded_at     TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+UPSERT_MANIFEST_SQL = """
+INSERT INTO classicmodels.ingest_manifest
+    (source_file, size, mtime, bytes_loaded, lines_read, fingerprint, rows_loaded, rows_rejected, loaded_at)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, now())
+ON CONFLICT (source_file) DO UPDATE SET
+    size = EXCLUDED.size, mtime = EXCLUDED.mtime, bytes_loaded = EXCLUDED.bytes_loaded,
+    lines_read = EXCLUDED.lines_read, fingerprint = EXCLUDED.fingerprint,
+    rows_loaded = EXCLUDED.rows_loaded, rows_rejected = EXCLUDED.rows_rejected, loaded_at = now();
+"""
+
+REQUIRED_COLUMNS = ("customername", "paymentdate", "amount")
+DATE_FORMATS = ("%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%d.%m.%Y", "%m/%d/%Y")
+FINGERPRINT_BLOCK = 64 * 1024
+BATCH_ROWS = 50000
+
+
+def fingerprint(path, length):
+    """sha256 первых и последних 64 КиБ из первых `length` байт файла (плюс сама длина)."""
+    digest = hashlib.sha256(str(length).encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(min(length, FINGERPRINT_BLOCK)))
+        if length > FINGERPRINT_BLOCK:
+            f.seek(max(FINGERPRINT_BLOCK, length - FINGERPRINT_BLOCK))
+            digest.update(f.read(length - f.tell()))
+    return digest.hexdigest()
+
+
+def parse_date(value):
+    value = value.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"неверная дата {value!r}")
+
+
+def parse_amount(value):
+    try:
+        amount = Decimal(value.strip().replace(",", "").replace("$", ""))
+    except InvalidOperation:
+        raise ValueError(f"неверная сумма {value!r}")
+    if not amount.is_finite():
+        raise ValueError(f"неверная сумма {value!r}")
+    return amount
+
+
+def complete_lines(f, counter):
+    """Строки файла, заканчивающиеся переводом строки; недописанный хвост (файл ещё пишется) не читается."""
+    for raw in f:
+        if not raw.endswith(b"\n"):
+            return
+        counter[0] += len(raw)
+        yield raw.decode("utf-8-sig" if counter[0] == len(raw) else "utf-8")
+
+
+def read_header(path):
+    with open(path, "rb") as f:
+        counter = [0]
+        header = next(csv.reader(complete_lines(f, counter)), None)
+    if header is None:
+        raise ValueError("файл пуст или без заголовка")
+    columns = [h.strip().lower() for h in header]
+    missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+    if missing:
+        raise ValueError(f"в заголовке нет колонок {', '.join(missing)}")
+    return [columns.index(c) for c in REQUIRED_COLUMNS], counter[0]
+
+
+def copy_field(value):
+    """Значение -> поле текстового формата COPY."""
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def copy_batch(cur, batch):
+    if batch.tell():
+        batch.seek(0)
+        cur.copy_expert("COPY classicmodels.static_payments "
+                        "(customername, paymentdate, amount, source_file, source_line) FROM STDIN", batch)
+
+
+def ingest_range(cur, path, offset, first_line, positions, rejects):
+    """
+    Читает CSV с байта `offset` (начало строки с номером `first_line`), грузит через COPY пачками.
+    Возвращает (байт прочитано до конца последней целой строки, номер следующей строки, загружено, отклонено).
+    """
+    counter = [offset]
+    loaded = rejected = 0
+    line_no = first_line
+    batch = io.StringIO()
+    with open(path, "rb") as f:
+        f.seek(offset)
+        reader = csv.reader(complete_lines(f, counter))
+        for record in reader:
+            number, line_no = line_no, first_line + reader.line_num
+            try:
+                if len(record) <= max(positions):
+                    raise ValueError(f"ожидалось не меньше {max(positions) + 1} полей, получено {len(record)}")
+                name, raw_date, raw_amount = (record[i] for i in positions)
+                name = name.strip()
+                if not name:
+                    raise ValueError("пустое customername")
+                row = (name, parse_date(raw_date).isoformat(), str(parse_amount(raw_amount)), path, str(number))
+            except ValueError as error:
+                rejects.writerow([path, number, str(error)] + record)
+                rejected += 1
+                continue
+            batch.write("\t".join(copy_field(v) for v in row) + "\n")
+            loaded += 1
+            if loaded % BATCH_ROWS == 0:
+                copy_batch(cur, batch)
+                batch = io.StringIO()
+        copy_batch(cur, batch)
+    return counter[0], line_no, loaded, rejected
+
+
+def ingest_file(conn, path, args):
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT size, mtime, bytes_loaded, lines_read, fingerprint, rows_loaded, rows_rejected "
+                    "FROM classicmodels.ingest_manifest WHERE source_file = %s FOR UPDATE;", (path,))
+        state = cur.fetchone()
+        if state and not args.force:
+            size, mtime, bytes_loaded, lines_read, fp, rows_loaded, rows_rejected = state
+            if size == stat.st_size and mtime == stat.st_mtime:
+                conn.rollback()
+                print(f"   · {path}: не изменился, пропускаю")
+                return
+            appendable = stat.st_size >= bytes_loaded and fingerprint(path, bytes_loaded) == fp
+        else:
+            appendable = False
+
+        positions, header_bytes = read_header(path)
+        if appendable:
+            mode, offset, first_line = "догрузка", bytes_loaded, lines_read + 1
+        else:
+            mode, offset, first_line = "полная загрузка", header_bytes, 2
+            rows_loaded = rows_rejected = 0
+            cur.execute("DELETE FROM classicmodels.static_payments WHERE source_file = %s;", (path,))
+
+        reject_path = path + ".rejects.csv"
+        new_reject_file = not appendable or not os.path.exists(reject_path)
+        with open(reject_path, "w" if not appendable else "a", newline="", encoding="utf-8") as rf:
+            rejects = csv.writer(rf)
+            if new_reject_file:
+                rejects.writerow(["source_file", "line", "reason", "raw fields..."])
+            end, next_line, loaded, rejected = ingest_range(cur, path, offset, first_line, positions, rejects)
+
+        cur.execute(UPSERT_MANIFEST_SQL, (path, stat.st_size, stat.st_mtime, end, next_line - 1,
+                                          fingerprint(path, end), rows_loaded + loaded, rows_rejected + rejected))
+        conn.commit()
+        print(f"   ✅ {path}: {mode}, +{loaded} строк, отклонено {rejected}"
+              + (f" (см. {reject_path})" if rejected else ""))
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Инкрементальная типизированная загрузка статических CSV через COPY.")
+    parser.add_argument("files", nargs="+", help="CSV-файлы с колонками customername, paymentdate, amount")
+    parser.add_argument("--force", action="store_true", help="Перезагрузить файлы целиком, игнорируя манифест")
+    args = parser.parse_args()
+
+    conn = None
+    try:
+        db_uri = DATABASE_URI.replace('postgresql+psycopg2', 'postgresql')
+        print("Подключение к базе данных...")
+        conn = psycopg2.connect(db_uri)
+        cur = conn.cursor()
+        cur.execute(SETUP_SQL)
+        conn.commit()
+        cur.close()
+        for path in args.files:
+            try:
+                ingest_file(conn, path, args)
+            except (Exception, psycopg2.Error) as error:
+                print(f"❌ {path}: {error}")
+    except (Exception, psycopg2.Error) as error:
+        print(f"❌ Ошибка при работе с PostgreSQL: {error}")
+    finally:
+        if conn is not None:
+            conn.close()
+            print("Соединение с базой данных закрыто.")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@ ALTER TABLE classicmodels.customers ADD COLUMN IF NOT EXISTS latitude NUMERIC(10
 ALTER TABLE classicmodels.customers ADD COLUMN IF NOT EXISTS longitude NUMERIC(10, 6);
 
 -- Шаг 2: Обновляем строки, добавляя координаты для ВСЕХ уникальных городов
+-- (то же одним UPDATE ... FROM: python geocode.py — координаты лежат в city_coordinates.csv)
 -- Северная Америка
 UPDATE classicmodels.customers SET latitude = 40.7128,  longitude = -74.0060  WHERE city = 'NYC';
 UPDATE classicmodels.customers SET latitude = 42.3601,  longitude = -71.0589  WHERE city = 'Boston';
@@ -96,3 +97,28 @@ FROM
 WHERE
     paymentdate IS NOT NULL -- Optional: ensure only records with dates are compared
 
+
+
+-- Тот же запрос по типизированной таблице (загружается python ingest_static.py <файл.csv>):
+-- paymentdate уже DATE и проиндексирован, CAST при каждом чтении не нужен.
+SELECT
+    p.amount,
+    p.paymentdate,
+    c.customername,
+    'Dynamic File (Live DB)' AS source_type
+FROM
+    payments p
+JOIN
+    customers c ON p.customerNumber = c.customerNumber
+WHERE
+    p.paymentdate IS NOT NULL
+
+UNION ALL
+
+SELECT
+    amount,
+    paymentdate,
+    customername,
+    'Static File (CSV)' AS source_type
+FROM
+    classicmodels.static_payments;
@@ -0,0 +1,372 @@
+# rollups.py
+"""
+Управление дневными роллапами для датасета Superset "Full Sales Data".
+
+"Full Sales Data" — это виртуальный датасет без агрегации (orders ⨝ orderdetails ⨝ products ⨝ customers),
+и каждый чарт дашборда заново сканирует весь join. Здесь заводятся материализованные представления,
+сгруппированные по дню и нужным измерениям, и обновляются через REFRESH ... CONCURRENTLY (чтение не блокируется).
+
+Команды:
+  install  — создать представления и уникальные индексы (нужны для CONCURRENTLY)
+  refresh  — обновить все представления параллельно (каждое на своём соединении), --loop N — каждые N секунд
+  yaml     — выпустить копию экспорта дашборда, где чарты переведены на датасеты-роллапы
+"""
+import argparse
+import copy
+import json
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+
+try:
+    import yaml
+except ImportError:
+    print("❌ Ошибка: нужен пакет PyYAML. Установите: pip install pyyaml")
+    exit()
+
+# --- Импортируем строку подключения из файла config.py ---
+try:
+    from config import DATABASE_URI
+except ImportError:
+    DATABASE_URI = None   # нужен только командам install/refresh
+
+FULL_SALES_DATA_UUID = "d378a689-2396-4545-939c-38e04dcab681"
+DEFAULT_EXPORT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dashboard_export_20251017T131837")
+
+# Измерения датасета "Full Sales Data" и их выражения в join
+DIMENSIONS = {
+    "orderdate": ("o.orderdate", "DATE"),
+    "status": ("o.status", "STRING"),
+    "customername": ("c.customername", "STRING"),
+    "country": ("c.country", "STRING"),
+    "productline": ("p.productline", "STRING"),
+    "productname": ("p.productname", "STRING"),
+    "priceeach": ("od.priceeach", "DECIMAL"),
+}
+
+# Меры роллапа: колонка -> (выражение, тип). Все аддитивны, поэтому чарт может доагрегировать их SUM().
+MEASURES = {
+    "line_count": ("COUNT(*)", "LONGINTEGER"),
+    "quantityordered": ("SUM(od.quantityordered)", "LONGINTEGER"),
+    "revenue": ("SUM(od.priceeach * od.quantityordered)", "DECIMAL"),
+}
+
+# Метрики чартов (нормализованные) -> выражение над роллапом
+METRIC_REWRITES = {
+    "count": "SUM(line_count)",
+    "count(*)": "SUM(line_count)",
+    "sum(quantityordered)": "SUM(quantityordered)",
+    "sum(priceeach*quantityordered)": "SUM(revenue)",
+}
+
+# Роллапы: имя -> измерения. orderdate есть во всех, чтобы фильтр по времени на дашборде продолжал работать.
+ROLLUPS = {
+    "sales_product_daily": ["orderdate", "productline", "productname", "country"],
+    "sales_customer_daily": ["orderdate", "customername", "country"],
+    "sales_price_daily": ["orderdate", "productline", "priceeach"],
+}
+
+LEGACY_DIMENSION_PARAMS = ("entity", "series")
+
+JOIN_SQL = """FROM classicmodels.orders AS o
+JOIN classicmodels.orderdetails AS od ON o.ordernumber = od.ordernumber
+JOIN classicmodels.products AS p ON od.productcode = p.productcode
+JOIN classicmodels.customers AS c ON o.customernumber = c.customernumber"""
+
+
+def view_name(name):
+    return f"classicmodels.rollup_{name}"
+
+
+def create_sql(name, dims):
+    select = ",\n       ".join([f"{DIMENSIONS[d][0]} AS {d}" for d in dims] +
+                               [f"{expr} AS {col}" for col, (expr, _) in MEASURES.items()])
+    return (f"CREATE MATERIALIZED VIEW IF NOT EXISTS {view_name(name)} AS\n"
+            f"SELECT {select}\n{JOIN_SQL}\n"
+            f"GROUP BY {', '.join(str(i + 1) for i in range(len(dims)))};\n"
+            f"CREATE UNIQUE INDEX IF NOT EXISTS rollup_{name}_key ON {view_name(name)} ({', '.join(dims)});")
+
+
+def connect():
+    db_uri = DATABASE_URI.replace('postgresql+psycopg2', 'postgresql')
+    return psycopg2.connect(db_uri)
+
+
+def install(args):
+    conn = connect()
+    try:
+        cur = conn.cursor()
+        for name, dims in ROLLUPS.items():
+            start = time.time()
+            cur.execute(create_sql(name, dims))
+            conn.commit()
+            cur.execute(f"SELECT COUNT(*) FROM {view_name(name)};")
+            print(f"✅ {view_name(name)}: {cur.fetchone()[0]} строк ({time.time() - start:.2f} с)")
+        cur.close()
+    finally:
+        conn.close()
+
+
+def refresh_one(name):
+    """REFRESH ... CONCURRENTLY на отдельном соединении: читатели видят старые данные до commit."""
+    conn = connect()
+    try:
+        start = time.time()
+        cur = conn.cursor()
+        cur.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view_name(name)};")
+        conn.commit()
+        cur.close()
+        return name, time.time() - start, None
+    except (Exception, psycopg2.Error) as error:
+        conn.rollback()
+        return name, time.time() - start, error
+    finally:
+        conn.close()
+
+
+def refresh(args):
+    while True:
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            results = list(executor.map(refresh_one, ROLLUPS))
+        for name, elapsed, error in results:
+            if error:
+                print(f"❌ {view_name(name)}: {error}")
+            else:
+                print(f"   -> {view_name(name)} обновлён за {elapsed:.2f} с")
+        print(f"🔄 Обновление завершено за {time.time() - start:.2f} с")
+        if not args.loop:
+            return
+        time.sleep(args.loop)
+
+
+# --- Разбор экспорта дашборда ---
+
+def load_export(export_dir):
+    """Читает charts/*.yaml и datasets/**/*.yaml экспорта. Возвращает (charts, datasets по uuid)."""
+    charts, datasets = {}, {}
+    for root, _, files in os.walk(export_dir):
+        for fname in sorted(files):
+            if not fname.endswith(".yaml"):
+                continue
+            path = os.path.join(root, fname)
+            with open(path, encoding="utf-8") as f:
+                doc = yaml.safe_load(f)
+            rel = os.path.relpath(path, export_dir)
+            if rel.startswith("charts" + os.sep):
+                charts[rel] = doc
+            elif rel.startswith("datasets" + os.sep):
+                datasets[doc["uuid"]] = dict(doc, _path=rel)
+    return charts, datasets
+
+
+def normalize_metric(metric):
+    """Метрика чарта (имя сохранённой метрики, SQL или SIMPLE) -> нормализованная строка."""
+    if metric is None:
+        return None
+    if isinstance(metric, str):
+        expr = metric
+    elif metric.get("expressionType") == "SQL":
+        expr = metric["sqlExpression"]
+    else:
+        expr = f"{metric['aggregate']}({metric['column']['column_name']})"
+    return "".join(expr.split()).lower()
+
+
+def column_name(column):
+    return column if isinstance(column, str) else column.get("sqlExpression") or column.get("label")
+
+
+def chart_requirements(chart):
+    """
+    Что нужно чарту от датасета: измерения (groupby + фильтры), метрики, time grain, row_limit.
+    raw=True — чарт читает строки без агрегации (например, гистограмма) и роллап ему не подходит.
+    """
+    query = json.loads(chart["query_context"])["queries"][0]
+    dims = [column_name(c) for c in query.get("columns") or []]
+    # у legacy-чартов (world_map, word_cloud) измерение только в params: entity / series
+    dims += [chart["params"][k] for k in LEGACY_DIMENSION_PARAMS
+             if isinstance(chart["params"].get(k), str) and chart["params"][k] not in dims]
+    dims += [f["col"] for f in query.get("filters") or [] if f["col"] not in dims]
+    metrics = [normalize_metric(m) for m in query.get("metrics") or []]
+    metrics += [normalize_metric(o[0]) for o in query.get("orderby") or []
+                if normalize_metric(o[0]) not in metrics]
+    grain = next((c.get("timeGrain") for c in query.get("columns") or [] if isinstance(c, dict)), None)
+    return {
+        "dims": dims,
+        "metrics": metrics,
+        "grain": grain,
+        "row_limit": query.get("row_limit"),
+        "raw": not query.get("metrics"),
+    }
+
+
+def pick_rollup(req, rollups):
+    """Самый узкий роллап, покрывающий измерения чарта, если все его метрики переписываются."""
+    if req["raw"] or any(m not in METRIC_REWRITES for m in req["metrics"]):
+        return None
+    fits = [name for name, dims in rollups.items() if set(req["dims"]) <= set(dims)]
+    return min(fits, key=lambda name: len(rollups[name]), default=None)
+
+
+def rewrite_metric(metric):
+    """Переписывает метрику чарта на меры роллапа, сохраняя подпись (label)."""
+    target = METRIC_REWRITES.get(normalize_metric(metric))
+    if target is None or isinstance(metric, str):
+        # сохранённые метрики (count) переопределены в датасете-роллапе под тем же именем
+        return metric
+    label = metric.get("label") or target
+    return dict(metric, expressionType="SQL", sqlExpression=target, column=None, aggregate=None,
+                hasCustomLabel=True, label=label)
+
+
+def rewrite_chart(chart, dataset_uuid):
+    chart = copy.deepcopy(chart)
+    chart["dataset_uuid"] = dataset_uuid
+    params = chart["params"]
+    for key in ("metric", "timeseries_limit_metric"):
+        if isinstance(params.get(key), dict):
+            params[key] = rewrite_metric(params[key])
+    if params.get("metrics"):
+        params["metrics"] = [rewrite_metric(m) for m in params["metrics"]]
+    context = json.loads(chart["query_context"])
+    for query in context["queries"]:
+        if query.get("metrics"):
+            query["metrics"] = [rewrite_metric(m) for m in query["metrics"]]
+        if query.get("orderby"):
+            query["orderby"] = [[rewrite_metric(m), asc] for m, asc in query["orderby"]]
+    context["form_data"] = params
+    chart["query_context"] = json.dumps(context)
+    return chart
+
+
+def rollup_uuid(name):
+    # детерминированный uuid: повторный импорт обновляет тот же датасет, а не плодит копии
+    return str(uuid.uuid5(uuid.UUID(FULL_SALES_DATA_UUID), f"rollup_{name}"))
+
+
+def rollup_dataset(name, dims, template, cache_timeout):
+    """YAML датасета-роллапа на основе "Full Sales Data": те же колонки-измерения, метрика count = SUM(line_count)."""
+    base_columns = {c["column_name"]: c for c in template["columns"]}
+    columns = []
+    for col, kind in [(d, DIMENSIONS[d][1]) for d in dims] + [(m, t) for m, (_, t) in MEASURES.items()]:
+        column = dict(base_columns.get(col) or {"column_name": col, "verbose_name": None, "is_dttm": False,
+                                                  "is_active": True, "advanced_data_type": None, "groupby": True,
+                                                  "filterable": True, "expression": "", "description": None,
+                                                  "python_date_format": None, "extra": {}})
+        column["type"] = kind
+        columns.append(column)
+    dataset = {k: v for k, v in template.items() if not k.startswith("_")}
+    dataset.update({
+        "table_name": f"Rollup {name}",
+        "description": f"Дневной роллап Full Sales Data по {', '.join(dims)} (rollups.py)",
+        "cache_timeout": cache_timeout,
+        "sql": f"SELECT * FROM {view_name(name)}",
+        "uuid": rollup_uuid(name),
+        "metrics": [{"metric_name": "count", "verbose_name": "COUNT(*)", "metric_type": "sum",
+                     "expression": "SUM(line_count)", "description": None, "d3format": None,
+                     "currency": None, "extra": {}, "warning_text": None}],
+        "columns": columns,
+    })
+    return dataset
+
+
+def write_yaml(path, doc):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(doc, f, allow_unicode=True, sort_keys=False)
+
+
+def nested_dirs(a, b):
+    """True, если папки совпадают или одна лежит внутри другой."""
+    a, b = os.path.realpath(a), os.path.realpath(b)
+    return os.path.commonpath([a, b]) in (a, b)
+
+
+def replace_dir(tmp, target):
+    """Подменить target готовой папкой tmp; старая версия удаляется только после подмены."""
+    if os.path.exists(target):
+        old = os.path.realpath(target) + ".old"
+        if os.path.exists(old):
+            shutil.rmtree(old)
+        os.replace(target, old)
+        os.replace(tmp, target)
+        shutil.rmtree(old)
+    else:
+        os.replace(tmp, target)
+
+
+def emit_yaml(args):
+    charts, datasets = load_export(args.export_dir)
+    template = datasets[FULL_SALES_DATA_UUID]
+    # собираем во временной папке и подменяем --out-dir только в конце: ошибка не оставит полупустой экспорт
+    tmp = os.path.realpath(args.out_dir) + ".tmp"
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    shutil.copytree(args.export_dir, tmp)
+
+    used = set()
+    for rel, chart in charts.items():
+        if chart.get("dataset_uuid") != FULL_SALES_DATA_UUID:
+            continue
+        req = chart_requirements(chart)
+        name = pick_rollup(req, ROLLUPS)
+        if name is None:
+            print(f"   · {chart['slice_name']}: остаётся на Full Sales Data "
+                  f"({'строки без агрегации' if req['raw'] else 'метрика не аддитивна'})")
+            continue
+        used.add(name)
+        write_yaml(os.path.join(tmp, rel), rewrite_chart(chart, rollup_uuid(name)))
+        print(f"   ✅ {chart['slice_name']} -> {view_name(name)}")
+
+    dataset_dir = os.path.dirname(template["_path"])
+    for name in sorted(used):
+        write_yaml(os.path.join(tmp, dataset_dir, f"Rollup_{name}.yaml"),
+                   rollup_dataset(name, ROLLUPS[name], template, args.cache_timeout))
+    replace_dir(tmp, args.out_dir)
+    print(f"\n📦 Экспорт с роллапами: {args.out_dir} (датасетов-роллапов: {len(used)}). "
+          f"Упакуйте папку в zip и импортируйте в Superset.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Дневные роллапы для датасета Full Sales Data.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("install", help="Создать материализованные представления и уникальные индексы")
+    refresh_p = sub.add_parser("refresh", help="REFRESH MATERIALIZED VIEW CONCURRENTLY для всех роллапов")
+    refresh_p.add_argument("--workers", type=int, default=len(ROLLUPS),
+                           help=f"Сколько представлений обновлять параллельно (по умолчанию {len(ROLLUPS)})")
+    refresh_p.add_argument("--loop", type=float, default=0, help="Повторять каждые N секунд (по умолчанию один раз)")
+    yaml_p = sub.add_parser("yaml", help="Выпустить экспорт дашборда, переведённый на роллапы")
+    yaml_p.add_argument("--export-dir", dest="export_dir", default=DEFAULT_EXPORT,
+                        help="Папка экспорта дашборда (по умолчанию экспорт из репозитория)")
+    yaml_p.add_argument("--out-dir", dest="out_dir", default="dashboard_export_rollups",
+                        help="Куда записать переписанный экспорт (по умолчанию dashboard_export_rollups)")
+    yaml_p.add_argument("--cache-timeout", dest="cache_timeout", type=int, default=300,
+                        help="cache_timeout датасетов-роллапов в секундах, ~ интервал refresh (по умолчанию 300)")
+    args = parser.parse_args()
+    if args.command == "yaml" and nested_dirs(args.out_dir, args.export_dir):
+        parser.error("--out-dir не может совпадать с --export-dir, содержать его или лежать внутри него")
+
+    if args.command == "yaml":
+        emit_yaml(args)
+        return
+    if DATABASE_URI is None:
+        print("❌ Ошибка: Не удалось найти файл config.py или переменную DATABASE_URI.")
+        exit()
+    try:
+        if args.command == "install":
+            install(args)
+        else:
+            refresh(args)
+    except KeyboardInterrupt:
+        pass
+    except (Exception, psycopg2.Error) as error:
+        print(f"❌ Ошибка при работе с PostgreSQL: {error}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,9 @@
 # data_inserter.py
+import argparse
 import psycopg2
+import psycopg2.errors
+import psycopg2.extras
+import threading
 import time
 import random
 from datetime import date, timedelta
@@ -13,6 +17,70 @@ except ImportError:
     print("Пожалуйста, убедитесь, что файл config.py находится в той же папке и содержит: DATABASE_URI = '...'")
     exit()
 
+def insert_order(cur, new_order_number, customer_numbers, product_codes, verbose=False):
+    """
+    Вставляет один заказ, его детали и платёж на переданном курсоре (без commit).
+    """
+    # --- Генерируем данные для нового заказа (таблица orders) ---
+    random_customer = random.choice(customer_numbers)
+    order_date = date.today()
+    required_date = order_date + timedelta(days=random.randint(7, 21))
+    order_status = random.choice(['In Process', 'On Hold', 'Shipped']) # Добавим немного разнообразия в статусы
+
+    # --- Вставляем новый заказ в таблицу `orders` ---
+    order_query = """
+    INSERT INTO classicmodels.orders (orderNumber, orderDate, requiredDate, status, customerNumber)
+    VALUES (%s, %s, %s, %s, %s);
+    """
+    cur.execute(order_query, (new_order_number, order_date, required_date, order_status, random_customer))
+    if verbose:
+        print(f"✅ Создан новый заказ #{new_order_number} для клиента #{random_customer} со статусом '{order_status}'.")
+
+    # --- Генерируем и вставляем детали заказа в `orderdetails` одним запросом ---
+    total_order_amount = 0
+    products_in_order = random.sample(product_codes, k=random.randint(1, 4)) # Уникальные товары в заказе
+    details = []
+    for i, product_code in enumerate(products_in_order):
+        quantity_ordered = random.randint(10, 50)
+        price_each = round(random.uniform(20.0, 250.0), 2)
+        order_line_number = i + 1
+        total_order_amount += quantity_ordered * price_each
+        details.append((new_order_number, product_code, quantity_ordered, price_each, order_line_number))
+
+    details_query = """
+    INSERT INTO classicmodels.orderdetails (orderNumber, productCode, quantityOrdered, priceEach, orderLineNumber)
+    VALUES %s;
+    """
+    psycopg2.extras.execute_values(cur, details_query, details)
+    if verbose:
+        for _, product_code, quantity_ordered, _, _ in details:
+            print(f"   - Добавлен товар {product_code} (x{quantity_ordered}) в заказ.")
+
+    # --- Генерируем и вставляем платеж в `payments` ---
+    check_number = f"PY{random.randint(100000, 999999)}"
+    payment_date = order_date + timedelta(days=random.randint(0, 3))
+    # Сделаем сумму платежа более реалистичной - часть от суммы заказа
+    amount = round(total_order_amount * random.uniform(0.8, 1.1), 2)
+
+    payment_query = """
+    INSERT INTO classicmodels.payments (customerNumber, checkNumber, paymentDate, amount)
+    VALUES (%s, %s, %s, %s);
+    """
+    cur.execute(payment_query, (random_customer, check_number, payment_date, amount))
+    if verbose:
+        print(f"✅ Добавлен платеж {check_number} на сумму ${amount:.2f} от клиента #{random_customer}.")
+
+
+def fetch_ids(cur):
+    """Существующие ключи клиентов и товаров, чтобы не нарушить внешние ключи (FK)."""
+    cur.execute("SELECT customerNumber FROM classicmodels.customers;")
+    customer_numbers = [row[0] for row in cur.fetchall()]
+
+    cur.execute("SELECT productCode FROM classicmodels.products;")
+    product_codes = [row[0] for row in cur.fetchall()]
+    return customer_numbers, product_codes
+
+
 def add_new_order():
     """
     Основная функция для добавления нового заказа, его деталей и платежа.
@@ -29,58 +97,12 @@ def add_new_order():
         cur = conn.cursor()
 
         # --- Получаем существующие данные, чтобы не нарушить внешние ключи (FK) ---
-        cur.execute("SELECT customerNumber FROM classicmodels.customers;")
-        customer_numbers = [row[0] for row in cur.fetchall()]
-
-        cur.execute("SELECT productCode FROM classicmodels.products;")
-        product_codes = [row[0] for row in cur.fetchall()]
+        customer_numbers, product_codes = fetch_ids(cur)
 
         cur.execute("SELECT MAX(orderNumber) FROM classicmodels.orders;")
         new_order_number = cur.fetchone()[0] + 1
 
-        # --- Генерируем данные для нового заказа (таблица orders) ---
-        random_customer = random.choice(customer_numbers)
-        order_date = date.today()
-        required_date = order_date + timedelta(days=random.randint(7, 21))
-        order_status = random.choice(['In Process', 'On Hold', 'Shipped']) # Добавим немного разнообразия в статусы
-
-        # --- Вставляем новый заказ в таблицу `orders` ---
-        order_query = """
-        INSERT INTO classicmodels.orders (orderNumber, orderDate, requiredDate, status, customerNumber)
-        VALUES (%s, %s, %s, %s, %s);
-        """
-        cur.execute(order_query, (new_order_number, order_date, required_date, order_status, random_customer))
-        print(f"✅ Создан новый заказ #{new_order_number} для клиента #{random_customer} со статусом '{order_status}'.")
-
-        # --- Генерируем и вставляем детали заказа в `orderdetails` ---
-        total_order_amount = 0
-        products_in_order = random.sample(product_codes, k=random.randint(1, 4)) # Уникальные товары в заказе
-        
-        for i, product_code in enumerate(products_in_order):
-            quantity_ordered = random.randint(10, 50)
-            price_each = round(random.uniform(20.0, 250.0), 2)
-            order_line_number = i + 1
-            total_order_amount += quantity_ordered * price_each
-
-            details_query = """
-            INSERT INTO classicmodels.orderdetails (orderNumber, productCode, quantityOrdered, priceEach, orderLineNumber)
-            VALUES (%s, %s, %s, %s, %s);
-            """
-            cur.execute(details_query, (new_order_number, product_code, quantity_ordered, price_each, order_line_number))
-            print(f"   - Добавлен товар {product_code} (x{quantity_ordered}) в заказ.")
-
-        # --- Генерируем и вставляем платеж в `payments` ---
-        check_number = f"PY{random.randint(100000, 999999)}"
-        payment_date = order_date + timedelta(days=random.randint(0, 3))
-        # Сделаем сумму платежа более реалистичной - часть от суммы заказа
-        amount = round(total_order_amount * random.uniform(0.8, 1.1), 2) 
-
-        payment_query = """
-        INSERT INTO classicmodels.payments (customerNumber, checkNumber, paymentDate, amount)
-        VALUES (%s, %s, %s, %s);
-        """
-        cur.execute(payment_query, (random_customer, check_number, payment_date, amount))
-        print(f"✅ Добавлен платеж {check_number} на сумму ${amount:.2f} от клиента #{random_customer}.")
+        insert_order(cur, new_order_number, customer_numbers, product_codes, verbose=True)
 
         # --- Фиксируем все изменения в базе данных ---
         conn.commit()
@@ -99,7 +121,170 @@ def add_new_order():
             print("Соединение с базой данных закрыто.\n")
 
 
+# --- Режим нагрузочного генератора ---
+
+class IdCache:
+    """Кэш ключей клиентов/товаров, общий для всех писателей; обновляется раз в refresh_interval секунд."""
+
+    def __init__(self, refresh_interval):
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self.loaded_at = 0.0
+        self.customer_numbers = []
+        self.product_codes = []
+
+    def get(self, cur):
+        with self.lock:
+            if time.monotonic() - self.loaded_at > self.refresh_interval:
+                self.customer_numbers, self.product_codes = fetch_ids(cur)
+                cur.connection.commit()
+                self.loaded_at = time.monotonic()
+            return self.customer_numbers, self.product_codes
+
+
+class OrderNumbers:
+    """Выдаёт номера заказов без обращения к MAX(orderNumber) на каждый заказ."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next_number = None
+
+    def sync(self, cur):
+        with self.lock:
+            cur.execute("SELECT COALESCE(MAX(orderNumber), 0) FROM classicmodels.orders;")
+            self.next_number = max(self.next_number or 0, cur.fetchone()[0] + 1)
+            cur.connection.commit()
+
+    def take(self):
+        with self.lock:
+            number = self.next_number
+            self.next_number += 1
+            return number
+
+
+class Pacer:
+    """Общее расписание для всех писателей: k-я транзакция стартует не раньше start + k / rate."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def wait(self, stop):
+        with self.lock:
+            slot = self.next_slot
+            self.next_slot += self.interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            stop.wait(delay)
+
+
+def is_order_number_conflict(error):
+    """UniqueViolation по первичному ключу orders (а не по payments или orderdetails)."""
+    # у секционированной таблицы (partitions.py) в diag приходит имя секции: orders_p2024_05, orders_default
+    table = error.diag.table_name or ""
+    return table == "orders" or table.startswith("orders_")
+
+
+def writer(db_uri, ids, numbers, pacer, stop, latencies, errors):
+    """Один писатель: постоянное соединение, одна транзакция на заказ."""
+    conn = psycopg2.connect(db_uri)
+    cur = conn.cursor()
+    try:
+        while not stop.is_set():
+            pacer.wait(stop)
+            if stop.is_set():
+                break
+            try:
+                customer_numbers, product_codes = ids.get(cur)
+                start = time.perf_counter()
+                insert_order(cur, numbers.take(), customer_numbers, product_codes)
+                conn.commit()
+                latencies.append(time.perf_counter() - start)
+            except psycopg2.errors.UniqueViolation as error:
+                conn.rollback()
+                if is_order_number_conflict(error):
+                    # номер занят другим источником заказов — пересинхронизируемся
+                    numbers.sync(cur)
+                    errors.append("duplicate ordernumber")
+                else:
+                    # например, совпавший checkNumber в payments — номера заказов тут ни при чём
+                    errors.append(str(error))
+            except (Exception, psycopg2.Error) as error:
+                conn.rollback()
+                errors.append(str(error))
+    finally:
+        cur.close()
+        conn.close()
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[k]
+
+
+def run_load(args):
+    """
+    Нагрузочный режим: N писателей на постоянных соединениях держат целевой темп
+    заказов в секунду, в конце печатаются p50/p95/p99 задержки транзакции и фактический темп.
+    """
+    db_uri = DATABASE_URI.replace('postgresql+psycopg2', 'postgresql')
+    conn = psycopg2.connect(db_uri)
+    numbers = OrderNumbers()
+    numbers.sync(conn.cursor())
+    conn.close()
+
+    ids = IdCache(args.refresh_interval)
+    pacer = Pacer(args.rate)
+    stop = threading.Event()
+    latencies, errors = [], []   # list.append потокобезопасен
+    threads = [threading.Thread(target=writer, args=(db_uri, ids, numbers, pacer, stop, latencies, errors), daemon=True)
+               for _ in range(args.writers)]
+
+    print(f"🚀 Нагрузка: {args.rate} заказов/с, писателей: {args.writers}, длительность: "
+          f"{args.duration or '∞'} с. Нажмите Ctrl+C для остановки.")
+    start = time.monotonic()
+    for t in threads:
+        t.start()
+    try:
+        while not stop.is_set():
+            if args.duration and time.monotonic() - start >= args.duration:
+                break
+            time.sleep(min(5.0, args.duration or 5.0))
+            elapsed = time.monotonic() - start
+            print(f"   {elapsed:7.1f} с: {len(latencies)} заказов ({len(latencies) / elapsed:.1f}/с), ошибок: {len(errors)}")
+    except KeyboardInterrupt:
+        pass
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - start
+
+    done = sorted(latencies)
+    print(f"\n✅ Заказов: {len(done)} за {elapsed:.1f} с — {len(done) / elapsed:.2f} заказов/с "
+          f"(цель {args.rate}/с), ошибок: {len(errors)}")
+    print(f"   Задержка транзакции: p50 {percentile(done, 50) * 1000:.1f} мс, "
+          f"p95 {percentile(done, 95) * 1000:.1f} мс, p99 {percentile(done, 99) * 1000:.1f} мс")
+    if errors:
+        print(f"   Пример ошибки: {errors[0]}")
+
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Добавление новых заказов: по одному или в нагрузочном режиме.")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="Нагрузочный режим: целевое число заказов в секунду (по умолчанию выключен)")
+    parser.add_argument("--writers", type=int, default=4, help="Число параллельных писателей (по умолчанию 4)")
+    parser.add_argument("--duration", type=float, default=60,
+                        help="Длительность нагрузки в секундах, 0 — до Ctrl+C (по умолчанию 60)")
+    parser.add_argument("--refresh-interval", dest="refresh_interval", type=float, default=60,
+                        help="Как часто обновлять кэш ключей клиентов/товаров, с (по умолчанию 60)")
+    args = parser.parse_args()
+    if args.rate > 0:
+        run_load(args)
+        exit()
+
     print("🚀 Скрипт для автоматического добавления данных запущен.")
     print("Нажмите Ctrl+C для остановки.")
     while True:
@@ -0,0 +1,248 @@
+"""
+EXPLAIN-driven index advisor for the report queries (main.py --advise).
+
+For every query it reads the JSON plan and looks for
+  - sequential scans of large tables that apply a Filter (candidate: index on the filtered columns),
+  - hash/merge joins whose condition hits a large, sequentially scanned table (candidate: index on
+    the join column of that side),
+plus a short list of columns the reports are known to filter or join on. Candidates whose leading
+column is already indexed are dropped.
+
+Each remaining candidate is then tried out:
+  - temporary (default): CREATE INDEX inside a transaction, re-plan and time the affected queries,
+    ROLLBACK. Gives real plan cost and measured latency, but holds a SHARE lock on the table
+    (blocks writes) while the index exists, so run it off-peak.
+  - hypothetical (--hypothetical, needs the hypopg extension): hypopg_create_index(), plan cost only,
+    no locks and no build time.
+
+Candidates that lower the plan cost of any query by at least --advise-min-gain are recommended;
+the whole recommended set is applied together for the final before/after report, and
+--emit-ddl writes CREATE INDEX CONCURRENTLY statements for them.
+"""
+
+import re
+import statistics
+import time
+
+# (table, columns) the reports filter or join on; tried even when the current plan hides them
+KNOWN_CANDIDATES = [
+    ("orders", ("orderdate",)),
+    ("orders", ("customernumber",)),
+    ("orderdetails", ("productcode",)),
+    ("customers", ("salesrepemployeenumber",)),
+    ("payments", ("customernumber",)),
+    ("products", ("quantityinstock",)),
+]
+
+JOIN_TYPES = {"Hash Join", "Merge Join", "Nested Loop"}
+COND_KEYS = ("Hash Cond", "Merge Cond", "Join Filter")
+IDENT_RE = re.compile(r"\b(?:([a-z_][a-z0-9_]*)\.)?([a-z_][a-z0-9_]*)\b")
+
+TABLE_COLUMNS_SQL = (
+    "SELECT c.relname, a.attname, c.reltuples::bigint\n"
+    "FROM pg_class c\n"
+    "JOIN pg_namespace n ON n.oid = c.relnamespace\n"
+    "JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped\n"
+    "WHERE n.nspname = 'classicmodels' AND c.relkind IN ('r', 'p');"
+)
+
+# leading column of every existing index
+INDEXED_SQL = (
+    "SELECT c.relname, a.attname\n"
+    "FROM pg_index i\n"
+    "JOIN pg_class c ON c.oid = i.indrelid\n"
+    "JOIN pg_namespace n ON n.oid = c.relnamespace\n"
+    "JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum = i.indkey[0]\n"
+    "WHERE n.nspname = 'classicmodels';"
+)
+
+
+def index_name(table, columns):
+    return f"advise_{table}_{'_'.join(columns)}_idx"
+
+
+def index_ddl(table, columns, concurrently=False):
+    return (f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {index_name(table, columns)} "
+            f"ON classicmodels.{table} ({', '.join(columns)});")
+
+
+def walk(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from walk(child)
+
+
+def explain(cur, sql):
+    cur.execute("EXPLAIN (FORMAT JSON) " + sql)
+    return cur.fetchone()[0][0]["Plan"]
+
+
+def time_query(cur, sql, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        cur.execute(sql)
+        cur.fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def plan_candidates(plan, columns, min_rows):
+    """(table, columns) candidates from seq scans with filters and joins on large seq-scanned tables."""
+    found = set()
+    aliases = {}
+    seq_scanned = set()
+    for node in walk(plan):
+        table = node.get("Relation Name")
+        if table:
+            aliases[node.get("Alias", table)] = table
+        if node.get("Node Type") == "Seq Scan" and table in columns:
+            rows, cols = columns[table]
+            if rows < min_rows:
+                continue
+            seq_scanned.add(table)
+            filt = node.get("Filter", "")
+            filtered = [c for _, c in IDENT_RE.findall(filt) if c in cols]
+            if filtered:
+                found.add((table, tuple(dict.fromkeys(filtered))))
+    for node in walk(plan):
+        if node.get("Node Type") not in JOIN_TYPES:
+            continue
+        for key in COND_KEYS:
+            for alias, col in IDENT_RE.findall(node.get(key, "")):
+                table = aliases.get(alias)
+                if table in seq_scanned and col in columns[table][1]:
+                    found.add((table, (col,)))
+    return found
+
+
+class HypotheticalIndexes:
+    def __init__(self, cur):
+        self.cur = cur
+
+    def __enter__(self):
+        return self
+
+    def create(self, table, columns):
+        self.cur.execute("SELECT * FROM hypopg_create_index(%s);", (index_ddl(table, columns),))
+
+    def __exit__(self, *exc):
+        self.cur.execute("SELECT hypopg_reset();")
+
+
+class TemporaryIndexes:
+    """Real indexes that only live until the surrounding transaction is rolled back."""
+
+    def __init__(self, cur):
+        self.cur = cur
+
+    def __enter__(self):
+        return self
+
+    def create(self, table, columns):
+        self.cur.execute(index_ddl(table, columns))
+
+    def __exit__(self, *exc):
+        self.cur.connection.rollback()
+
+
+def measure(cur, queries, runs, timed):
+    out = {}
+    for key, sql in queries:
+        plan = explain(cur, sql)
+        out[key] = {"cost": plan["Total Cost"], "ms": time_query(cur, sql, runs) if timed else None}
+    return out
+
+
+def print_rows(headers, rows):
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) for i, h in enumerate(headers)]
+    fmt = "  ".join("{:%d}" % w for w in widths)
+    print(fmt.format(*headers))
+    print("  ".join("-" * w for w in widths))
+    for r in rows:
+        print(fmt.format(*[str(v) for v in r]))
+
+
+def advise(conn, queries, args):
+    """Find, test and report candidate indexes for `queries`; returns the recommended DDL list."""
+    cur = conn.cursor()
+    cur.execute(TABLE_COLUMNS_SQL)
+    columns = {}
+    for table, col, rows in cur.fetchall():
+        columns.setdefault(table, [rows, set()])[1].add(col)
+    cur.execute(INDEXED_SQL)
+    indexed = set(cur.fetchall())
+
+    hypothetical = args.hypothetical
+    if hypothetical:
+        cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'hypopg';")
+        if not cur.fetchone():
+            raise RuntimeError("--hypothetical needs the hypopg extension (CREATE EXTENSION hypopg)")
+    indexes = HypotheticalIndexes if hypothetical else TemporaryIndexes
+    timed = not hypothetical
+    conn.rollback()
+
+    # baseline plans and candidates
+    baseline = measure(cur, queries, args.advise_runs, timed)
+    conn.rollback()
+    candidates = {}
+    for key, sql in queries:
+        for cand in plan_candidates(explain(cur, sql), columns, args.advise_min_rows):
+            candidates.setdefault(cand, set()).add(key)
+    for table, cols in KNOWN_CANDIDATES:
+        if table in columns and columns[table][0] >= args.advise_min_rows:
+            candidates.setdefault((table, cols), set())
+    conn.rollback()
+    candidates = {c: keys for c, keys in candidates.items() if (c[0], c[1][0]) not in indexed}
+    print(f"\nIndex advisor: {len(candidates)} candidate(s), "
+          f"{'hypothetical (hypopg)' if hypothetical else 'temporary'} indexes")
+
+    # try each candidate on its own against every query touching the table
+    gains = []
+    for (table, cols), hinted_by in sorted(candidates.items()):
+        affected = [(k, s) for k, s in queries if re.search(rf"\bclassicmodels\.{table}\b", s)]
+        with indexes(cur) as idx:
+            idx.create(table, cols)
+            after = measure(cur, affected, args.advise_runs, timed)
+        best = min((after[k]["cost"] / baseline[k]["cost"] if baseline[k]["cost"] else 1.0, k)
+                   for k, _ in affected) if affected else (1.0, "-")
+        gains.append(((table, cols), 1 - best[0], best[1], sorted(hinted_by)))
+
+    rows = [(f"{t}({', '.join(c)})", f"{g:.1%}", k, ", ".join(h) or "known column")
+            for (t, c), g, k, h in sorted(gains, key=lambda x: -x[1])]
+    if rows:
+        print_rows(["candidate", "best cost gain", "on query", "suggested by plan of"], rows)
+    recommended = [cand for cand, gain, _, _ in gains if gain >= args.advise_min_gain]
+
+    # all recommended indexes together: final before/after per query
+    if recommended:
+        with indexes(cur) as idx:
+            for table, cols in recommended:
+                idx.create(table, cols)
+            final = measure(cur, queries, args.advise_runs, timed)
+        print(f"\nWith the {len(recommended)} recommended index(es):")
+        report = []
+        for key, _ in queries:
+            b, a = baseline[key], final[key]
+            report.append((key, f"{b['cost']:.0f}", f"{a['cost']:.0f}",
+                           f"{b['ms']:.1f}" if b["ms"] is not None else "-",
+                           f"{a['ms']:.1f}" if a["ms"] is not None else "-"))
+        print_rows(["query", "cost before", "cost after", "ms before", "ms after"], report)
+    else:
+        print("\nNo candidate lowers any plan cost by "
+              f"{args.advise_min_gain:.0%} or more; current indexes look sufficient.")
+    conn.rollback()
+    cur.close()
+
+    ddl = [index_ddl(t, c, concurrently=True) for t, c in recommended]
+    if ddl:
+        print("\nRecommended DDL:")
+        for stmt in ddl:
+            print("  " + stmt)
+    if args.emit_ddl:
+        with open(args.emit_ddl, "w", encoding="utf-8") as f:
+            f.write("-- generated by main.py --advise\n")
+            for stmt in ddl:
+                f.write(stmt + "\n")
+        print(f"Saved DDL -> {args.emit_ddl}")
+    return ddl
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Incrementally maintained summary tables for the most requested aggregates:
+
+  classicmodels.agg_revenue_by_country   country -> revenue, order lines   (query 1)
+  classicmodels.agg_revenue_by_month     month   -> revenue, orders, order lines
+  classicmodels.agg_customer_totals      customer -> orders, revenue, payments
+
+Statement-level AFTER INSERT triggers on orders, orderdetails and payments append the keys of every new row
+to a pending table (agg_pending_orders, agg_pending_lines, agg_pending_payments). The pending rows commit
+together with the rows they point to, so `refresh` drains exactly the committed inserts with
+DELETE ... RETURNING, whatever order their numbers were handed out in, and folds them in with additive
+upserts. Its cost grows with the number of new rows rather than with the whole history; inserts still in
+flight stay pending for the next refresh.
+
+Commands:
+  install   create the summary and pending tables and the triggers, then run a full build
+  refresh   fold in the pending rows (--loop N repeats every N seconds)
+  rebuild   truncate and recompute everything from scratch
+  check     compare the summary tables with the from-scratch queries (minus the rows still pending)
+
+Note: only inserts are captured; updated or deleted orders, lines and payments are picked up by `rebuild`
+(and are reported by `check`).
+"""
+
+import argparse
+import sys
+import time
+
+try:
+    import psycopg2
+except Exception as e:
+    print("Missing dependency 'psycopg2'. Install with: pip install psycopg2-binary", file=sys.stderr)
+    raise
+
+from main import add_connection_args, connection_info
+
+INSTALL_SQL = """
+CREATE TABLE IF NOT EXISTS classicmodels.agg_refresh (
+    name         TEXT PRIMARY KEY,
+    refreshed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+INSERT INTO classicmodels.agg_refresh (name) VALUES ('summary') ON CONFLICT (name) DO NOTHING;
+
+CREATE TABLE IF NOT EXISTS classicmodels.agg_pending_orders (
+    ordernumber INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS classicmodels.agg_pending_lines (
+    ordernumber INTEGER NOT NULL,
+    productcode VARCHAR(15) NOT NULL
+);
+CREATE TABLE IF NOT EXISTS classicmodels.agg_pending_payments (
+    customernumber INTEGER NOT NULL,
+    checknumber    VARCHAR(50) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS classicmodels.agg_revenue_by_country (
+    country     VARCHAR(50) PRIMARY KEY,
+    revenue     NUMERIC NOT NULL,
+    order_lines BIGINT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS classicmodels.agg_revenue_by_month (
+    month       DATE PRIMARY KEY,
+    revenue     NUMERIC NOT NULL,
+    orders      BIGINT NOT NULL,
+    order_lines BIGINT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS classicmodels.agg_customer_totals (
+    customernumber INTEGER PRIMARY KEY,
+    orders         BIGINT NOT NULL,
+    revenue        NUMERIC NOT NULL,
+    payments       NUMERIC NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION classicmodels.agg_enqueue() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'orders' THEN
+        INSERT INTO classicmodels.agg_pending_orders SELECT ordernumber FROM new_rows;
+    ELSIF TG_TABLE_NAME = 'orderdetails' THEN
+        INSERT INTO classicmodels.agg_pending_lines SELECT ordernumber, productcode FROM new_rows;
+    ELSE
+        INSERT INTO classicmodels.agg_pending_payments SELECT customernumber, checknumber FROM new_rows;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+"""
+
+TABLES = ("orders", "orderdetails", "payments")
+AGG_TABLES = ["agg_revenue_by_country", "agg_revenue_by_month", "agg_customer_totals"]
+PENDING_TABLES = ["agg_pending_orders", "agg_pending_lines", "agg_pending_payments"]
+
+# The keys to fold, one temp table per source; `refresh` fills them by draining the pending tables,
+# `rebuild` with every key.
+NEW_KEYS_SQL = """
+CREATE TEMP TABLE agg_new_orders (ordernumber INTEGER) ON COMMIT DROP;
+CREATE TEMP TABLE agg_new_lines (ordernumber INTEGER, productcode VARCHAR(15)) ON COMMIT DROP;
+CREATE TEMP TABLE agg_new_payments (customernumber INTEGER, checknumber VARCHAR(50)) ON COMMIT DROP;
+"""
+
+DRAIN_SQL = """
+WITH d AS (DELETE FROM classicmodels.agg_pending_orders RETURNING ordernumber)
+INSERT INTO agg_new_orders SELECT DISTINCT ordernumber FROM d;
+WITH d AS (DELETE FROM classicmodels.agg_pending_lines RETURNING ordernumber, productcode)
+INSERT INTO agg_new_lines SELECT DISTINCT ordernumber, productcode FROM d;
+WITH d AS (DELETE FROM classicmodels.agg_pending_payments RETURNING customernumber, checknumber)
+INSERT INTO agg_new_payments SELECT DISTINCT customernumber, checknumber FROM d;
+"""
+
+ALL_KEYS_SQL = """
+INSERT INTO agg_new_orders SELECT ordernumber FROM classicmodels.orders;
+INSERT INTO agg_new_lines SELECT ordernumber, productcode FROM classicmodels.orderdetails;
+INSERT INTO agg_new_payments SELECT customernumber, checknumber FROM classicmodels.payments;
+"""
+
+# Values are read from the base tables at fold time, so a key queued twice or a row deleted before the
+# refresh cannot be counted wrongly. Lines and orders are folded separately: a line added to an order
+# folded by an earlier refresh only adds revenue and a line.
+FOLD_SQL = """
+CREATE TEMP TABLE agg_fold_lines ON COMMIT DROP AS
+SELECT o.orderdate, o.customernumber, c.country, od.quantityordered * od.priceeach AS line_total
+FROM agg_new_lines n
+JOIN classicmodels.orderdetails od ON od.ordernumber = n.ordernumber AND od.productcode = n.productcode
+JOIN classicmodels.orders o ON o.ordernumber = od.ordernumber
+JOIN classicmodels.customers c ON c.customernumber = o.customernumber;
+
+CREATE TEMP TABLE agg_fold_orders ON COMMIT DROP AS
+SELECT o.orderdate, o.customernumber
+FROM agg_new_orders n
+JOIN classicmodels.orders o ON o.ordernumber = n.ordernumber
+JOIN classicmodels.customers c ON c.customernumber = o.customernumber;
+
+INSERT INTO classicmodels.agg_revenue_by_country AS a (country, revenue, order_lines)
+SELECT country, SUM(line_total), COUNT(*)
+FROM agg_fold_lines
+GROUP BY country
+ON CONFLICT (country) DO UPDATE
+SET revenue = a.revenue + EXCLUDED.revenue,
+    order_lines = a.order_lines + EXCLUDED.order_lines;
+
+INSERT INTO classicmodels.agg_revenue_by_month AS a (month, revenue, orders, order_lines)
+SELECT date_trunc('month', orderdate)::date, SUM(revenue), SUM(orders), SUM(order_lines)
+FROM (SELECT orderdate, line_total AS revenue, 0 AS orders, 1 AS order_lines FROM agg_fold_lines
+      UNION ALL
+      SELECT orderdate, 0, 1, 0 FROM agg_fold_orders) f
+GROUP BY 1
+ON CONFLICT (month) DO UPDATE
+SET revenue = a.revenue + EXCLUDED.revenue,
+    orders = a.orders + EXCLUDED.orders,
+    order_lines = a.order_lines + EXCLUDED.order_lines;
+
+INSERT INTO classicmodels.agg_customer_totals AS a (customernumber, orders, revenue, payments)
+SELECT customernumber, SUM(orders), SUM(revenue), 0
+FROM (SELECT customernumber, line_total AS revenue, 0 AS orders FROM agg_fold_lines
+      UNION ALL
+      SELECT customernumber, 0, 1 FROM agg_fold_orders) f
+GROUP BY customernumber
+ON CONFLICT (customernumber) DO UPDATE
+SET orders = a.orders + EXCLUDED.orders,
+    revenue = a.revenue + EXCLUDED.revenue;
+
+INSERT INTO classicmodels.agg_customer_totals AS a (customernumber, orders, revenue, payments)
+SELECT p.customernumber, 0, 0, SUM(p.amount)
+FROM agg_new_payments n
+JOIN classicmodels.payments p ON p.customernumber = n.customernumber AND p.checknumber = n.checknumber
+GROUP BY p.customernumber
+ON CONFLICT (customernumber) DO UPDATE
+SET payments = a.payments + EXCLUDED.payments;
+"""
+
+# The rows the summary tables should contain: everything in the base tables except the keys still pending.
+FOLDED_CTE = (
+    "WITH lines AS (\n"
+    "  SELECT o.orderdate, o.customernumber, c.country, od.quantityordered * od.priceeach AS line_total\n"
+    "  FROM classicmodels.orderdetails od\n"
+    "  JOIN classicmodels.orders o ON od.ordernumber = o.ordernumber\n"
+    "  JOIN classicmodels.customers c ON o.customernumber = c.customernumber\n"
+    "  WHERE NOT EXISTS (SELECT 1 FROM classicmodels.agg_pending_lines p\n"
+    "                    WHERE p.ordernumber = od.ordernumber AND p.productcode = od.productcode)\n"
+    "), orders AS (\n"
+    "  SELECT o.orderdate, o.customernumber\n"
+    "  FROM classicmodels.orders o\n"
+    "  JOIN classicmodels.customers c ON c.customernumber = o.customernumber\n"
+    "  WHERE NOT EXISTS (SELECT 1 FROM classicmodels.agg_pending_orders p WHERE p.ordernumber = o.ordernumber)\n"
+    "), pays AS (\n"
+    "  SELECT pm.customernumber, pm.amount\n"
+    "  FROM classicmodels.payments pm\n"
+    "  WHERE NOT EXISTS (SELECT 1 FROM classicmodels.agg_pending_payments p\n"
+    "                    WHERE p.customernumber = pm.customernumber AND p.checknumber = pm.checknumber)\n"
+    ")"
+)
+
+# From-scratch versions of the three aggregates over the folded rows; `check` diffs them against the
+# summary tables and returns the keys that disagree.
+CHECK_QUERIES = [
+    ("agg_revenue_by_country",
+     FOLDED_CTE + ", fresh AS (\n"
+     "  SELECT country, SUM(line_total) AS revenue, COUNT(*) AS order_lines\n"
+     "  FROM lines\n"
+     "  GROUP BY country\n"
+     ")\n"
+     "SELECT COALESCE(f.country, a.country)\n"
+     "FROM fresh f FULL JOIN classicmodels.agg_revenue_by_country a ON a.country = f.country\n"
+     "WHERE (f.revenue, f.order_lines) IS DISTINCT FROM (a.revenue, a.order_lines);"),
+    ("agg_revenue_by_month",
+     FOLDED_CTE + ", fresh AS (\n"
+     "  SELECT date_trunc('month', orderdate)::date AS month, SUM(revenue) AS revenue,\n"
+     "         SUM(orders) AS orders, SUM(order_lines) AS order_lines\n"
+     "  FROM (SELECT orderdate, line_total AS revenue, 0 AS orders, 1 AS order_lines FROM lines\n"
+     "        UNION ALL\n"
+     "        SELECT orderdate, 0, 1, 0 FROM orders) f\n"
+     "  GROUP BY 1\n"
+     ")\n"
+     "SELECT COALESCE(f.month, a.month)::text\n"
+     "FROM fresh f FULL JOIN classicmodels.agg_revenue_by_month a ON a.month = f.month\n"
+     "WHERE (f.revenue, f.orders, f.order_lines) IS DISTINCT FROM (a.revenue, a.orders, a.order_lines);"),
+    ("agg_customer_totals",
+     FOLDED_CTE + ", fresh AS (\n"
+     "  SELECT customernumber, SUM(orders) AS orders, SUM(revenue) AS revenue, SUM(payments) AS payments\n"
+     "  FROM (SELECT customernumber, line_total AS revenue, 0 AS orders, 0 AS payments FROM lines\n"
+     "        UNION ALL\n"
+     "        SELECT customernumber, 0, 1, 0 FROM orders\n"
+     "        UNION ALL\n"
+     "        SELECT customernumber, 0, 0, amount FROM pays) f\n"
+     "  GROUP BY customernumber\n"
+     ")\n"
+     "SELECT COALESCE(f.customernumber, a.customernumber)::text\n"
+     "FROM fresh f FULL JOIN classicmodels.agg_customer_totals a ON a.customernumber = f.customernumber\n"
+     "WHERE (f.orders, f.revenue, f.payments) IS DISTINCT FROM (a.orders, a.revenue, a.payments);"),
+]
+
+
+def count_new_keys(cur):
+    counts = []
+    for table in ("agg_new_orders", "agg_new_lines", "agg_new_payments"):
+        cur.execute(f"SELECT COUNT(*) FROM {table};")
+        counts.append(cur.fetchone()[0])
+    return counts
+
+
+def fold(conn, keys_sql, truncate=False):
+    """Fill the key tables with `keys_sql` and fold them in; one transaction, returns (orders, lines, payments)."""
+    cur = conn.cursor()
+    try:
+        # the row lock serializes concurrent refreshes and rebuilds
+        cur.execute("SELECT 1 FROM classicmodels.agg_refresh WHERE name = 'summary' FOR UPDATE;")
+        if truncate:
+            # the pending tables first: TRUNCATE waits for inserters that already queued keys, and blocks
+            # new ones until commit, so every row is either in the rebuild or pending afterwards
+            cur.execute("TRUNCATE " + ", ".join(f"classicmodels.{t}" for t in PENDING_TABLES + AGG_TABLES) + ";")
+        cur.execute(NEW_KEYS_SQL)
+        cur.execute(keys_sql)
+        counts = count_new_keys(cur)
+        cur.execute(FOLD_SQL)
+        cur.execute("UPDATE classicmodels.agg_refresh SET refreshed_at = now() WHERE name = 'summary';")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    return counts
+
+
+def refresh(conn):
+    """Drain the pending tables into the summary tables; returns the number of folded order lines."""
+    start = time.time()
+    orders, lines, payments = fold(conn, DRAIN_SQL)
+    print(f"Refreshed in {time.time() - start:.3f}s — {orders} orders, {lines} order lines, {payments} payments")
+    return lines
+
+
+def install(conn):
+    cur = conn.cursor()
+    try:
+        cur.execute(INSTALL_SQL)
+        for table in TABLES:
+            cur.execute(f"DROP TRIGGER IF EXISTS agg_enqueue ON classicmodels.{table};")
+            cur.execute(f"CREATE TRIGGER agg_enqueue AFTER INSERT ON classicmodels.{table} "
+                        "REFERENCING NEW TABLE AS new_rows "
+                        "FOR EACH STATEMENT EXECUTE FUNCTION classicmodels.agg_enqueue();")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    print("Summary tables installed.")
+    rebuild(conn)
+
+
+def rebuild(conn):
+    """Recompute from scratch: empty everything and fold every key of the base tables."""
+    start = time.time()
+    orders, lines, payments = fold(conn, ALL_KEYS_SQL, truncate=True)
+    print(f"Rebuilt in {time.time() - start:.3f}s — {orders} orders, {lines} order lines, {payments} payments")
+
+
+def check(conn):
+    """Return the number of summary rows that disagree with the from-scratch aggregates."""
+    cur = conn.cursor()
+    mismatches = 0
+    try:
+        # one snapshot for the pending tables and all three comparisons
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+        for table, sql in CHECK_QUERIES:
+            cur.execute(sql)
+            keys = [row[0] for row in cur.fetchall()]
+            mismatches += len(keys)
+            status = "OK" if not keys else f"{len(keys)} mismatching rows, e.g. {keys[:5]}"
+            print(f"{table}: {status}")
+    finally:
+        cur.close()
+        conn.rollback()
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain incremental revenue/customer summary tables.")
+    add_connection_args(parser)
+    parser.add_argument("command", choices=["install", "refresh", "rebuild", "check"])
+    parser.add_argument("--loop", type=float, default=0,
+                        help="With refresh: keep refreshing every N seconds until interrupted")
+    args = parser.parse_args()
+
+    try:
+        conn = psycopg2.connect(**connection_info(args))
+    except Exception as e:
+        print("Connection failed:", e, file=sys.stderr)
+        sys.exit(1)
+    try:
+        if args.command == "install":
+            install(conn)
+        elif args.command == "rebuild":
+            rebuild(conn)
+        elif args.command == "check":
+            if check(conn):
+                sys.exit(2)
+        else:
+            refresh(conn)
+            while args.loop > 0:
+                time.sleep(args.loop)
+                refresh(conn)
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        print("Aggregate maintenance failed:", e, file=sys.stderr)
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
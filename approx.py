@@ -0,0 +1,519 @@
+#!/usr/bin/env python3
+"""
+Approximate versions of the heavy reports (2: top products, 4: average order value per customer,
+6: sales-rep performance) with stated error bounds, for interactive use on the full backfilled history.
+
+Two methods:
+
+  sketch  Rows of orders LEFT JOIN orderdetails are streamed once per month into a sketch file
+          (<sketch-dir>/YYYY-MM.json): per sales rep and per customer a HyperLogLog of order numbers plus
+          the exact revenue sum, and a weighted Space-Saving top-k summary of product revenue. All three are
+          mergeable, so a report is the merge of the month files. A month is re-streamed only when its
+          order count or highest order number changes (edits to lines of existing orders need --rebuild).
+            - distinct order counts: HyperLogLog with 2^14 registers, standard error 1.04/sqrt(2^14) = 0.81%
+              (reported bound: 2 sigma = 1.6%); small counts are in the linear-counting range and near exact;
+            - product revenue: Space-Saving never underestimates; the true value lies in
+              [revenue - error, revenue], and error <= total revenue / capacity;
+            - revenue sums are exact.
+  sample  The same reports computed by Postgres over TABLESAMPLE BERNOULLI (or SYSTEM) of the big table.
+          Sums and counts are Horvitz-Thompson estimates (sample total / fraction) with a 95% interval;
+          averages use the sampled orders' standard error. SYSTEM samples whole pages, which is faster but
+          makes the interval optimistic when rows are clustered.
+
+--compare also runs the exact reports and prints their time, the observed relative error and the top-k overlap.
+
+  python approx.py sketch --dbname classicmodels --user postgres
+  python approx.py report --dbname classicmodels --user postgres --compare
+  python approx.py report --method sample --percent 2 --dbname classicmodels --user postgres
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+import time
+from datetime import date
+from decimal import Decimal
+
+try:
+    import psycopg2
+except Exception as e:
+    print("Missing dependency 'psycopg2'. Install with: pip install psycopg2-binary", file=sys.stderr)
+    raise
+
+from main import add_connection_args, connection_info, print_table
+from reports import REPORTS
+
+HLL_PRECISION = 14
+TOPK_CAPACITY = 200
+# <sketch-dir>/2004-11.json; anything else in the directory is not ours
+SKETCH_NAME = re.compile(r"^(\d{4})-(0[1-9]|1[0-2])\.json$")
+Z95 = 1.96
+APPROX_REPORTS = ("2_top10_products_by_revenue", "4_avg_order_value_per_customer", "6_sales_rep_performance")
+
+MONTH_FINGERPRINT_SQL = (
+    "SELECT date_trunc('month', orderdate)::date AS month, COUNT(*), MAX(ordernumber)\n"
+    "FROM classicmodels.orders\n"
+    "GROUP BY 1\n"
+    "ORDER BY 1;"
+)
+
+# LEFT JOIN: query 6 counts orders without lines too
+STREAM_SQL = (
+    "SELECT date_trunc('month', o.orderdate)::date AS month,\n"
+    "       o.ordernumber,\n"
+    "       o.customernumber,\n"
+    "       c.salesrepemployeenumber,\n"
+    "       od.productcode,\n"
+    "       od.quantityordered,\n"
+    "       od.quantityordered * od.priceeach AS line_total\n"
+    "FROM classicmodels.orders o\n"
+    "JOIN classicmodels.customers c ON o.customernumber = c.customernumber\n"
+    "LEFT JOIN classicmodels.orderdetails od ON od.ordernumber = o.ordernumber\n"
+    "WHERE date_trunc('month', o.orderdate)::date = ANY(%s)\n"
+    "ORDER BY 1"
+)
+
+SAMPLE_PRODUCTS_SQL = (
+    "SELECT p.productcode,\n"
+    "       p.productname,\n"
+    "       SUM(od.quantityordered * od.priceeach) AS revenue,\n"
+    "       SUM((od.quantityordered * od.priceeach) ^ 2) AS revenue_sq,\n"
+    "       SUM(od.quantityordered) AS units,\n"
+    "       SUM(od.quantityordered ^ 2) AS units_sq\n"
+    "FROM classicmodels.orderdetails od TABLESAMPLE {method} (%s) REPEATABLE (%s)\n"
+    "JOIN classicmodels.products p ON od.productcode = p.productcode\n"
+    "GROUP BY p.productcode, p.productname;"
+)
+
+SAMPLE_CUSTOMERS_SQL = (
+    "SELECT c.customernumber,\n"
+    "       c.customername,\n"
+    "       COUNT(*) AS orders,\n"
+    "       AVG(order_total) AS avg_order_value,\n"
+    "       STDDEV_SAMP(order_total) AS stddev\n"
+    "FROM (\n"
+    "  SELECT o.ordernumber, o.customernumber, SUM(od.quantityordered * od.priceeach) AS order_total\n"
+    "  FROM classicmodels.orders o TABLESAMPLE {method} (%s) REPEATABLE (%s)\n"
+    "  JOIN classicmodels.orderdetails od USING (ordernumber)\n"
+    "  GROUP BY o.ordernumber, o.customernumber\n"
+    ") t\n"
+    "JOIN classicmodels.customers c ON t.customernumber = c.customernumber\n"
+    "GROUP BY c.customernumber, c.customername;"
+)
+
+SAMPLE_REPS_SQL = (
+    "SELECT c.salesrepemployeenumber,\n"
+    "       COUNT(*) AS orders,\n"
+    "       SUM(t.order_total) AS revenue,\n"
+    "       SUM(t.order_total ^ 2) AS revenue_sq\n"
+    "FROM (\n"
+    "  SELECT o.ordernumber, o.customernumber, SUM(od.quantityordered * od.priceeach) AS order_total\n"
+    "  FROM classicmodels.orders o TABLESAMPLE {method} (%s) REPEATABLE (%s)\n"
+    "  LEFT JOIN classicmodels.orderdetails od ON od.ordernumber = o.ordernumber\n"
+    "  GROUP BY o.ordernumber, o.customernumber\n"
+    ") t\n"
+    "JOIN classicmodels.customers c ON t.customernumber = c.customernumber\n"
+    "WHERE c.salesrepemployeenumber IS NOT NULL\n"
+    "GROUP BY c.salesrepemployeenumber;"
+)
+
+# customers_managed is a count over the small customers table and stays exact
+REPS_SQL = (
+    "SELECT e.employeenumber,\n"
+    "       (e.firstname || ' ' || e.lastname) AS sales_rep,\n"
+    "       COUNT(c.customernumber) AS customers_managed\n"
+    "FROM classicmodels.employees e\n"
+    "LEFT JOIN classicmodels.customers c ON c.salesrepemployeenumber = e.employeenumber\n"
+    "GROUP BY e.employeenumber, sales_rep;"
+)
+
+
+class HyperLogLog:
+    """HyperLogLog with sparse registers (index -> rank): small sets cost a few bytes, not 2^p."""
+
+    def __init__(self, p=HLL_PRECISION, registers=None):
+        self.p = p
+        self.m = 1 << p
+        self.registers = registers if registers is not None else {}
+
+    @property
+    def relative_error(self):
+        return 1.04 / math.sqrt(self.m)
+
+    def add(self, value):
+        h = int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+        index = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers.get(index, 0):
+            self.registers[index] = rank
+
+    def merge(self, other):
+        for index, rank in other.registers.items():
+            if rank > self.registers.get(index, 0):
+                self.registers[index] = rank
+
+    def estimate(self):
+        m = self.m
+        zeros = m - len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / (zeros + sum(2.0 ** -r for r in self.registers.values()))
+        if raw <= 2.5 * m and zeros:
+            return m * math.log(m / zeros)   # linear counting for small cardinalities
+        return raw
+
+    def to_json(self):
+        return {"p": self.p, "r": [[i, r] for i, r in self.registers.items()]}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["p"], {i: r for i, r in data["r"]})
+
+
+class SpaceSaving:
+    """Weighted Space-Saving top-k: item -> [weight, error, units]; weight - error <= true weight <= weight."""
+
+    def __init__(self, capacity=TOPK_CAPACITY, counters=None):
+        self.capacity = capacity
+        self.counters = counters if counters is not None else {}
+
+    def floor(self):
+        return min(c[0] for c in self.counters.values()) if len(self.counters) >= self.capacity else Decimal(0)
+
+    def add(self, item, weight, units):
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += weight
+            counter[2] += units
+        elif len(self.counters) < self.capacity:
+            self.counters[item] = [weight, Decimal(0), units]
+        else:
+            victim = min(self.counters, key=lambda k: self.counters[k][0])
+            floor = self.counters.pop(victim)[0]
+            self.counters[item] = [floor + weight, floor, units]
+
+    def merge(self, other):
+        """Mergeable-summaries rule: an item missing from one side may have had up to that side's floor."""
+        mine, theirs = self.floor(), other.floor()
+        merged = {}
+        for item in set(self.counters) | set(other.counters):
+            a = self.counters.get(item, [mine, mine, 0])
+            b = other.counters.get(item, [theirs, theirs, 0])
+            merged[item] = [a[0] + b[0], a[1] + b[1], a[2] + b[2]]
+        keep = sorted(merged, key=lambda k: merged[k][0], reverse=True)[:self.capacity]
+        self.counters = {k: merged[k] for k in keep}
+
+    def top(self, k):
+        return sorted(self.counters.items(), key=lambda kv: kv[1][0], reverse=True)[:k]
+
+    def to_json(self):
+        return {"capacity": self.capacity,
+                "counters": {k: [str(w), str(e), u] for k, (w, e, u) in self.counters.items()}}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["capacity"],
+                   {k: [Decimal(w), Decimal(e), u] for k, (w, e, u) in data["counters"].items()})
+
+
+class MonthSketch:
+    """Everything reports 2, 4 and 6 need from one month of order lines."""
+
+    def __init__(self, fingerprint=None):
+        self.fingerprint = fingerprint
+        self.reps = {}        # rep -> [HyperLogLog of orders, revenue or None]
+        self.customers = {}   # customer -> [HyperLogLog of orders with lines, revenue]
+        self.products = SpaceSaving()
+        self.lines = 0
+
+    def add(self, ordernumber, customernumber, rep, productcode, quantity, line_total):
+        if rep is not None:
+            entry = self.reps.setdefault(rep, [HyperLogLog(), None])
+            entry[0].add(ordernumber)
+            if line_total is not None:
+                entry[1] = (entry[1] or Decimal(0)) + line_total
+        if productcode is None:
+            return
+        self.lines += 1
+        entry = self.customers.setdefault(customernumber, [HyperLogLog(), Decimal(0)])
+        entry[0].add(ordernumber)
+        entry[1] += line_total
+        self.products.add(productcode, line_total, quantity)
+
+    def merge(self, other):
+        for target, source in ((self.reps, other.reps), (self.customers, other.customers)):
+            for key, (hll, revenue) in source.items():
+                entry = target.setdefault(key, [HyperLogLog(), None])
+                entry[0].merge(hll)
+                if revenue is not None:
+                    entry[1] = (entry[1] or Decimal(0)) + revenue
+        self.products.merge(other.products)
+        self.lines += other.lines
+
+    def to_json(self):
+        def groups(d):
+            return {str(k): [h.to_json(), None if v is None else str(v)] for k, (h, v) in d.items()}
+        return {"fingerprint": self.fingerprint, "lines": self.lines, "reps": groups(self.reps),
+                "customers": groups(self.customers), "products": self.products.to_json()}
+
+    @classmethod
+    def from_json(cls, data):
+        def groups(d):
+            return {int(k): [HyperLogLog.from_json(h), None if v is None else Decimal(v)] for k, (h, v) in d.items()}
+        sketch = cls(data["fingerprint"])
+        sketch.lines = data["lines"]
+        sketch.reps = groups(data["reps"])
+        sketch.customers = groups(data["customers"])
+        sketch.products = SpaceSaving.from_json(data["products"])
+        return sketch
+
+
+def sketch_path(directory, month):
+    return os.path.join(directory, f"{month:%Y-%m}.json")
+
+
+def load_sketch(directory, month):
+    try:
+        with open(sketch_path(directory, month), encoding="utf-8") as f:
+            return MonthSketch.from_json(json.load(f))
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save_sketch(directory, month, sketch):
+    path = sketch_path(directory, month)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(sketch.to_json(), f)
+    os.replace(path + ".tmp", path)
+
+
+def refresh_sketches(conn, args):
+    """Bring <sketch-dir> up to date; returns {month: MonthSketch} for every month with orders."""
+    os.makedirs(args.sketch_dir, exist_ok=True)
+    cur = conn.cursor()
+    cur.execute(MONTH_FINGERPRINT_SQL)
+    fingerprints = {month: [count, top] for month, count, top in cur.fetchall()}
+    cur.close()
+
+    sketches, stale = {}, []
+    for month, fingerprint in fingerprints.items():
+        sketch = None if args.rebuild else load_sketch(args.sketch_dir, month)
+        if sketch is not None and sketch.fingerprint == fingerprint:
+            sketches[month] = sketch
+        else:
+            stale.append(month)
+    for name in os.listdir(args.sketch_dir):
+        match = SKETCH_NAME.match(name)
+        if match and date(int(match.group(1)), int(match.group(2)), 1) not in fingerprints:
+            os.remove(os.path.join(args.sketch_dir, name))   # month no longer has orders
+
+    if stale:
+        start = time.time()
+        rows = 0
+        cur = conn.cursor(name="approx_stream")
+        cur.itersize = args.batch_size
+        cur.execute(STREAM_SQL, (stale,))
+        current, sketch = None, None
+        for month, ordernumber, customernumber, rep, productcode, quantity, line_total in cur:
+            if month != current:
+                if sketch is not None:
+                    save_sketch(args.sketch_dir, current, sketch)
+                current, sketch = month, MonthSketch(fingerprints[month])
+                sketches[month] = sketch
+            sketch.add(ordernumber, customernumber, rep, productcode, quantity, line_total)
+            rows += 1
+        if sketch is not None:
+            save_sketch(args.sketch_dir, current, sketch)
+        cur.close()
+        conn.rollback()
+        print(f"Sketched {len(stale)} month(s), {rows} rows, in {time.time() - start:.2f}s -> {args.sketch_dir}")
+    print(f"Sketches up to date: {len(sketches)} month(s), {len(stale)} rebuilt")
+    return sketches
+
+
+def names(conn, sql):
+    cur = conn.cursor()
+    cur.execute(sql)
+    result = {k: v for k, v in cur.fetchall()}
+    cur.close()
+    return result
+
+
+def sketch_reports(conn, args):
+    sketches = refresh_sketches(conn, args)
+    start = time.time()
+    total = MonthSketch()
+    for month in sorted(sketches):
+        total.merge(sketches[month])
+    product_names = names(conn, "SELECT productcode, productname FROM classicmodels.products;")
+    customer_names = names(conn, "SELECT customernumber, customername FROM classicmodels.customers;")
+    cur = conn.cursor()
+    cur.execute(REPS_SQL)
+    reps = cur.fetchall()
+    cur.close()
+    hll_bound = f"±{2 * HyperLogLog().relative_error:.1%}"
+
+    products = [(code, product_names.get(code), round(w, 2), round(w - e, 2), units)
+                for code, (w, e, units) in total.products.top(10)]
+    customers = []
+    for number, (hll, revenue) in total.customers.items():
+        orders = hll.estimate()
+        customers.append((number, customer_names.get(number), round(revenue / Decimal(orders), 2),
+                          round(orders, 1), hll_bound))
+    customers.sort(key=lambda r: r[2], reverse=True)
+    sales = []
+    for number, rep, managed in reps:
+        hll, revenue = total.reps.get(number, (None, None))
+        orders = round(hll.estimate()) if hll else 0
+        sales.append((number, rep, managed, orders, hll_bound if hll else "exact", revenue))
+    sales.sort(key=lambda r: (r[5] is None, -(r[5] or 0)))
+    elapsed = time.time() - start
+    return elapsed, {
+        "2_top10_products_by_revenue": (
+            ["productcode", "productname", "revenue", "revenue_lower_bound", "units_sold"], products,
+            f"Space-Saving, capacity {TOPK_CAPACITY}: true revenue in [revenue_lower_bound, revenue]"),
+        "4_avg_order_value_per_customer": (
+            ["customernumber", "customername", "avg_order_value", "orders_est", "bound"], customers[:20],
+            f"exact revenue / HyperLogLog order count ({hll_bound} at 2 sigma)"),
+        "6_sales_rep_performance": (
+            ["employeenumber", "sales_rep", "customers_managed", "orders_count", "bound", "total_revenue"],
+            sales[:20], f"orders_count from HyperLogLog ({hll_bound} at 2 sigma), revenue exact"),
+    }
+
+
+def interval(variance):
+    """95% half-width for a Horvitz-Thompson estimate with the given variance."""
+    return f"±{Z95 * math.sqrt(max(variance, 0)):,.2f}"
+
+
+def sample_reports(conn, args):
+    f = args.percent / 100.0
+    method = args.sampling.upper()
+    start = time.time()
+    cur = conn.cursor()
+
+    cur.execute(SAMPLE_PRODUCTS_SQL.format(method=method), (args.percent, args.seed))
+    products = []
+    for code, name, revenue, revenue_sq, units, units_sq in cur.fetchall():
+        # Horvitz-Thompson: total / f, variance (1 - f) / f^2 * sum(y^2)
+        products.append((code, name, round(float(revenue) / f, 2),
+                         interval((1 - f) / f ** 2 * float(revenue_sq)), round(float(units) / f)))
+    products.sort(key=lambda r: r[2], reverse=True)
+
+    cur.execute(SAMPLE_CUSTOMERS_SQL.format(method=method), (args.percent, args.seed))
+    customers = []
+    for number, name, orders, avg, stddev in cur.fetchall():
+        bound = f"±{Z95 * float(stddev) / math.sqrt(orders):,.2f}" if stddev is not None else "n/a (1 order)"
+        customers.append((number, name, round(avg, 2), orders, bound))
+    customers.sort(key=lambda r: r[2], reverse=True)
+
+    cur.execute(SAMPLE_REPS_SQL.format(method=method), (args.percent, args.seed))
+    sampled = {rep: (orders, revenue, revenue_sq) for rep, orders, revenue, revenue_sq in cur.fetchall()}
+    cur.execute(REPS_SQL)
+    sales = []
+    for number, rep, managed in cur.fetchall():
+        if number not in sampled:
+            sales.append((number, rep, managed, 0, "", None, ""))
+            continue
+        orders, revenue, revenue_sq = sampled[number]
+        revenue = float(revenue or 0)
+        sales.append((number, rep, managed, round(orders / f), interval((1 - f) / f ** 2 * orders),
+                      round(revenue / f, 2), interval((1 - f) / f ** 2 * float(revenue_sq or 0))))
+    sales.sort(key=lambda r: (r[5] is None, -(r[5] or 0)))
+    cur.close()
+    conn.rollback()
+    elapsed = time.time() - start
+    label = f"TABLESAMPLE {method} {args.percent}%, 95% interval"
+    return elapsed, {
+        "2_top10_products_by_revenue": (
+            ["productcode", "productname", "revenue", "revenue_ci", "units_sold"], products[:10], label),
+        "4_avg_order_value_per_customer": (
+            ["customernumber", "customername", "avg_order_value", "sampled_orders", "ci"], customers[:20], label),
+        "6_sales_rep_performance": (
+            ["employeenumber", "sales_rep", "customers_managed", "orders_count", "orders_ci",
+             "total_revenue", "revenue_ci"], sales[:20], label),
+    }
+
+
+def compare(conn, key, columns, rows):
+    """Run the exact report; return (seconds, max relative error of the value column, top-k overlap)."""
+    value_column = {"2_top10_products_by_revenue": "revenue",
+                    "4_avg_order_value_per_customer": "avg_order_value",
+                    "6_sales_rep_performance": "total_revenue"}[key]
+    cur = conn.cursor()
+    start = time.time()
+    cur.execute(REPORTS[key].render())
+    exact = cur.fetchall()
+    elapsed = time.time() - start
+    exact_columns = [d[0] for d in cur.description]
+    cur.close()
+    exact_values = {r[0]: r[exact_columns.index(value_column)] for r in exact}
+    position = columns.index(value_column)
+    errors = [abs(float(r[position]) - float(exact_values[r[0]])) / abs(float(exact_values[r[0]]))
+              for r in rows if exact_values.get(r[0]) and r[position] is not None]
+    overlap = len({r[0] for r in rows} & set(exact_values)) / max(len(exact_values), 1)
+    return elapsed, max(errors, default=0.0), overlap
+
+
+def report(args):
+    conn = psycopg2.connect(**connection_info(args))
+    try:
+        elapsed, results = (sketch_reports if args.method == "sketch" else sample_reports)(conn, args)
+        for key in APPROX_REPORTS:
+            columns, rows, bound = results[key]
+            print_table(f"{key} — approximate ({bound})", columns, rows)
+            if args.compare:
+                exact_elapsed, error, overlap = compare(conn, key, columns, rows)
+                print(f"Exact query: {exact_elapsed:.3f}s; max relative error {error:.2%}, "
+                      f"top-k overlap {overlap:.0%}")
+        print(f"\nApproximate answers ({args.method}) computed in {elapsed:.3f}s")
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Approximate reports 2, 4 and 6 with error bounds.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("sketch", "Build or refresh the per-month sketch files"),
+                            ("report", "Print the approximate reports")):
+        p = sub.add_parser(name, help=help_text)
+        add_connection_args(p)
+        p.add_argument("--sketch-dir", dest="sketch_dir", default=".approx_sketches",
+                       help="Directory of the per-month sketch files (default: .approx_sketches)")
+        p.add_argument("--rebuild", action="store_true", help="Re-stream every month")
+        p.add_argument("--batch-size", dest="batch_size", type=int, default=20000,
+                       help="Rows per server-side cursor fetch while sketching (default: 20000)")
+        if name == "report":
+            p.add_argument("--method", choices=("sketch", "sample"), default="sketch",
+                           help="Merged sketches (default) or TABLESAMPLE queries")
+            p.add_argument("--percent", type=float, default=5.0,
+                           help="With --method sample: sampling percentage (default: 5)")
+            p.add_argument("--sampling", choices=("bernoulli", "system"), default="bernoulli",
+                           help="With --method sample: row-level BERNOULLI (default) or page-level SYSTEM")
+            p.add_argument("--seed", type=int, default=1, help="With --method sample: REPEATABLE seed")
+            p.add_argument("--compare", action="store_true",
+                           help="Also run the exact queries and print the observed error and speed-up")
+    args = parser.parse_args()
+    if args.command == "report" and not 0 < args.percent <= 100:
+        parser.error("--percent must be in (0, 100]")
+
+    try:
+        if args.command == "sketch":
+            conn = psycopg2.connect(**connection_info(args))
+            try:
+                refresh_sketches(conn, args)
+            finally:
+                conn.close()
+        else:
+            report(args)
+    except Exception as e:
+        print("Approximate run failed:", e, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Repeatable benchmark for the report QUERIES of main.py.
+
+`run` executes every query `--warmup` times untimed and `--runs` times timed, then once more under
+EXPLAIN (ANALYZE, BUFFERS) and writes a JSON result with min/median/p95 latency, rows returned and
+shared buffer hits/reads per query, plus the table sizes it ran against.
+
+`compare` diffs a result against a saved baseline and flags queries whose median latency grew by
+more than --threshold (and by at least --min-delta-ms); it exits with status 1 on any regression.
+
+Typical scale sweep with the generator:
+  python datagen.py generate --scale-factor 10 --out-dir chunks_sf10 && python datagen.py load --out-dir chunks_sf10
+  python benchmark.py run --dbname classicmodels --label sf10 --output bench_sf10.json
+  python benchmark.py compare bench_sf1.json bench_sf10.json
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+try:
+    import psycopg2
+except Exception as e:
+    print("Missing dependency 'psycopg2'. Install with: pip install psycopg2-binary", file=sys.stderr)
+    raise
+
+from main import QUERIES, add_connection_args, connection_info
+
+TABLE_SIZES_SQL = (
+    "SELECT relname, n_live_tup\n"
+    "FROM pg_stat_user_tables\n"
+    "WHERE schemaname = 'classicmodels'\n"
+    "ORDER BY relname;"
+)
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[k]
+
+
+def explain_buffers(cur, sql):
+    """Run EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON); return the plan-root buffer and timing counters."""
+    cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql)
+    result = cur.fetchone()[0][0]
+    plan = result["Plan"]
+    return {
+        "shared_hit_blocks": plan.get("Shared Hit Blocks", 0),
+        "shared_read_blocks": plan.get("Shared Read Blocks", 0),
+        "temp_read_blocks": plan.get("Temp Read Blocks", 0),
+        "temp_written_blocks": plan.get("Temp Written Blocks", 0),
+        "planning_ms": result.get("Planning Time"),
+        "execution_ms": result.get("Execution Time"),
+    }
+
+
+def bench_query(conn, sql, runs, warmup):
+    cur = conn.cursor()
+    try:
+        for _ in range(warmup):
+            cur.execute(sql)
+            cur.fetchall()
+        timings = []
+        rows = 0
+        for _ in range(runs):
+            start = time.perf_counter()
+            cur.execute(sql)
+            rows = len(cur.fetchall())
+            timings.append((time.perf_counter() - start) * 1000)
+        buffers = explain_buffers(cur, sql)
+    finally:
+        cur.close()
+        conn.rollback()
+    timings.sort()
+    return {
+        "runs": runs,
+        "rows": rows,
+        "min_ms": timings[0],
+        "median_ms": statistics.median(timings),
+        "p95_ms": percentile(timings, 95),
+        "mean_ms": statistics.mean(timings),
+        **buffers,
+    }
+
+
+def run(args):
+    conn = psycopg2.connect(**connection_info(args))
+    try:
+        cur = conn.cursor()
+        cur.execute("SET statement_timeout = %s;", (args.timeout * 1000,))
+        cur.execute("SHOW server_version;")
+        server_version = cur.fetchone()[0]
+        cur.execute(TABLE_SIZES_SQL)
+        table_rows = dict(cur.fetchall())
+        conn.commit()
+        cur.close()
+
+        result = {
+            "label": args.label,
+            "scale_factor": args.scale_factor,
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "server_version": server_version,
+            "table_rows": table_rows,
+            "warmup": args.warmup,
+            "queries": {},
+        }
+        for key, sql in QUERIES:
+            if args.only and key not in args.only:
+                continue
+            try:
+                stats = bench_query(conn, sql, args.runs, args.warmup)
+            except Exception as e:
+                print(f"Error benchmarking [{key}]: {e}", file=sys.stderr)
+                conn.rollback()
+                result["queries"][key] = {"error": str(e)}
+                continue
+            result["queries"][key] = stats
+            print(f"{key:<42} median {stats['median_ms']:9.2f} ms  p95 {stats['p95_ms']:9.2f} ms  "
+                  f"rows {stats['rows']:6d}  hit {stats['shared_hit_blocks']:8d}  read {stats['shared_read_blocks']:8d}")
+    finally:
+        conn.close()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"Saved benchmark -> {args.output}")
+
+
+def compare(args):
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+
+    print(f"baseline: {baseline.get('label') or args.baseline}   current: {current.get('label') or args.current}")
+    print(f"{'query':<42} {'base ms':>10} {'cur ms':>10} {'change':>8}  {'reads':>16}")
+    regressions = []
+    for key, cur_stats in current["queries"].items():
+        base_stats = baseline["queries"].get(key)
+        if not base_stats or "error" in base_stats or "error" in cur_stats:
+            print(f"{key:<42} {'-':>10} {'-':>10} {'n/a':>8}")
+            continue
+        base_ms, cur_ms = base_stats["median_ms"], cur_stats["median_ms"]
+        change = (cur_ms - base_ms) / base_ms if base_ms else 0.0
+        regressed = change > args.threshold and cur_ms - base_ms >= args.min_delta_ms
+        reads = f"{base_stats['shared_read_blocks']}->{cur_stats['shared_read_blocks']}"
+        print(f"{key:<42} {base_ms:10.2f} {cur_ms:10.2f} {change:+8.1%}  {reads:>16}"
+              + ("  REGRESSION" if regressed else ""))
+        if regressed:
+            regressions.append(key)
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+    print("\nNo regressions.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the classicmodels report queries.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_p = sub.add_parser("run", help="Benchmark every query and write a JSON result")
+    add_connection_args(run_p)
+    run_p.add_argument("--runs", type=int, default=10, help="Timed executions per query (default: 10)")
+    run_p.add_argument("--warmup", type=int, default=2, help="Untimed executions before timing (default: 2)")
+    run_p.add_argument("--label", default="", help="Free-form label stored in the result, e.g. sf10")
+    run_p.add_argument("--scale-factor", dest="scale_factor", type=float, default=None,
+                       help="Scale factor the database was generated with (metadata only)")
+    run_p.add_argument("--only", nargs="*", default=None, help="Only benchmark these query keys")
+    run_p.add_argument("--timeout", type=int, default=600, help="Statement timeout in seconds (default: 600)")
+    run_p.add_argument("--output", default="benchmark.json", help="Result file (default: benchmark.json)")
+
+    cmp_p = sub.add_parser("compare", help="Flag regressions of a result against a baseline")
+    cmp_p.add_argument("baseline")
+    cmp_p.add_argument("current")
+    cmp_p.add_argument("--threshold", type=float, default=0.2,
+                       help="Relative median slowdown that counts as a regression (default: 0.2 = 20%%)")
+    cmp_p.add_argument("--min-delta-ms", dest="min_delta_ms", type=float, default=1.0,
+                       help="Ignore slowdowns smaller than this many ms (default: 1.0)")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        if args.runs < 1:
+            parser.error("--runs must be >= 1")
+        try:
+            run(args)
+        except Exception as e:
+            print("Benchmark failed:", e, file=sys.stderr)
+            sys.exit(1)
+    else:
+        compare(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+"""
+Push-based change feed: revenue, order and payment deltas per country, product line and day,
+pushed to local subscribers over server-sent events, without the subscribers touching the base tables.
+
+  install    statement-level triggers (with transition tables) on orders, orderdetails and payments.
+             Every INSERT/UPDATE/DELETE statement sends compact NOTIFYs on channel `classicmodels_changes`:
+               {"k": "orderdetails", "s": seq, "x": txid, "t": epoch,
+                "g": [[day, country, productline, revenue, units, lines], ...]}
+             with the rows already grouped and signed (updates send old rows negative, new rows positive),
+             orderdetails rows grouped under their order's current day and country. An orders UPDATE that
+             changes orderdate or customernumber also sends its lines as an "orderdetails" event, negative
+             under the old day/country and positive under the new one.
+             at most 40 groups per notification. A 1000-row COPY from backfill_data.py becomes a handful of
+             notifications rather than 1000.
+  uninstall  drop the triggers and the function.
+  serve      LISTEN, load the current totals once (one REPEATABLE READ snapshot), then fold notifications
+             into the totals. Events are batched: a batch is flushed when no event arrived for --debounce ms
+             or the oldest pending event is --max-delay ms old, so subscribers see changes well under a second.
+             Events of transactions already contained in the snapshot are skipped by txid, so nothing is
+             counted twice. On a lost connection it reconnects and sends subscribers a fresh snapshot.
+
+  GET /events     text/event-stream: `snapshot` (all totals) on connect, then one `delta` per batch with the
+                  changed keys' delta and new value; ?topics=revenue,orders limits the topics
+  GET /snapshot   current totals as JSON
+  GET /stats      events, batches, subscribers and trigger-to-push latency
+
+Topics: revenue and units (by country, productline, day), orders (by country, status, day),
+payments (amount by country, day). TRUNCATE is not captured; restart `serve` after one.
+
+  python changefeed.py install --dbname classicmodels --user postgres
+  python changefeed.py serve --dbname classicmodels --user postgres --listen-port 8766
+  curl -N localhost:8766/events?topics=revenue
+"""
+
+import argparse
+import json
+import queue
+import select
+import sys
+import threading
+import time
+from collections import deque
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+try:
+    import psycopg2
+except Exception as e:
+    print("Missing dependency 'psycopg2'. Install with: pip install psycopg2-binary", file=sys.stderr)
+    raise
+
+from main import add_connection_args, connection_info
+from report_server import json_value
+
+CHANNEL = "classicmodels_changes"
+TABLES = ("orders", "orderdetails", "payments")
+TOPICS = {
+    "revenue": ("country", "productline", "day"),
+    "units": ("country", "productline", "day"),
+    "orders": ("country", "status", "day"),
+    "payments": ("country", "day"),
+}
+KEEPALIVE = 15.0
+
+INSTALL_SQL = """
+CREATE SEQUENCE IF NOT EXISTS classicmodels.changefeed_seq;
+
+CREATE OR REPLACE FUNCTION classicmodels.changefeed_notify() RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    rows_sql   text;
+    groups_sql text;
+    payload    text;
+    -- the sequence number keeps payloads unique: NOTIFY folds identical payloads within a transaction
+    notify_sql text := $q$WITH d AS (%s)
+           SELECT json_build_object('k', %L, 's', nextval('classicmodels.changefeed_seq'), 'x', txid_current(),
+                                    't', extract(epoch FROM clock_timestamp()), 'g', json_agg(item))::text
+           FROM (SELECT item, (row_number() OVER () - 1) / 40 AS chunk FROM (%s) g) c
+           GROUP BY chunk$q$;
+BEGIN
+    rows_sql := CASE TG_OP
+        WHEN 'INSERT' THEN 'SELECT 1 AS sign, * FROM new_rows'
+        WHEN 'DELETE' THEN 'SELECT -1 AS sign, * FROM old_rows'
+        ELSE 'SELECT 1 AS sign, * FROM new_rows UNION ALL SELECT -1, * FROM old_rows'
+    END;
+    groups_sql := CASE TG_TABLE_NAME
+        WHEN 'orderdetails' THEN $q$
+            SELECT json_build_array(o.orderdate, c.country, p.productline,
+                                    SUM(d.sign * d.quantityordered * d.priceeach),
+                                    SUM(d.sign * d.quantityordered), SUM(d.sign)) AS item
+            FROM d
+            JOIN classicmodels.orders o ON o.ordernumber = d.ordernumber
+            JOIN classicmodels.customers c ON c.customernumber = o.customernumber
+            JOIN classicmodels.products p ON p.productcode = d.productcode
+            GROUP BY o.orderdate, c.country, p.productline
+            HAVING SUM(d.sign) <> 0 OR SUM(d.sign * d.quantityordered * d.priceeach) <> 0
+                OR SUM(d.sign * d.quantityordered) <> 0 $q$
+        WHEN 'orders' THEN $q$
+            SELECT json_build_array(d.orderdate, c.country, d.status, SUM(d.sign)) AS item
+            FROM d
+            JOIN classicmodels.customers c ON c.customernumber = d.customernumber
+            GROUP BY d.orderdate, c.country, d.status
+            HAVING SUM(d.sign) <> 0 $q$
+        ELSE $q$
+            SELECT json_build_array(d.paymentdate, c.country, SUM(d.sign * d.amount), SUM(d.sign)) AS item
+            FROM d
+            JOIN classicmodels.customers c ON c.customernumber = d.customernumber
+            GROUP BY d.paymentdate, c.country
+            HAVING SUM(d.sign * d.amount) <> 0 OR SUM(d.sign) <> 0 $q$
+    END;
+    FOR payload IN EXECUTE format(notify_sql, rows_sql, TG_TABLE_NAME, groups_sql)
+    LOOP
+        PERFORM pg_notify('classicmodels_changes', payload);
+    END LOOP;
+
+    -- an order moved to another day or customer takes its lines' revenue and units along: the lines go out
+    -- negative under the old order image and positive under the new one. The orderdetails trigger can't do
+    -- this, it only sees the current order (and a cascaded orderdetails update nets to zero there).
+    IF TG_TABLE_NAME = 'orders' AND TG_OP = 'UPDATE' THEN
+        rows_sql := $q$
+            SELECT s.sign, s.ordernumber, s.orderdate, s.customernumber
+            FROM new_rows n
+            JOIN old_rows o ON o.ordernumber = n.ordernumber
+            CROSS JOIN LATERAL (VALUES (1, n.ordernumber, n.orderdate, n.customernumber),
+                                       (-1, o.ordernumber, o.orderdate, o.customernumber))
+                AS s (sign, ordernumber, orderdate, customernumber)
+            WHERE (n.orderdate, n.customernumber) IS DISTINCT FROM (o.orderdate, o.customernumber) $q$;
+        groups_sql := $q$
+            SELECT json_build_array(d.orderdate, c.country, p.productline,
+                                    SUM(d.sign * od.quantityordered * od.priceeach),
+                                    SUM(d.sign * od.quantityordered), SUM(d.sign)) AS item
+            FROM d
+            JOIN classicmodels.orderdetails od ON od.ordernumber = d.ordernumber
+            JOIN classicmodels.customers c ON c.customernumber = d.customernumber
+            JOIN classicmodels.products p ON p.productcode = od.productcode
+            GROUP BY d.orderdate, c.country, p.productline
+            HAVING SUM(d.sign) <> 0 OR SUM(d.sign * od.quantityordered * od.priceeach) <> 0
+                OR SUM(d.sign * od.quantityordered) <> 0 $q$;
+        FOR payload IN EXECUTE format(notify_sql, rows_sql, 'orderdetails', groups_sql)
+        LOOP
+            PERFORM pg_notify('classicmodels_changes', payload);
+        END LOOP;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+"""
+
+TRIGGERS = (
+    ("changefeed_ins", "INSERT", "REFERENCING NEW TABLE AS new_rows"),
+    ("changefeed_upd", "UPDATE", "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+    ("changefeed_del", "DELETE", "REFERENCING OLD TABLE AS old_rows"),
+)
+
+SNAPSHOT_SQL = {
+    "orderdetails": (
+        "SELECT o.orderdate, c.country, p.productline,\n"
+        "       SUM(od.quantityordered * od.priceeach), SUM(od.quantityordered), COUNT(*)\n"
+        "FROM classicmodels.orderdetails od\n"
+        "JOIN classicmodels.orders o ON o.ordernumber = od.ordernumber\n"
+        "JOIN classicmodels.customers c ON c.customernumber = o.customernumber\n"
+        "JOIN classicmodels.products p ON p.productcode = od.productcode\n"
+        "GROUP BY 1, 2, 3;"
+    ),
+    "orders": (
+        "SELECT o.orderdate, c.country, o.status, COUNT(*)\n"
+        "FROM classicmodels.orders o\n"
+        "JOIN classicmodels.customers c ON c.customernumber = o.customernumber\n"
+        "GROUP BY 1, 2, 3;"
+    ),
+    "payments": (
+        "SELECT p.paymentdate, c.country, SUM(p.amount), COUNT(*)\n"
+        "FROM classicmodels.payments p\n"
+        "JOIN classicmodels.customers c ON c.customernumber = p.customernumber\n"
+        "GROUP BY 1, 2;"
+    ),
+}
+
+
+def install(conn, args):
+    cur = conn.cursor()
+    cur.execute(INSTALL_SQL)
+    for table in TABLES:
+        for name, event, referencing in TRIGGERS:
+            cur.execute(f"DROP TRIGGER IF EXISTS {name} ON classicmodels.{table};")
+            cur.execute(f"CREATE TRIGGER {name} AFTER {event} ON classicmodels.{table} {referencing} "
+                        "FOR EACH STATEMENT EXECUTE FUNCTION classicmodels.changefeed_notify();")
+    conn.commit()
+    cur.close()
+    print(f"Installed change-feed triggers on {', '.join(TABLES)} (channel {CHANNEL})")
+
+
+def uninstall(conn, args):
+    cur = conn.cursor()
+    for table in TABLES:
+        for name, _, _ in TRIGGERS:
+            cur.execute(f"DROP TRIGGER IF EXISTS {name} ON classicmodels.{table};")
+    cur.execute("DROP FUNCTION IF EXISTS classicmodels.changefeed_notify();")
+    cur.execute("DROP SEQUENCE IF EXISTS classicmodels.changefeed_seq;")
+    conn.commit()
+    cur.close()
+    print("Removed change-feed triggers")
+
+
+def empty_totals():
+    return {topic: {dim: {} for dim in dims} for topic, dims in TOPICS.items()}
+
+
+def fold(target, topic, keys, value):
+    """Add `value` to the topic's total for every (dimension, key) pair; returns the touched pairs."""
+    touched = []
+    for dim, key in zip(TOPICS[topic], keys):
+        totals = target[topic][dim]
+        totals[key] = totals.get(key, 0) + value
+        touched.append((topic, dim, key))
+    return touched
+
+
+def apply_group(totals, kind, group):
+    """Fold one notification group (or snapshot row) into `totals`; returns the touched (topic, dim, key)."""
+    if kind == "orderdetails":
+        day, country, productline, revenue, units, _lines = group
+        return (fold(totals, "revenue", (country, productline, day), revenue)
+                + fold(totals, "units", (country, productline, day), units))
+    if kind == "orders":
+        day, country, status, count = group
+        return fold(totals, "orders", (country, status, day), count)
+    day, country, amount, _count = group
+    return fold(totals, "payments", (country, day), amount)
+
+
+def percentile_ms(values, q):
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 1)
+
+
+def parse_snapshot(text):
+    """txid_current_snapshot() 'xmin:xmax:xip,...' -> function telling whether a txid is contained in it."""
+    xmin, xmax, xip = text.split(":")
+    xmin, xmax = int(xmin), int(xmax)
+    in_progress = {int(x) for x in xip.split(",") if x}
+    return lambda txid: txid < xmin or (txid < xmax and txid not in in_progress)
+
+
+class ChangeFeed:
+    """LISTENs, keeps the totals, batches notifications and broadcasts deltas to subscriber queues."""
+
+    def __init__(self, conn_info, debounce, max_delay, queue_size):
+        self.conn_info = conn_info
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.totals = empty_totals()
+        self.batch = 0
+        self.subscribers = set()
+        self.events = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.latencies = deque(maxlen=1000)
+
+    # --- subscribers ---
+
+    def snapshot(self):
+        """(batch number, totals) as JSON-ready values."""
+        with self.lock:
+            return self.batch, json.loads(json.dumps(self.totals, default=json_value))
+
+    def subscribe(self):
+        """Register a queue and return it with a snapshot taken atomically with respect to deltas."""
+        q = queue.Queue(maxsize=self.queue_size)
+        with self.lock:
+            self.subscribers.add(q)
+            return q, self.batch, json.loads(json.dumps(self.totals, default=json_value))
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers.discard(q)
+
+    def broadcast(self, message):
+        for q in list(self.subscribers):
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                # a subscriber that can't keep up is cut off; it reconnects and gets a fresh snapshot
+                self.subscribers.discard(q)
+                self.dropped += 1
+                while True:
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        break
+                q.put_nowait(None)
+
+    # --- database side ---
+
+    def load_snapshot(self, conn):
+        conn.set_session(isolation_level="REPEATABLE READ", readonly=True, autocommit=False)
+        cur = conn.cursor()
+        cur.execute("SELECT txid_current_snapshot()::text;")
+        visible = parse_snapshot(cur.fetchone()[0])
+        totals = empty_totals()
+        for kind, sql in SNAPSHOT_SQL.items():
+            cur.execute(sql)
+            for row in cur.fetchall():
+                apply_group(totals, kind, (row[0].isoformat(),) + tuple(row[1:]))
+        cur.close()
+        conn.commit()
+        conn.set_session(autocommit=True)
+        with self.lock:
+            self.totals = totals
+            self.batch += 1
+            self.broadcast(("snapshot", self.batch, json.loads(json.dumps(totals, default=json_value))))
+        return visible
+
+    def flush(self, pending):
+        touched = set()
+        delta = empty_totals()
+        now = time.time()
+        with self.lock:
+            for kind, groups, sent_at in pending:
+                for group in groups:
+                    touched.update(apply_group(self.totals, kind, group))
+                    apply_group(delta, kind, group)
+                self.latencies.append(now - sent_at)
+            self.batch += 1
+            changes = {}
+            for topic, dim, key in sorted(touched, key=str):
+                if not delta[topic][dim][key]:
+                    continue   # e.g. a status change nets out per country and day
+                entry = changes.setdefault(topic, {}).setdefault(dim, {})
+                entry[key] = {"delta": delta[topic][dim][key], "value": self.totals[topic][dim][key]}
+            message = {"batch": self.batch, "events": len(pending), "changes": changes}
+            self.broadcast(("delta", self.batch, json.loads(json.dumps(message, default=json_value))))
+
+    def listen_once(self):
+        conn = psycopg2.connect(**self.conn_info)
+        try:
+            conn.set_session(autocommit=True)
+            cur = conn.cursor()
+            cur.execute(f"LISTEN {CHANNEL};")
+            # listening before the snapshot: nothing committed after it can be missed
+            visible = self.load_snapshot(conn)
+            print(f"Listening on {CHANNEL}; snapshot loaded (batch {self.batch})")
+            pending = []
+            first = last = None
+            while True:
+                if conn.notifies:
+                    wait = 0.0   # delivered while the snapshot queries ran
+                elif pending:
+                    now = time.monotonic()
+                    wait = max(0.0, min(last + self.debounce - now, first + self.max_delay - now))
+                else:
+                    wait = KEEPALIVE
+                if select.select([conn], [], [], wait) != ([], [], []):
+                    conn.poll()
+                while conn.notifies:
+                    note = conn.notifies.pop(0)
+                    event = json.loads(note.payload, parse_float=Decimal)
+                    self.events += 1
+                    if visible(event["x"]):
+                        self.skipped += 1   # already counted by the snapshot
+                        continue
+                    now = time.monotonic()
+                    first = first if pending else now
+                    last = now
+                    pending.append((event["k"], event["g"], float(event["t"])))
+                now = time.monotonic()
+                if pending and (now - last >= self.debounce or now - first >= self.max_delay):
+                    self.flush(pending)
+                    pending = []
+        finally:
+            conn.close()
+
+    def run(self):
+        while True:
+            try:
+                self.listen_once()
+            except Exception as e:
+                print("Change feed connection lost:", e, file=sys.stderr)
+                time.sleep(1.0)
+
+    def stats(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            subscribers = len(self.subscribers)
+        return {"batch": self.batch, "events": self.events, "skipped_in_snapshot": self.skipped,
+                "subscribers": subscribers, "dropped_subscribers": self.dropped,
+                "latency_ms": {"p50": percentile_ms(latencies, 0.5), "p95": percentile_ms(latencies, 0.95),
+                               "max": percentile_ms(latencies, 1.0)}}
+
+
+def filter_topics(payload, topics):
+    if topics is None:
+        return payload
+    if "changes" in payload:
+        return dict(payload, changes={t: v for t, v in payload["changes"].items() if t in topics})
+    return {t: v for t, v in payload.items() if t in topics}
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    feed = None
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, default=json_value).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_event(self, event, event_id, payload):
+        self.wfile.write(f"id: {event_id}\nevent: {event}\ndata: {json.dumps(payload)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/stats":
+            return self.send_json(200, self.feed.stats())
+        if url.path == "/snapshot":
+            batch, totals = self.feed.snapshot()
+            return self.send_json(200, {"batch": batch, "totals": totals})
+        if url.path != "/events":
+            return self.send_json(404, {"error": f"unknown path {url.path}"})
+
+        requested = parse_qs(url.query).get("topics")
+        topics = set(",".join(requested).split(",")) if requested else None
+        if topics and not topics <= set(TOPICS):
+            return self.send_json(400, {"error": f"unknown topics; known: {', '.join(TOPICS)}"})
+        q, batch, totals = self.feed.subscribe()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            self.send_event("snapshot", batch, filter_topics(totals, topics))
+            while True:
+                try:
+                    message = q.get(timeout=KEEPALIVE)
+                except queue.Empty:
+                    self.wfile.write(b": keepalive\n\n")
+                    self.wfile.flush()
+                    continue
+                if message is None:
+                    return   # too slow: dropped by the feed
+                event, event_id, payload = message
+                self.send_event(event, event_id, filter_topics(payload, topics))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.feed.unsubscribe(q)
+
+    def log_message(self, fmt, *args):
+        sys.stderr.write(f"[{self.log_date_time_string()}] {fmt % args}\n")
+
+
+def serve(args):
+    feed = ChangeFeed(connection_info(args), args.debounce / 1000, args.max_delay / 1000, args.queue_size)
+    threading.Thread(target=feed.run, daemon=True).start()
+    FeedHandler.feed = feed
+    server = ThreadingHTTPServer((args.bind, args.listen_port), FeedHandler)
+    server.daemon_threads = True
+    print(f"Serving change feed on http://{args.bind}:{args.listen_port}/events")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LISTEN/NOTIFY change feed with server-sent events.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("install", "Create the triggers"), ("uninstall", "Drop the triggers"),
+                            ("serve", "Run the consumer and the SSE endpoint")):
+        p = sub.add_parser(name, help=help_text)
+        add_connection_args(p)
+        if name == "serve":
+            p.add_argument("--bind", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+            p.add_argument("--listen-port", dest="listen_port", type=int, default=8766,
+                           help="HTTP port (default: 8766)")
+            p.add_argument("--debounce", type=float, default=100,
+                           help="Flush a batch after this many ms without new events (default: 100)")
+            p.add_argument("--max-delay", dest="max_delay", type=float, default=500,
+                           help="Flush at the latest this many ms after the oldest pending event (default: 500)")
+            p.add_argument("--queue-size", dest="queue_size", type=int, default=1000,
+                           help="Messages buffered per subscriber before it is dropped (default: 1000)")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        if args.debounce <= 0 or args.max_delay < args.debounce:
+            parser.error("--debounce must be > 0 and --max-delay >= --debounce")
+        serve(args)
+        return
+    try:
+        conn = psycopg2.connect(**connection_info(args))
+        try:
+            (install if args.command == "install" else uninstall)(conn, args)
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"{args.command} failed:", e, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
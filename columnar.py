@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Columnar (Parquet / Arrow IPC) output for report results, and a partitioned snapshot of the
+Full Sales Data order-line fact.
+
+main.py uses write_rows() for `--save-csv --format parquet|arrow`. Column types are inferred from the
+Python values psycopg2 returns, so NUMERIC stays decimal128 (no float rounding), DATE stays date32 and
+integers stay int64.
+
+`snapshot` streams the order-line fact from a server-side cursor in --batch-size batches ordered by
+orderdate and writes hive-style partitions
+
+  <out-dir>/year=2004/month=11/part-0.parquet
+
+(or .arrow) with zstd compression, one open writer at a time, so memory stays at one batch regardless of
+the table size. Read back with pyarrow.dataset.dataset(out_dir, partitioning="hive") or
+pandas.read_parquet(out_dir).
+
+  python columnar.py snapshot --dbname classicmodels --user postgres --out-dir sales_snapshot
+"""
+
+import argparse
+import os
+import re
+import shutil
+import sys
+import time
+from datetime import date
+
+try:
+    import psycopg2
+except Exception as e:
+    print("Missing dependency 'psycopg2'. Install with: pip install psycopg2-binary", file=sys.stderr)
+    raise
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+    HAVE_PYARROW = True
+except Exception:
+    HAVE_PYARROW = False
+
+FORMATS = ("csv", "parquet", "arrow")
+SUFFIXES = {"parquet": ".parquet", "arrow": ".arrow"}
+PARTITION_FILE = re.compile(r"year=\d{4}/month=\d{2}/part-0\.(parquet|arrow)")
+
+# explicit casts: line_total and priceeach get a fixed decimal type in every batch and partition
+SNAPSHOT_SQL = (
+    "SELECT o.orderdate,\n"
+    "       o.ordernumber,\n"
+    "       o.status,\n"
+    "       c.customername,\n"
+    "       c.country,\n"
+    "       od.productcode,\n"
+    "       od.quantityordered,\n"
+    "       od.priceeach::numeric(10, 2) AS priceeach,\n"
+    "       (od.priceeach * od.quantityordered)::numeric(14, 2) AS line_total,\n"
+    "       p.productline,\n"
+    "       p.productname\n"
+    "FROM classicmodels.orders o\n"
+    "JOIN classicmodels.orderdetails od ON o.ordernumber = od.ordernumber\n"
+    "JOIN classicmodels.products p ON od.productcode = p.productcode\n"
+    "JOIN classicmodels.customers c ON o.customernumber = c.customernumber\n"
+    "{where}"
+    "ORDER BY o.orderdate"
+)
+
+
+def require_pyarrow():
+    if not HAVE_PYARROW:
+        raise RuntimeError("Parquet/Arrow output needs pyarrow. Install with: pip install pyarrow")
+
+
+def snapshot_schema():
+    return pa.schema([
+        ("orderdate", pa.date32()),
+        ("ordernumber", pa.int32()),
+        ("status", pa.string()),
+        ("customername", pa.string()),
+        ("country", pa.string()),
+        ("productcode", pa.string()),
+        ("quantityordered", pa.int32()),
+        ("priceeach", pa.decimal128(10, 2)),
+        ("line_total", pa.decimal128(14, 2)),
+        ("productline", pa.string()),
+        ("productname", pa.string()),
+    ])
+
+
+def rows_table(columns, rows, schema=None):
+    """Row tuples -> pyarrow.Table, one typed array per column."""
+    arrays = [pa.array([r[i] for r in rows], type=schema.field(i).type if schema else None)
+              for i in range(len(columns))]
+    return pa.Table.from_arrays(arrays, schema=schema) if schema else pa.Table.from_arrays(arrays, names=columns)
+
+
+def write_rows(path, columns, rows, fmt, compression="zstd"):
+    """Write a whole (already fetched) result as a single Parquet or Arrow IPC file."""
+    require_pyarrow()
+    table = rows_table(columns, rows)
+    if fmt == "parquet":
+        pq.write_table(table, path, compression=compression)
+    else:
+        options = pa.ipc.IpcWriteOptions(compression=compression)
+        with pa.ipc.new_file(path, table.schema, options=options) as writer:
+            writer.write_table(table)
+
+
+class PartitionWriter:
+    """Keeps one partition file open; rows arrive ordered by date, so a partition never reopens."""
+
+    def __init__(self, out_dir, schema, fmt, compression):
+        self.out_dir = out_dir
+        self.schema = schema
+        self.fmt = fmt
+        self.compression = compression
+        self.key = None
+        self.writer = None
+        self.partitions = 0
+
+    def open(self, key):
+        self.close()
+        directory = os.path.join(self.out_dir, f"year={key[0]}", f"month={key[1]:02d}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, "part-0" + SUFFIXES[self.fmt])
+        if self.fmt == "parquet":
+            self.writer = pq.ParquetWriter(path, self.schema, compression=self.compression)
+        else:
+            options = pa.ipc.IpcWriteOptions(compression=self.compression)
+            self.writer = pa.ipc.new_file(path, self.schema, options=options)
+        self.key = key
+        self.partitions += 1
+
+    def write(self, rows):
+        if not rows:
+            return
+        if self.fmt == "parquet":
+            self.writer.write_table(rows_table(self.schema.names, rows, self.schema))
+        else:
+            self.writer.write_batch(pa.RecordBatch.from_arrays(
+                [pa.array([r[i] for r in rows], type=f.type) for i, f in enumerate(self.schema)],
+                schema=self.schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def check_snapshot_dir(out_dir):
+    """Refuse to write into (or replace) a directory that holds anything but snapshot partitions."""
+    if not os.path.isdir(out_dir):
+        raise RuntimeError(f"{out_dir} exists and is not a directory")
+    for d, _, files in os.walk(out_dir):
+        for f in files:
+            rel = os.path.relpath(os.path.join(d, f), out_dir).replace(os.sep, "/")
+            if not PARTITION_FILE.fullmatch(rel):
+                raise RuntimeError(f"{out_dir} is not a snapshot directory ({rel}); choose another --out-dir")
+
+
+def snapshot(args):
+    require_pyarrow()
+    from main import connection_info   # main imports this module, so not at module level
+
+    if os.path.exists(args.out_dir):
+        check_snapshot_dir(args.out_dir)
+    # a full snapshot is built next to the old one and swapped in only once it is complete
+    target = args.out_dir if args.append else os.path.realpath(args.out_dir) + ".tmp"
+    if not args.append and os.path.exists(target):
+        shutil.rmtree(target)
+    where = "WHERE o.orderdate >= %s\n" if args.since else ""
+    conn = psycopg2.connect(**connection_info(args))
+    writer = PartitionWriter(target, snapshot_schema(), args.format, args.compression)
+    start = time.time()
+    total = 0
+    try:
+        cur = conn.cursor(name="sales_snapshot")
+        cur.itersize = args.batch_size
+        cur.execute(SNAPSHOT_SQL.format(where=where), (args.since,) if args.since else None)
+        while True:
+            batch = cur.fetchmany(args.batch_size)
+            if not batch:
+                break
+            # split the batch at month boundaries
+            pending = []
+            for row in batch:
+                key = (row[0].year, row[0].month)
+                if key != writer.key:
+                    if writer.key is not None:
+                        writer.write(pending)
+                    pending = []
+                    writer.open(key)
+                pending.append(row)
+            writer.write(pending)
+            total += len(batch)
+        cur.close()
+    finally:
+        writer.close()
+        conn.close()
+    if not args.append:
+        os.makedirs(target, exist_ok=True)   # an empty result still replaces the old snapshot
+        if os.path.exists(args.out_dir):
+            old = os.path.realpath(args.out_dir) + ".old"
+            if os.path.exists(old):
+                shutil.rmtree(old)
+            os.replace(args.out_dir, old)
+            os.replace(target, args.out_dir)
+            shutil.rmtree(old)
+        else:
+            os.replace(target, args.out_dir)
+
+    elapsed = time.time() - start
+    size = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(args.out_dir) for f in files)
+    print(f"Snapshot: {total} rows in {writer.partitions} partitions, {size / 1048576:.2f} MiB "
+          f"({args.format}, {args.compression}) in {elapsed:.1f}s -> {args.out_dir}")
+
+
+def main():
+    from main import add_connection_args
+
+    parser = argparse.ArgumentParser(description="Columnar exports of the classicmodels sales data.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    snap = sub.add_parser("snapshot", help="Export the order-line fact partitioned by year/month")
+    add_connection_args(snap)
+    snap.add_argument("--out-dir", dest="out_dir", default="sales_snapshot",
+                      help="Output directory (default: sales_snapshot; replaced after a successful run unless --append)")
+    snap.add_argument("--format", choices=("parquet", "arrow"), default="parquet",
+                      help="File format (default: parquet)")
+    snap.add_argument("--compression", default="zstd", help="Codec: zstd, lz4, snappy (parquet only), none")
+    snap.add_argument("--batch-size", dest="batch_size", type=int, default=50000,
+                      help="Rows fetched and written per batch (default: 50000)")
+    snap.add_argument("--since", default="",
+                      help="Only orders on or after this date (YYYY-MM-DD); use with --append for newer months "
+                           "(then rounded down to the first of its month)")
+    snap.add_argument("--append", action="store_true",
+                      help="Keep the existing output directory; partitions that are re-exported are overwritten")
+    args = parser.parse_args()
+    if args.compression == "none":
+        args.compression = None
+    if args.since:
+        try:
+            args.since = date.fromisoformat(args.since)
+        except ValueError:
+            parser.error("--since must be a date (YYYY-MM-DD)")
+        if args.append and args.since.day != 1:
+            # a re-exported month is rewritten from scratch, so it must be re-exported in full
+            args.since = args.since.replace(day=1)
+            print(f"--append: --since rounded down to {args.since} so {args.since:%Y-%m} is re-exported in full")
+
+    try:
+        snapshot(args)
+    except Exception as e:
+        print("Snapshot failed:", e, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Scale-factor, multi-process synthetic data generation for the classicmodels schema.
+
+`generate` splits every entity range (offices, employees, products, customers, orders and their
+lines/payments) into deterministic shards. Each shard runs in its own process with its own seeded
+RNG and writes one CSV chunk per table:
+
+    <out-dir>/<table>/part-<shard>.csv
+
+so the same --seed/--scale-factor/--shards/--as-of always produces the same files (dates count back from
+--as-of, default today; the parameters are written to <out-dir>/manifest.json). Faker is only used to
+fill small value pools (names, cities, companies, ...) once per shard; every column is then drawn
+from those pools and from NumPy in vectorized batches. --zipf S gives customers and products a
+Zipf-like popularity (weight ~ 1/rank^S) so a few of them get most of the orders.
+
+`load` COPYs the chunks table by table (parents first), with N files loading in parallel on
+separate connections. Each chunk goes through a staging table and INSERT ... ON CONFLICT DO NOTHING,
+so reloading is harmless.
+
+  python datagen.py generate --scale-factor 50 --shards 16 --workers 8 --out-dir chunks
+  python datagen.py load --out-dir chunks --workers 8
+"""
+
+import argparse
+import csv
+import datetime
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    import numpy as np
+except Exception as e:
+    print("Missing dependency 'numpy'. Install with: pip install numpy", file=sys.stderr)
+    raise
+
+from faker import Faker
+
+from script import COLUMNS, MAX, PRODUCTLINES, TABLE_ORDER, connect, has_orderdate, merge_sql, scaled_counts
+
+POOL_SIZE = 2000
+STATUSES = ["Shipped", "Resolved", "In Process", "On Hold"]
+JOB_TITLES = ["Sales Rep", "Manager", "VP", "Engineer", "Clerk"]
+VENDORS = ["Min Lin Diecast", "Highway 66", "AutoArt Studio", "ClassicVendor", "VendorCo"]
+SCALES = ["1:10", "1:12", "1:18", "1:24"]
+NAME_SUFFIXES = ["Model", "Replica", "Series", "Edition"]
+# same first ids as script.py
+FIRST_EMPLOYEE, FIRST_PRODUCT, FIRST_CUSTOMER, FIRST_ORDER = 1001, 2001, 3001, 5001
+NUM_MANAGERS = 5
+DAYS_OF_HISTORY = 730
+
+
+def shard_range(n, shards, shard):
+    """[start, stop) slice of 0..n-1 owned by `shard`."""
+    return n * shard // shards, n * (shard + 1) // shards
+
+
+def product_prices(seed, n):
+    """buyprice/msrp of every product. Every shard computes the same vector, so order lines can
+    price any product without reading the product shards."""
+    rng = np.random.default_rng([seed, 0x5052494345])
+    buy = np.round(rng.uniform(10, 500, n), 2)
+    msrp = np.round(buy * rng.uniform(1.1, 2.5, n), 2)
+    return buy, msrp
+
+
+def popularity(seed, n, skew):
+    """Selection probabilities for n ids: uniform, or Zipf-like over a seeded random ranking."""
+    if skew <= 0:
+        return None
+    rng = np.random.default_rng([seed, 0x5A495046, n])
+    weights = 1.0 / np.arange(1, n + 1) ** skew
+    weights = weights[rng.permutation(n)]
+    return weights / weights.sum()
+
+
+def pick(rng, n, size, p=None):
+    return rng.choice(n, size=size, p=p) if p is not None else rng.integers(0, n, size)
+
+
+def value_pool(fake, method, size=POOL_SIZE, col=None, **kwargs):
+    values = [str(getattr(fake, method)(**kwargs)) for _ in range(size)]
+    if col and col in MAX:
+        values = [v[:MAX[col]] for v in values]
+    return np.array(values, dtype=object)
+
+
+def fmt_money(values):
+    return [f"{v:.2f}" for v in values]
+
+
+def write_chunk(out_dir, table, shard, columns):
+    """Write column arrays (same length) as <out_dir>/<table>/part-<shard>.csv; None -> NULL."""
+    path = os.path.join(out_dir, table, f"part-{shard:04d}.csv")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows(zip(*columns))
+    return len(columns[0]) if columns else 0
+
+
+def generate_shard(job):
+    """Generate every table's slice for one shard (runs in a worker process)."""
+    seed, shard, shards, counts, skew, out_dir, as_of = job
+    start = time.time()
+    rng = np.random.default_rng([seed, shard])
+    fake = Faker()
+    fake.seed_instance(seed * 100003 + shard)
+    pools = {
+        "first": value_pool(fake, "first_name", col="contactfirstname"),
+        "last": value_pool(fake, "last_name", col="contactlastname"),
+        "company": value_pool(fake, "company", col="customername"),
+        "city": value_pool(fake, "city", col="city"),
+        "country": value_pool(fake, "country", col="country"),
+        "phone": value_pool(fake, "phone_number", col="phone"),
+        "street": value_pool(fake, "street_address", col="addressline1"),
+        "postcode": value_pool(fake, "postcode", col="postalcode"),
+        "word": value_pool(fake, "word"),
+        "sentence": value_pool(fake, "sentence", nb_words=12),
+    }
+
+    def draw(pool, size):
+        return pools[pool][rng.integers(0, len(pools[pool]), size)]
+
+    written = {}
+
+    if shard == 0:
+        lines = PRODUCTLINES[:counts["productlines"]]
+        written["productlines"] = write_chunk(out_dir, "productlines", shard,
+                                              [[pl for pl, _ in lines], [d for _, d in lines]])
+
+    # offices
+    lo, hi = shard_range(counts["offices"], shards, shard)
+    n = hi - lo
+    written["offices"] = write_chunk(out_dir, "offices", shard, [
+        [str(101 + i) for i in range(lo, hi)], draw("city", n), draw("phone", n), draw("street", n),
+        draw("country", n), draw("postcode", n), [f"T{i % 100:02d}" for i in range(lo, hi)]])
+
+    # employees (the first NUM_MANAGERS report to nobody, the rest to one of them)
+    lo, hi = shard_range(counts["employees"], shards, shard)
+    n = hi - lo
+    first, last = draw("first", n), draw("last", n)
+    ids = np.arange(lo, hi)
+    managers = FIRST_EMPLOYEE + rng.integers(0, NUM_MANAGERS, n)
+    written["employees"] = write_chunk(out_dir, "employees", shard, [
+        (FIRST_EMPLOYEE + ids).tolist(), last, first,
+        [f"x{v}" for v in rng.integers(100, 1000, n)],
+        [f"{f.lower()}.{l.lower()}@example.com"[:MAX["email"]] for f, l in zip(first, last)],
+        [str(101 + v) for v in rng.integers(0, counts["offices"], n)],
+        [None if i < NUM_MANAGERS else int(m) for i, m in zip(ids, managers)],
+        np.array(JOB_TITLES, dtype=object)[rng.integers(0, len(JOB_TITLES), n)]])
+
+    # products
+    buy, msrp = product_prices(seed, counts["products"])
+    lo, hi = shard_range(counts["products"], shards, shard)
+    n = hi - lo
+    line_names = np.array([pl for pl, _ in PRODUCTLINES[:counts["productlines"]]], dtype=object)
+    suffixes = np.array(NAME_SUFFIXES, dtype=object)[rng.integers(0, len(NAME_SUFFIXES), n)]
+    written["products"] = write_chunk(out_dir, "products", shard, [
+        [f"P{FIRST_PRODUCT + i}" for i in range(lo, hi)],
+        [f"{w.capitalize()} {s}"[:MAX["productname"]] for w, s in zip(draw("word", n), suffixes)],
+        line_names[rng.integers(0, len(line_names), n)],
+        np.array(SCALES, dtype=object)[rng.integers(0, len(SCALES), n)],
+        np.array(VENDORS, dtype=object)[rng.integers(0, len(VENDORS), n)],
+        draw("sentence", n), rng.integers(0, 1001, n).tolist(),
+        fmt_money(buy[lo:hi]), fmt_money(msrp[lo:hi])])
+
+    # customers (sales rep is None with the same odds as script.py: 5 extra None slots)
+    lo, hi = shard_range(counts["customers"], shards, shard)
+    n = hi - lo
+    reps = rng.integers(0, counts["employees"] + 5, n)
+    written["customers"] = write_chunk(out_dir, "customers", shard, [
+        (FIRST_CUSTOMER + np.arange(lo, hi)).tolist(), draw("company", n), draw("last", n),
+        draw("first", n), draw("phone", n), draw("street", n), draw("city", n), draw("country", n),
+        [int(FIRST_EMPLOYEE + r) if r < counts["employees"] else None for r in reps],
+        fmt_money(np.round(rng.uniform(1000, 50000, n), 2))])
+
+    # orders and their lines
+    lo, hi = shard_range(counts["orders"], shards, shard)
+    n = hi - lo
+    order_ids = FIRST_ORDER + np.arange(lo, hi)
+    cust = FIRST_CUSTOMER + pick(rng, counts["customers"], n, popularity(seed, counts["customers"], skew))
+    order_days = rng.integers(0, DAYS_OF_HISTORY + 1, n)
+    order_dates = [as_of - datetime.timedelta(days=int(d)) for d in order_days]
+    req_offset = rng.integers(7, 31, n)
+    ship_offset = rng.integers(1, 11, n)
+    shipped = rng.random(n) < 0.9
+    written["orders"] = write_chunk(out_dir, "orders", shard, [
+        order_ids.tolist(), order_dates,
+        [d + datetime.timedelta(days=int(o)) for d, o in zip(order_dates, req_offset)],
+        [d + datetime.timedelta(days=int(o)) if s else None for d, o, s in zip(order_dates, ship_offset, shipped)],
+        np.array(STATUSES, dtype=object)[rng.integers(0, len(STATUSES), n)], [None] * n, cust.tolist()])
+
+    lines_per_order = rng.integers(1, 6, n)
+    total = int(lines_per_order.sum())
+    line_order = np.repeat(order_ids, lines_per_order)
+    # 1..k within each order
+    line_no = np.arange(total) - np.repeat(np.cumsum(lines_per_order) - lines_per_order, lines_per_order) + 1
+    prod = pick(rng, counts["products"], total, popularity(seed, counts["products"], skew))
+    top = msrp[prod]
+    price = np.round(rng.uniform(np.maximum(0.01, top * 0.7), top), 2)
+    written["orderdetails"] = write_chunk(out_dir, "orderdetails", shard, [
+        line_order.tolist(), [f"P{FIRST_PRODUCT + p}" for p in prod],
+        rng.integers(1, 51, total).tolist(), fmt_money(price), line_no.tolist()])
+
+    # payments: 0..3 per customer of this shard
+    lo, hi = shard_range(counts["customers"], shards, shard)
+    per_customer = rng.integers(0, 4, hi - lo)
+    total = int(per_customer.sum())
+    pay_days = rng.integers(0, DAYS_OF_HISTORY + 1, total)
+    written["payments"] = write_chunk(out_dir, "payments", shard, [
+        np.repeat(FIRST_CUSTOMER + np.arange(lo, hi), per_customer).tolist(),
+        [f"CHK{v}" for v in rng.integers(100000, 1000000, total)],
+        [as_of - datetime.timedelta(days=int(d)) for d in pay_days],
+        fmt_money(np.round(rng.uniform(50, 20000, total), 2))])
+
+    return shard, written, time.time() - start
+
+
+def generate(args):
+    counts = scaled_counts(args.scale_factor)
+    print(f"Generating scale factor {args.scale_factor} into {args.shards} shards as of {args.as_of}: {counts}")
+    start = time.time()
+    os.makedirs(args.out_dir, exist_ok=True)
+    with open(os.path.join(args.out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({"seed": args.seed, "scale_factor": args.scale_factor, "shards": args.shards, "zipf": args.zipf,
+                   "as_of": args.as_of.isoformat(), "counts": counts}, f, indent=2)
+    jobs = [(args.seed, shard, args.shards, counts, args.zipf, args.out_dir, args.as_of)
+            for shard in range(args.shards)]
+    totals = {t: 0 for t in TABLE_ORDER}
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for shard, written, elapsed in executor.map(generate_shard, jobs):
+            for table, rows in written.items():
+                totals[table] += rows
+            print(f"  shard {shard:4d} done in {elapsed:.2f}s")
+    elapsed = time.time() - start
+    rows = sum(totals.values())
+    print(f"Generated {rows} rows in {elapsed:.2f}s ({rows / (elapsed or 1e-9):,.0f} rows/s)")
+    for table in TABLE_ORDER:
+        print(f"  {table:<13} {totals[table]:>12} rows")
+
+
+def load_file(table, path):
+    """COPY one chunk into a staging table and merge it; own connection, own transaction."""
+    cols = ", ".join(COLUMNS[table])
+    stage = f"stage_{table}"
+    conn = connect()
+    try:
+        cur = conn.cursor()
+        cur.execute(f"CREATE TEMP TABLE {stage} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP")
+        with open(path, encoding="utf-8") as f:
+            cur.copy_expert(f"COPY {stage} ({cols}) FROM STDIN WITH (FORMAT csv)", f)
+        rows = cur.rowcount
+        cur.execute(merge_sql(table, f"{stage} s", has_orderdate(cur)))
+        conn.commit()
+        cur.close()
+        return rows
+    finally:
+        conn.close()
+
+
+def load(args):
+    start = time.time()
+    for table in TABLE_ORDER:
+        files = sorted(glob.glob(os.path.join(args.out_dir, table, "part-*.csv")))
+        if not files:
+            continue
+        table_start = time.time()
+        # employees reference their managers (in part-0000), so that table loads in file order
+        workers = 1 if table == "employees" else args.workers
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            rows = sum(executor.map(lambda path: load_file(table, path), files))
+        elapsed = time.time() - table_start
+        print(f"  {table:<13} {rows:>12} rows  {len(files):4d} files  {elapsed:8.2f}s  "
+              f"{rows / (elapsed or 1e-9):12,.0f} rows/s")
+    print(f"Load finished in {time.time() - start:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded, multi-process classicmodels data generator.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    gen = sub.add_parser("generate", help="Write deterministic CSV chunks for every table")
+    gen.add_argument("--scale-factor", dest="scale_factor", type=float, default=1.0,
+                     help="Multiply all entity counts of script.py (default: 1.0)")
+    gen.add_argument("--shards", type=int, default=os.cpu_count() or 1, help="Number of shards (default: CPU count)")
+    gen.add_argument("--zipf", type=float, default=0.0,
+                     help="Zipf exponent for customer/product popularity, 0 = uniform (default: 0)")
+    gen.add_argument("--seed", type=int, default=42, help="Base seed (default: 42)")
+    gen.add_argument("--as-of", dest="as_of", type=datetime.date.fromisoformat, default=datetime.date.today(),
+                     help="Date the generated order/payment history ends on, YYYY-MM-DD (default: today)")
+    ld = sub.add_parser("load", help="COPY generated chunks into the database")
+    for p in (gen, ld):
+        p.add_argument("--out-dir", dest="out_dir", default="chunks", help="Chunk directory (default: chunks)")
+        p.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                       help="Parallel processes (generate) or connections (load) (default: CPU count)")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "generate":
+            generate(args)
+        else:
+            load(args)
+    except Exception as e:
+        print("Data generation failed:", e, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
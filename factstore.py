@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped columnar store of the Full Sales Data order-line fact, for in-process analysis.
+
+Pulling the order-line join through RealDictCursor costs a dict plus a boxed Python object per value, hundreds
+of bytes per row. `build` streams the same eight columns from a server-side cursor into flat little-endian
+arrays instead, one file per column:
+
+  sales_fact/
+    meta.json               row count, column types, the string dictionaries, source and build time
+    orderdate.i4            days since 1970-01-01 (int32); rows are sorted by orderdate
+    quantityordered.i4      int32
+    priceeach.i8            fixed point at the column's NUMERIC scale (cents for NUMERIC(10,2)), int64
+    status.u1, country.u1, productline.u1, customername.u2, ...
+                            dictionary codes, the narrowest unsigned width that fits the dictionary
+
+That is about 22 bytes per row, so tens of millions of order lines fit in RAM. Dictionaries are sorted, so
+code order is value order; a NULL (a customer without a country, say) gets the last code, as NULLS LAST. They are read from the dimension tables in the same REPEATABLE READ transaction as
+the fact, so every value has a code.
+
+FactStore maps the files read-only with mmap. With NumPy the columns are zero-copy arrays
+(np.frombuffer); without it they are memoryviews, which still index, slice and bisect.
+
+  from factstore import FactStore
+  store = FactStore("sales_fact")
+  rows = store.day_range("2004-01-01", "2004-12-31")        # slice, by binary search on orderdate
+  shipped = store["status"][rows] == store.code("status", "Shipped")
+  revenue_cents = store["quantityordered"][rows] * store["priceeach"][rows]
+
+CLI:
+  python factstore.py build --dbname classicmodels --user postgres --out-dir sales_fact
+  python factstore.py info --dir sales_fact
+  python factstore.py summary --dir sales_fact --by country --since 2004-01-01 --status Shipped
+"""
+
+import argparse
+import bisect
+import json
+import mmap
+import os
+import shutil
+import sys
+import time
+from array import array
+from datetime import date, datetime
+from decimal import Decimal
+
+try:
+    import psycopg2
+except Exception as e:
+    print("Missing dependency 'psycopg2'. Install with: pip install psycopg2-binary", file=sys.stderr)
+    raise
+
+try:
+    import numpy as np
+    HAVE_NUMPY = True
+except Exception:
+    HAVE_NUMPY = False
+
+EPOCH = date(1970, 1, 1)
+
+# file suffix -> (array typecode, numpy dtype, bytes)
+TYPES = {
+    "i4": ("i", "<i4", 4),
+    "i8": ("q", "<i8", 8),
+    "u1": ("B", "u1", 1),
+    "u2": ("H", "<u2", 2),
+    "u4": ("I", "<u4", 4),
+}
+
+FACT_SQL = (
+    "SELECT o.orderdate, o.status, c.customername, c.country,\n"
+    "       od.quantityordered, od.priceeach, p.productline, p.productname\n"
+    "FROM classicmodels.orders o\n"
+    "JOIN classicmodels.orderdetails od ON o.ordernumber = od.ordernumber\n"
+    "JOIN classicmodels.products p ON od.productcode = p.productcode\n"
+    "JOIN classicmodels.customers c ON o.customernumber = c.customernumber\n"
+    "ORDER BY o.orderdate, o.ordernumber"
+)
+
+# dictionary-encoded columns and where their values come from
+DICTIONARY_SQL = {
+    "status": "SELECT DISTINCT status FROM classicmodels.orders",
+    "customername": "SELECT DISTINCT customername FROM classicmodels.customers",
+    "country": "SELECT DISTINCT country FROM classicmodels.customers",
+    "productline": "SELECT DISTINCT productline FROM classicmodels.products",
+    "productname": "SELECT DISTINCT productname FROM classicmodels.products",
+}
+
+PRICE_SCALE_SQL = (
+    "SELECT numeric_scale FROM information_schema.columns\n"
+    "WHERE table_schema = 'classicmodels' AND table_name = 'orderdetails' AND column_name = 'priceeach';"
+)
+
+
+def code_type(size):
+    return "u1" if size <= 1 << 8 else "u2" if size <= 1 << 16 else "u4"
+
+
+def file_name(name, column):
+    return f"{name}.{column['type']}"
+
+
+class ColumnWriter:
+    """Appends one column's values as fixed-width little-endian integers."""
+
+    def __init__(self, directory, name, column):
+        self.typecode = TYPES[column["type"]][0]
+        if array(self.typecode).itemsize != TYPES[column["type"]][2]:
+            raise RuntimeError(f"array typecode {self.typecode!r} is not {TYPES[column['type']][2]} bytes here")
+        self.f = open(os.path.join(directory, file_name(name, column)), "wb")
+
+    def write(self, values):
+        data = array(self.typecode, values)
+        if sys.byteorder == "big":
+            data.byteswap()
+        data.tofile(self.f)
+
+    def close(self):
+        self.f.close()
+
+
+def check_out_dir(out_dir):
+    """Refuse to replace anything but a store written by `build` (a directory with meta.json)."""
+    if os.path.exists(out_dir) and not os.path.isfile(os.path.join(out_dir, "meta.json")):
+        raise RuntimeError(f"{out_dir} exists and is not a fact store (no meta.json); choose another --out-dir")
+
+
+def build(conn, args, conn_info):
+    start = time.time()
+    check_out_dir(args.out_dir)
+    conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+    cur = conn.cursor()
+    cur.execute(PRICE_SCALE_SQL)
+    row = cur.fetchone()
+    scale = row[0] if row and row[0] is not None else 2
+    dictionaries = {}
+    for name, sql in DICTIONARY_SQL.items():
+        cur.execute(sql)
+        dictionaries[name] = sorted((v for (v,) in cur.fetchall()), key=lambda v: (v is None, v or ""))
+    cur.close()
+
+    columns = {
+        "orderdate": {"type": "i4", "kind": "date", "unit": "days since 1970-01-01"},
+        "status": None, "customername": None, "country": None,
+        "quantityordered": {"type": "i4", "kind": "int"},
+        "priceeach": {"type": "i8", "kind": "decimal", "scale": scale},
+        "productline": None, "productname": None,
+    }
+    for name, values in dictionaries.items():
+        columns[name] = {"type": code_type(len(values)), "kind": "dictionary", "values": values}
+    names = list(columns)   # FACT_SQL column order
+    codes = {name: {v: i for i, v in enumerate(values)} for name, values in dictionaries.items()}
+    factor = 10 ** scale
+
+    tmp = os.path.realpath(args.out_dir) + ".tmp"
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+    writers = [ColumnWriter(tmp, name, columns[name]) for name in names]
+    total = 0
+    try:
+        source = conn.cursor(name="fact_store")
+        source.itersize = args.batch_size
+        source.execute(FACT_SQL)
+        while True:
+            batch = source.fetchmany(args.batch_size)
+            if not batch:
+                break
+            for i, (name, writer) in enumerate(zip(names, writers)):
+                values = [r[i] for r in batch]
+                kind = columns[name]["kind"]
+                if kind == "dictionary":
+                    lookup = codes[name]
+                    values = [lookup[v] for v in values]
+                elif None in values:
+                    raise RuntimeError(f"NULL in {name}; the store has no null bitmap for numeric columns")
+                elif kind == "date":
+                    values = [(v - EPOCH).days for v in values]
+                elif kind == "decimal":
+                    values = [int(v * factor) for v in values]
+                writer.write(values)
+            total += len(batch)
+        source.close()
+    finally:
+        for writer in writers:
+            writer.close()
+        conn.rollback()
+
+    meta = {
+        "rows": total,
+        "columns": columns,
+        "order": names,
+        "sorted_by": "orderdate",
+        "byteorder": "little",
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "source": "{host}:{port}/{dbname}".format(**{k: conn_info.get(k) for k in ("host", "port", "dbname")}),
+    }
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    # readers that still have the old files mapped keep their (unlinked) copy until they close
+    if os.path.exists(args.out_dir):
+        old = os.path.realpath(args.out_dir) + ".old"
+        if os.path.exists(old):
+            shutil.rmtree(old)
+        os.replace(args.out_dir, old)
+        os.replace(tmp, args.out_dir)
+        shutil.rmtree(old)
+    else:
+        os.replace(tmp, args.out_dir)
+
+    size = sum(os.path.getsize(os.path.join(args.out_dir, f)) for f in os.listdir(args.out_dir))
+    print(f"Fact store: {total} rows, {size / 1048576:.2f} MiB ({size / max(total, 1):.1f} bytes/row) "
+          f"in {time.time() - start:.1f}s -> {args.out_dir}")
+
+
+class FactStore:
+    """Read-only, memory-mapped view of a store written by `build`."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.rows = self.meta["rows"]
+        self.columns = self.meta["columns"]
+        if not HAVE_NUMPY and sys.byteorder != "little":
+            raise RuntimeError("reading the store without NumPy needs a little-endian machine")
+        self._files = []
+        self._maps = []
+        self._arrays = {}
+
+    def __getitem__(self, name):
+        """The column as a numpy array (or memoryview without NumPy); dictionary columns give codes."""
+        if name not in self._arrays:
+            column = self.columns[name]
+            typecode, dtype, _ = TYPES[column["type"]]
+            f = open(os.path.join(self.directory, file_name(name, column)), "rb")
+            self._files.append(f)
+            if not self.rows:
+                data = b""
+            else:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps.append(data)
+            self._arrays[name] = np.frombuffer(data, dtype=dtype) if HAVE_NUMPY else memoryview(data).cast(typecode)
+        return self._arrays[name]
+
+    def dictionary(self, name):
+        return self.columns[name]["values"]
+
+    def code(self, name, value):
+        """Dictionary code of `value` (None for NULL) in column `name`; KeyError when it does not occur."""
+        values = self.dictionary(name)
+        strings = len(values) - 1 if values and values[-1] is None else len(values)
+        if value is None:
+            if strings == len(values):
+                raise KeyError(f"NULL does not occur in {name}")
+            return strings
+        i = bisect.bisect_left(values, value, 0, strings)
+        if i == strings or values[i] != value:
+            raise KeyError(f"{value!r} does not occur in {name}")
+        return i
+
+    def decode(self, name, codes):
+        values = self.dictionary(name)
+        return [values[c] for c in codes]
+
+    def day_range(self, since=None, until=None):
+        """Row slice with since <= orderdate <= until (ISO dates or date objects; None is open-ended)."""
+        days = self["orderdate"]
+        search = (lambda side, d: int(np.searchsorted(days, d, side))) if HAVE_NUMPY else \
+            (lambda side, d: (bisect.bisect_left if side == "left" else bisect.bisect_right)(days, d))
+        lo, hi = 0, self.rows
+        if since:
+            lo = search("left", (date.fromisoformat(str(since)) - EPOCH).days)
+        if until:
+            hi = search("right", (date.fromisoformat(str(until)) - EPOCH).days)
+        return slice(lo, max(lo, hi))
+
+    def dates(self, rows=slice(None)):
+        """orderdate as numpy datetime64[D] (NumPy) or datetime.date objects."""
+        days = self["orderdate"][rows]
+        if HAVE_NUMPY:
+            return days.astype("datetime64[D]")
+        return [date.fromordinal(EPOCH.toordinal() + d) for d in days]
+
+    def decimal(self, name, value):
+        """A fixed-point value (e.g. a sum of priceeach cents) as the exact Decimal."""
+        return Decimal(int(value)).scaleb(-self.columns[name]["scale"])
+
+    def close(self):
+        self._arrays.clear()
+        for m in self._maps:
+            m.close()
+        for f in self._files:
+            f.close()
+        self._maps, self._files = [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def group_sums(store, by, rows, status=None):
+    """{code: [lines, units, revenue in price units]} for the rows in slice `rows` (optionally one status)."""
+    codes, qty, price = store[by][rows], store["quantityordered"][rows], store["priceeach"][rows]
+    wanted = store.code("status", status) if status is not None else None
+    if HAVE_NUMPY:
+        mask = store["status"][rows] == wanted if status is not None else slice(None)
+        codes, qty = codes[mask], qty[mask].astype(np.int64)
+        line = qty * price[mask]
+        size = len(store.dictionary(by))
+        lines = np.bincount(codes, minlength=size)
+        units = np.bincount(codes, weights=qty, minlength=size)
+        if int(np.abs(line).sum()) < 1 << 53:
+            # every partial sum is an integer below 2**53, so the float64 bincount is exact
+            revenue = np.bincount(codes, weights=line, minlength=size)
+        else:
+            revenue = np.zeros(size, dtype=np.int64)
+            np.add.at(revenue, codes, line)
+        return {c: [int(lines[c]), int(units[c]), int(revenue[c])] for c in np.flatnonzero(lines)}
+    sums = {}
+    statuses = store["status"][rows]
+    for i, (c, q, p) in enumerate(zip(codes, qty, price)):
+        if wanted is not None and statuses[i] != wanted:
+            continue
+        s = sums.setdefault(c, [0, 0, 0])
+        s[0] += 1
+        s[1] += q
+        s[2] += q * p
+    return sums
+
+
+def summary(args):
+    from main import print_table
+
+    with FactStore(args.dir) as store:
+        if store.columns.get(args.by, {}).get("kind") != "dictionary":
+            raise ValueError(f"--by must be one of {', '.join(DICTIONARY_SQL)}")
+        start = time.time()
+        rows = store.day_range(args.since or None, args.until or None)
+        sums = group_sums(store, args.by, rows, args.status or None)
+        elapsed = time.time() - start
+        result = sorted(((store.dictionary(args.by)[c], lines, units, store.decimal("priceeach", revenue))
+                         for c, (lines, units, revenue) in sums.items()), key=lambda r: r[3], reverse=True)
+        engine = "NumPy" if HAVE_NUMPY else "pure Python (install numpy for vectorized scans)"
+        print(f"Scanned {rows.stop - rows.start} of {store.rows} rows in {elapsed * 1000:.1f} ms ({engine})")
+        print_table(f"Order lines by {args.by}", [args.by, "lines", "units", "revenue"], result)
+
+
+def info(args):
+    with FactStore(args.dir) as store:
+        meta = store.meta
+        print(f"{args.dir}: {store.rows} rows, built {meta['created']} from {meta['source']}")
+        total = 0
+        for name in meta["order"]:
+            column = store.columns[name]
+            size = os.path.getsize(os.path.join(args.dir, file_name(name, column)))
+            total += size
+            extra = f", {len(column['values'])} distinct values" if column["kind"] == "dictionary" else ""
+            print(f"  {name:<16} {column['type']}  {column['kind']:<10} {size / 1048576:8.2f} MiB{extra}")
+        print(f"  {total / max(store.rows, 1):.1f} bytes/row")
+
+
+def main():
+    from main import add_connection_args, connection_info
+
+    parser = argparse.ArgumentParser(description="Memory-mapped columnar store of the order-line fact.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_p = sub.add_parser("build", help="Stream the Full Sales Data join into the store")
+    add_connection_args(build_p)
+    build_p.add_argument("--out-dir", dest="out_dir", default="sales_fact",
+                         help="Store directory (default: sales_fact; an existing store is replaced)")
+    build_p.add_argument("--batch-size", dest="batch_size", type=int, default=50000,
+                         help="Rows fetched and encoded per batch (default: 50000)")
+    info_p = sub.add_parser("info", help="Columns, sizes and dictionary cardinalities")
+    info_p.add_argument("--dir", default="sales_fact", help="Store directory (default: sales_fact)")
+    sum_p = sub.add_parser("summary", help="Lines, units and exact revenue grouped by a string column")
+    sum_p.add_argument("--dir", default="sales_fact", help="Store directory (default: sales_fact)")
+    sum_p.add_argument("--by", default="country", help="Dictionary column to group by (default: country)")
+    sum_p.add_argument("--since", default="", help="First orderdate (YYYY-MM-DD)")
+    sum_p.add_argument("--until", default="", help="Last orderdate (YYYY-MM-DD)")
+    sum_p.add_argument("--status", default="", help="Only order lines with this order status")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "build":
+            conn_info = connection_info(args)
+            conn = psycopg2.connect(**conn_info)
+            try:
+                build(conn, args, conn_info)
+            finally:
+                conn.close()
+        elif args.command == "info":
+            info(args)
+        else:
+            summary(args)
+    except Exception as e:
+        print(f"{args.command} failed:", e, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,606 @@
+#!/usr/bin/env python3
+"""
+Run the report suite across several classicmodels databases (one per region) and merge the results.
+
+Every shard gets one connection and one worker thread. Shards compute mergeable partials instead of the final
+reports, and the coordinator combines them:
+  - sums and counts (reports 1, 3, 5 and the stock/units of 9) are added;
+  - averages (4, 7, 10) travel as sum/count pairs and are divided once, with the NUMERIC result scale Postgres
+    uses for AVG (offline.numeric_divide), so the digits match a single-database run;
+  - LIMIT reports (2, 4, 6, 8) fetch an over-fetched top `limit * --overfetch` per shard. These candidates'
+    exact partials are then completed from the shards that did not return them. The result is accepted once
+    no unseen entity can beat the k-th merged value: for sums, the bound is the sum of every shard's last
+    returned value; for averages and ratios, it is the highest (lowest) of them. Otherwise the per-shard
+    limit is raised and the round repeated. The top k is therefore exact, not approximate.
+
+Rows are merged on the report's GROUP BY key (country, productcode, customernumber, employeenumber, ...), so an
+entity with the same key in several shards is combined. Orders and customers are assumed to live in exactly
+one shard, so per-shard COUNT(DISTINCT ...) values add up. Report 9 sums quantityinstock across regions before
+applying the low-stock filter.
+
+The first phase is one parallel pass over all shards, so the wall time tracks the slowest shard rather than
+the sum. The refinement rounds for the LIMIT reports are small keyed lookups.
+
+  python fanout.py --dsn "host=eu-db dbname=classicmodels user=postgres" --dsn "host=us-db dbname=classicmodels"
+  python fanout.py --dsn-file shards.txt --save-csv --csv-dir ./global
+  python fanout.py --dsn-file shards.txt --param limit=25 --param 9_low_stock_products_with_sales_last_6m.months=3
+
+The partial SQL keeps the registry reports' parameter slots ({months}) and is rendered through reports.Report,
+so --param values and the registry defaults apply to fan-out exactly as to a single-database run.
+The stopping rule (TopK.settled) has doctests that need no database: python -m doctest -v fanout.py
+"""
+
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+try:
+    import psycopg2
+except Exception as e:
+    print("Missing dependency 'psycopg2'. Install with: pip install psycopg2-binary", file=sys.stderr)
+    raise
+
+from columnar import FORMATS
+from main import report_result
+from offline import numeric_divide, round_scale
+from reports import REPORTS, Report, parse_params
+
+def add(values):
+    """SUM over shards: NULL only when every shard's partial is NULL."""
+    present = [v for v in values if v is not None]
+    return sum(present[1:], present[0]) if present else None
+
+
+def average(total, count, scale=None):
+    if not count:
+        return None
+    value = numeric_divide(Decimal(total), Decimal(count))
+    return round_scale(value, scale) if scale is not None else value
+
+
+def grouped(shard_rows, width):
+    """{row[:width]: [row[width:] of every shard that has the key]}, in first-seen order."""
+    groups = {}
+    for rows in shard_rows:
+        for row in rows:
+            groups.setdefault(tuple(row[:width]), []).append(row[width:])
+    return groups
+
+
+def summed(shard_rows, width):
+    return [key + tuple(add(col) for col in zip(*parts)) for key, parts in grouped(shard_rows, width).items()]
+
+
+def nulls_last(value, descending):
+    """
+    Sort key: non-NULL values in the requested direction, NULLs after them. That is Postgres' default for
+    ASC only; DESC sorts NULLs first unless the report says NULLS LAST. The DESC reports merged here either
+    say NULLS LAST or rank by sums over inner joins, which are never NULL.
+    """
+    if value is None:
+        return (1, 0)
+    return (0, -value if descending else value)
+
+
+# ---------------------------------------------------------------------------------------------------------
+# Reports that merge by adding partials
+
+def merge_revenue_by_country(shard_rows, values):
+    return sorted(summed(shard_rows, 1), key=lambda r: nulls_last(r[1], True))
+
+
+def merge_monthly_sales(shard_rows, values):
+    return sorted(summed(shard_rows, 1), key=lambda r: r[0])
+
+
+def merge_orders_by_year_and_status(shard_rows, values):
+    return sorted(summed(shard_rows, 2), key=lambda r: (-r[0], -r[2]))
+
+
+def merge_delivery_days(shard_rows, values):
+    days, orders = (add(col) for col in zip(*[row for rows in shard_rows for row in rows]))
+    return [(average(days, orders, 2),)]   # ::NUMERIC(10,2)
+
+
+def merge_low_stock(shard_rows, values):
+    rows = [r for r in summed(shard_rows, 2) if r[2] < values["stock_below"]]
+    return sorted(rows, key=lambda r: (r[2], -r[3]))
+
+
+def merge_items_per_order(shard_rows, values):
+    orders, lines, units = (add(col) for col in zip(*[row for rows in shard_rows for row in rows]))
+    return [(average(lines, orders, 2), average(units, orders, 2))]
+
+
+# key -> (output columns, partial SQL, merge(shard rows, parameter values)); the SQL has the registry report's
+# parameter slots, rendered by partial_sql() exactly like the report itself
+PARTIALS = {
+    "1_total_revenue_by_country": (
+        ["country", "total_revenue"],
+        "SELECT c.country,\n"
+        "       SUM(od.quantityordered * od.priceeach) AS total_revenue\n"
+        "FROM classicmodels.orderdetails od\n"
+        "JOIN classicmodels.orders o ON od.ordernumber = o.ordernumber\n"
+        "JOIN classicmodels.customers c ON o.customernumber = c.customernumber\n"
+        "GROUP BY c.country;",
+        merge_revenue_by_country),
+    "3_monthly_sales_last_12m": (
+        ["month", "revenue"],
+        "SELECT date_trunc('month', o.orderdate)::date AS month,\n"
+        "       SUM(od.quantityordered * od.priceeach) AS revenue\n"
+        "FROM classicmodels.orders o\n"
+        "JOIN classicmodels.orderdetails od ON o.ordernumber = od.ordernumber\n"
+        "WHERE o.orderdate >= (current_date - {months})\n"
+        "GROUP BY 1;",
+        merge_monthly_sales),
+    "5_orders_by_year_and_status": (
+        ["year", "status", "orders_count"],
+        "SELECT EXTRACT(YEAR FROM orderdate)::INT AS year,\n"
+        "       status,\n"
+        "       COUNT(*) AS orders_count\n"
+        "FROM classicmodels.orders\n"
+        "GROUP BY year, status;",
+        merge_orders_by_year_and_status),
+    "7_avg_delivery_days_for_shipped_orders": (
+        ["avg_delivery_days"],
+        "SELECT SUM(shippeddate - orderdate) AS delivery_days,\n"
+        "       COUNT(shippeddate - orderdate) AS shipped_orders\n"
+        "FROM classicmodels.orders\n"
+        "WHERE shippeddate IS NOT NULL;",
+        merge_delivery_days),
+    "9_low_stock_products_with_sales_last_6m": (
+        ["productcode", "productname", "quantityinstock", "units_sold_last_6m"],
+        # every product: the stock filter only applies to the regions' combined stock
+        "SELECT p.productcode,\n"
+        "       p.productname,\n"
+        "       p.quantityinstock,\n"
+        "       COALESCE(s.units_sold,0) AS units_sold_last_6m\n"
+        "FROM classicmodels.products p\n"
+        "LEFT JOIN (\n"
+        "  SELECT od.productcode, SUM(od.quantityordered) AS units_sold\n"
+        "  FROM classicmodels.orderdetails od\n"
+        "  JOIN classicmodels.orders o ON od.ordernumber = o.ordernumber\n"
+        "  WHERE o.orderdate >= current_date - {months}\n"
+        "  GROUP BY od.productcode\n"
+        ") s ON s.productcode = p.productcode;",
+        merge_low_stock),
+    "10_avg_items_and_lines_per_order": (
+        ["avg_lines_per_order", "avg_units_per_order"],
+        "SELECT COUNT(*) AS orders,\n"
+        "       SUM(order_lines) AS order_lines,\n"
+        "       SUM(total_units) AS total_units\n"
+        "FROM (\n"
+        "  SELECT o.ordernumber,\n"
+        "         COUNT(od.productcode) AS order_lines,\n"
+        "         SUM(od.quantityordered) AS total_units\n"
+        "  FROM classicmodels.orders o\n"
+        "  JOIN classicmodels.orderdetails od ON o.ordernumber = od.ordernumber\n"
+        "  GROUP BY o.ordernumber\n"
+        ") t;",
+        merge_items_per_order),
+}
+
+
+def partial_sql(key, values):
+    report = REPORTS[key]
+    return Report(key, report.title, PARTIALS[key][1], list(report.params.values())).render(**values)
+
+
+# ---------------------------------------------------------------------------------------------------------
+# LIMIT reports: over-fetched candidates, completed and checked against a threshold
+
+class TopK:
+    """
+    A LIMIT report. `sql` has a {where} slot (restrict to `id = ANY(%(keys)s)`) and a {limit} slot for the
+    per-shard limit; its rows are (id, name, partial columns..., shard rank value) ordered by the shard rank.
+    The registry's `limit` parameter is k, the number of merged rows kept. combine() turns the partials of
+    one entity from all shards into the output row, whose `value_index` column is the merged ranking value.
+    """
+
+    def __init__(self, key, columns, sql, where, combine, rank_bound, descending=True, value_index=-1):
+        self.key = key
+        self.columns = columns
+        self.sql = sql
+        self.where = where
+        self.combine = combine
+        self.rank_bound = rank_bound   # sum, max or min of the shards' thresholds
+        self.descending = descending
+        self.value_index = value_index   # output column the report orders by
+
+    def top_sql(self):
+        return self.sql.format(where="", limit="LIMIT %(n)s")
+
+    def keyed_sql(self):
+        return self.sql.format(where=self.where, limit="")
+
+    def value(self, row):
+        return row[self.value_index]
+
+    def order(self, rows):
+        return sorted(rows, key=lambda r: nulls_last(self.value(r), self.descending))
+
+    def bound(self, thresholds):
+        """Best merged value an entity that no shard returned could reach; None if such entities rank NULL."""
+        present = [t for t in thresholds if t is not None]
+        return self.rank_bound(present) if present else None
+
+    def settled(self, merged, thresholds, exhausted, k):
+        """
+        True when the first k of `merged` (already ordered) are the exact top k: an entity no shard has
+        returned cannot rank better than bound(thresholds), so the k-th merged value must be at least as good.
+        `thresholds` are the last ranking values of the shards that still have rows.
+
+        >>> top = TopK("top", [], "", "", None, sum)          # ranked by a sum over shards, DESC
+        >>> merged = [(1, 90), (2, 70), (3, 40)]
+        >>> top.settled(merged, [30, 35], False, 2)            # an unseen entity reaches at most 65 < 70
+        True
+        >>> top.settled(merged, [30, 45], False, 2)            # ... or 75, which would beat the 2nd
+        False
+        >>> top.settled(merged[:1], [30], True, 2)             # every shard returned all of its rows
+        True
+        >>> top.settled(merged[:1], [30], False, 2)            # fewer than k so far
+        False
+        >>> top.settled(merged, [None, None], False, 2)        # unseen entities rank NULL, i.e. last
+        True
+        >>> TopK("top", [], "", "", None, max).settled(merged, [30, 75], False, 2)
+        False
+        >>> lowest = TopK("low", [], "", "", None, min, descending=False)
+        >>> lowest.settled([(1, 5), (2, 9)], [7, 12], False, 1), lowest.settled([(1, 5), (2, 9)], [7, 12], False, 2)
+        (True, False)
+        >>> lowest.settled([(1, 5), (2, None)], [7], False, 2)  # a NULL k-th value can still be displaced
+        False
+        """
+        if exhausted:
+            return True
+        bound = self.bound(thresholds)
+        if len(merged) < k:
+            return False
+        if bound is None:
+            return True   # unseen entities have a NULL rank on every shard and sort last
+        kth = self.value(merged[k - 1])
+        if kth is None:
+            return False
+        return bound <= kth if self.descending else bound >= kth
+
+
+def combine_products(key, parts):
+    revenue, units = (add(col) for col in zip(*[p[:2] for p in parts]))
+    return key + (revenue, units)
+
+
+def combine_customer_averages(key, parts):
+    total, orders = (add(col) for col in zip(*[p[:2] for p in parts]))
+    return key + (average(total, orders),)
+
+
+def combine_sales_reps(key, parts):
+    customers, orders, revenue = (add(col) for col in zip(*[p[:3] for p in parts]))
+    return key + (customers, orders, revenue)
+
+
+def combine_payment_coverage(key, parts):
+    payments, invoiced = (add(col) for col in zip(*[p[:2] for p in parts]))
+    if not invoiced:
+        ratio = None
+    else:
+        ratio = round_scale(numeric_divide(payments, invoiced), 4) if payments is not None else None
+    return key + (payments if payments is not None else Decimal(0),
+                  invoiced if invoiced is not None else Decimal(0), ratio)
+
+
+TOPK = {t.key: t for t in [
+    TopK("2_top10_products_by_revenue",
+         ["productcode", "productname", "revenue", "units_sold"],
+         "SELECT p.productcode,\n"
+         "       p.productname,\n"
+         "       SUM(od.quantityordered * od.priceeach) AS revenue,\n"
+         "       SUM(od.quantityordered) AS units_sold,\n"
+         "       SUM(od.quantityordered * od.priceeach) AS shard_rank\n"
+         "FROM classicmodels.orderdetails od\n"
+         "JOIN classicmodels.products p ON od.productcode = p.productcode\n"
+         "{where}"
+         "GROUP BY p.productcode, p.productname\n"
+         "ORDER BY shard_rank DESC\n"
+         "{limit};",
+         "WHERE p.productcode = ANY(%(keys)s)\n",
+         combine_products, sum, value_index=2),
+    TopK("4_avg_order_value_per_customer",
+         ["customernumber", "customername", "avg_order_value"],
+         "SELECT c.customernumber,\n"
+         "       c.customername,\n"
+         "       SUM(order_total) AS order_total_sum,\n"
+         "       COUNT(*) AS orders,\n"
+         "       AVG(order_total) AS shard_rank\n"
+         "FROM (\n"
+         "  SELECT o.ordernumber, o.customernumber, SUM(od.quantityordered * od.priceeach) AS order_total\n"
+         "  FROM classicmodels.orders o\n"
+         "  JOIN classicmodels.orderdetails od USING (ordernumber)\n"
+         "{where}"
+         "  GROUP BY o.ordernumber, o.customernumber\n"
+         ") t\n"
+         "JOIN classicmodels.customers c ON t.customernumber = c.customernumber\n"
+         "GROUP BY c.customernumber, c.customername\n"
+         "ORDER BY shard_rank DESC\n"
+         "{limit};",
+         "  WHERE o.customernumber = ANY(%(keys)s)\n",
+         # a merged average lies between the shard averages it is made of
+         combine_customer_averages, max),
+    TopK("6_sales_rep_performance",
+         ["employeenumber", "sales_rep", "customers_managed", "orders_count", "total_revenue"],
+         "SELECT e.employeenumber,\n"
+         "       (e.firstname || ' ' || e.lastname) AS sales_rep,\n"
+         "       COUNT(DISTINCT c.customernumber) AS customers_managed,\n"
+         "       COUNT(DISTINCT o.ordernumber) AS orders_count,\n"
+         "       SUM(od.quantityordered * od.priceeach) AS total_revenue,\n"
+         "       SUM(od.quantityordered * od.priceeach) AS shard_rank\n"
+         "FROM classicmodels.employees e\n"
+         "LEFT JOIN classicmodels.customers c ON c.salesrepemployeenumber = e.employeenumber\n"
+         "LEFT JOIN classicmodels.orders o ON o.customernumber = c.customernumber\n"
+         "LEFT JOIN classicmodels.orderdetails od ON od.ordernumber = o.ordernumber\n"
+         "{where}"
+         "GROUP BY e.employeenumber, sales_rep\n"
+         "ORDER BY shard_rank DESC NULLS LAST\n"
+         "{limit};",
+         "WHERE e.employeenumber = ANY(%(keys)s)\n",
+         combine_sales_reps, sum),
+    TopK("8_payment_coverage_ratio_per_customer",
+         ["customernumber", "customername", "total_payments", "total_invoiced", "payment_coverage_ratio"],
+         # ranked by COALESCE(payments, 0) / invoiced: the merged ratio is at least the smallest shard ratio
+         "SELECT c.customernumber,\n"
+         "       c.customername,\n"
+         "       pay.total_payments,\n"
+         "       inv.total_invoiced,\n"
+         "       CASE WHEN COALESCE(inv.total_invoiced,0) = 0 THEN NULL\n"
+         "            ELSE COALESCE(pay.total_payments,0) / inv.total_invoiced::NUMERIC\n"
+         "       END AS shard_rank\n"
+         "FROM classicmodels.customers c\n"
+         "LEFT JOIN (\n"
+         "  SELECT customernumber, SUM(amount) AS total_payments\n"
+         "  FROM classicmodels.payments\n"
+         "  GROUP BY customernumber\n"
+         ") pay ON pay.customernumber = c.customernumber\n"
+         "LEFT JOIN (\n"
+         "  SELECT o.customernumber, SUM(od.quantityordered * od.priceeach) AS total_invoiced\n"
+         "  FROM classicmodels.orders o\n"
+         "  JOIN classicmodels.orderdetails od ON o.ordernumber = od.ordernumber\n"
+         "  GROUP BY o.customernumber\n"
+         ") inv ON inv.customernumber = c.customernumber\n"
+         "{where}"
+         "ORDER BY shard_rank ASC NULLS LAST\n"
+         "{limit};",
+         "WHERE c.customernumber = ANY(%(keys)s)\n",
+         combine_payment_coverage, min, descending=False),
+]}
+
+
+# ---------------------------------------------------------------------------------------------------------
+# Shards
+
+class Shard:
+    def __init__(self, dsn, timeout):
+        self.conn = psycopg2.connect(dsn, options=f"-c statement_timeout={timeout * 1000}")
+        params = self.conn.get_dsn_parameters()
+        self.label = f"{params.get('host', '')}:{params.get('port', '')}/{params.get('dbname', '')}"
+        self.elapsed = 0.0
+        self.queries = 0
+
+    def query(self, sql, params=None):
+        start = time.time()
+        cur = self.conn.cursor()
+        try:
+            cur.execute(sql, params)
+            return cur.fetchall()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            cur.close()
+            self.elapsed += time.time() - start
+            self.queries += 1
+
+    def first_pass(self, n, params):
+        """Every partial and the first top k*n of each LIMIT report; per-report errors are returned, not raised."""
+        results = {}
+        for key in REPORTS:
+            try:
+                if key in PARTIALS:
+                    results[key] = self.query(partial_sql(key, params[key]))
+                elif key in TOPK:
+                    limit = params[key]["limit"] * n
+                    results[key] = (limit, self.query(TOPK[key].top_sql(), {"n": limit}))
+            except Exception as e:
+                results[key] = e
+        self.conn.rollback()
+        return results
+
+    def close(self):
+        self.conn.close()
+
+
+class TopKState:
+    """What the coordinator knows about one LIMIT report on every shard."""
+
+    def __init__(self, topk, shards, k):
+        self.topk = topk
+        self.shards = shards
+        self.k = k
+        self.known = [{} for _ in shards]        # per shard: id -> partial row (None: shard has no such id)
+        self.thresholds = [None] * len(shards)
+        self.exhausted = [False] * len(shards)
+        self.limits = [0] * len(shards)
+
+    def add_top(self, i, limit, rows):
+        self.limits[i] = limit
+        for row in rows:
+            self.known[i][row[0]] = row
+        self.exhausted[i] = len(rows) < limit
+        self.thresholds[i] = None if self.exhausted[i] or not rows else rows[-1][-1]
+
+    def candidates(self):
+        ids = {}
+        for known in self.known:
+            for key, row in known.items():
+                if row is not None:
+                    ids.setdefault(key, row[:2])
+        return ids
+
+    def missing(self, i):
+        return [key for key in self.candidates() if key not in self.known[i]]
+
+    def add_keyed(self, i, keys, rows):
+        for key in keys:
+            self.known[i].setdefault(key, None)
+        for row in rows:
+            self.known[i][row[0]] = row
+
+    def merged(self):
+        rows = []
+        for key, head in self.candidates().items():
+            parts = [known[key][2:-1] for known in self.known if known.get(key) is not None]
+            rows.append(self.topk.combine(tuple(head), parts))
+        return self.topk.order(rows)
+
+    def settled(self, merged):
+        open_thresholds = [t for t, done in zip(self.thresholds, self.exhausted) if not done]
+        return self.topk.settled(merged, open_thresholds, all(self.exhausted), self.k)
+
+
+def refine(executor, state):
+    """Complete the candidates' partials on every shard and widen the shard limits until the top k is exact."""
+    topk, rounds = state.topk, 0
+    while True:
+        rounds += 1
+
+        def complete(i):
+            keys = state.missing(i)
+            return keys, state.shards[i].query(topk.keyed_sql(), {"keys": keys}) if keys else []
+
+        for i, (keys, rows) in enumerate(executor.map(complete, range(len(state.shards)))):
+            state.add_keyed(i, keys, rows)
+        merged = state.merged()
+        if state.settled(merged):
+            return merged[:state.k], rounds
+
+        def widen(i):
+            if state.exhausted[i]:
+                return None
+            limit = state.limits[i] * 4
+            return limit, state.shards[i].query(topk.top_sql(), {"n": limit})
+
+        for i, result in enumerate(executor.map(widen, range(len(state.shards)))):
+            if result is not None:
+                state.add_top(i, *result)
+
+
+def read_dsns(args):
+    dsns = list(args.dsn)
+    if args.dsn_file:
+        with open(args.dsn_file, encoding="utf-8") as f:
+            dsns += [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+    return dsns
+
+
+def report_params(pairs):
+    """
+    {report key: parameter values} from --param pairs: `name=value` sets the parameter on every report that
+    has it, `<report key>.name=value` on that report only. Values are checked by the registry.
+    """
+    overrides = {key: {} for key in REPORTS}
+    for name, value in parse_params(pairs).items():
+        key, dot, name = name.rpartition(".")
+        if dot and key not in REPORTS:
+            raise ValueError(f"unknown report {key!r} in --param")
+        keys = [key] if dot else [k for k, report in REPORTS.items() if name in report.params]
+        if not keys:
+            raise ValueError(f"no report has a parameter {name!r}")
+        for k in keys:
+            overrides[k][name] = value
+    return {key: REPORTS[key].values(values) for key, values in overrides.items()}
+
+
+def run(shards, args, params):
+    with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+        start = time.time()
+        first = list(executor.map(lambda shard: shard.first_pass(args.overfetch, params), shards))
+        first_elapsed = time.time() - start
+
+        for key, report in REPORTS.items():
+            print(f"\nRunning [{key}] ...")
+            t0 = time.time()
+            try:
+                errors = [(shard.label, r[key]) for shard, r in zip(shards, first) if isinstance(r[key], Exception)]
+                if errors:
+                    raise RuntimeError("; ".join(f"{label}: {str(e).strip()}" for label, e in errors))
+                if key in PARTIALS:
+                    columns, _, merge = PARTIALS[key]
+                    rows = merge([r[key] for r in first], params[key])
+                    note = ""
+                else:
+                    state = TopKState(TOPK[key], shards, params[key]["limit"])
+                    for i, r in enumerate(first):
+                        state.add_top(i, *r[key])
+                    columns = TOPK[key].columns
+                    rows, rounds = refine(executor, state)
+                    note = f" (top-k settled after {rounds} round{'s' if rounds > 1 else ''})"
+                print(f"Merged {len(shards)} shards{note}")
+                report_result(key, report.render(**params[key]), columns, rows, time.time() - t0, args)
+            except Exception as e:
+                print(f"Error running query [{key}]: {e}", file=sys.stderr)
+                for shard in shards:
+                    shard.conn.rollback()
+
+    print(f"\nFan-out over {len(shards)} shards: first pass {first_elapsed:.3f}s (slowest shard), "
+          f"total {time.time() - start:.3f}s")
+    for shard in shards:
+        print(f"  {shard.label:<40} {shard.queries:3d} queries {shard.elapsed:8.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the classicmodels reports across several databases and merge them.")
+    parser.add_argument("--dsn", action="append", default=[],
+                        help="libpq connection string of one shard, e.g. \"host=eu-db dbname=classicmodels\" (repeatable)")
+    parser.add_argument("--dsn-file", dest="dsn_file", default="", help="File with one DSN per line (# comments)")
+    parser.add_argument("--overfetch", type=int, default=3,
+                        help="LIMIT reports fetch limit x N candidates per shard in the first pass (default: 3)")
+    parser.add_argument("--param", action="append", default=[],
+                        help="Report parameter as name=value for every report that has it, or "
+                             "<report key>.name=value (repeatable), e.g. 3_monthly_sales_last_12m.months=24")
+    parser.add_argument("--timeout", type=int, default=60, help="Statement timeout in seconds")
+    parser.add_argument("--save-csv", dest="save_csv", action="store_true", help="Save each merged result")
+    parser.add_argument("--csv-dir", dest="csv_dir", default="", help="Directory to save results to")
+    parser.add_argument("--format", choices=FORMATS, default="csv", help="File format for --save-csv")
+    args = parser.parse_args()
+    if args.overfetch < 1:
+        parser.error("--overfetch must be >= 1")
+    try:
+        params = report_params(args.param)
+    except ValueError as e:
+        parser.error(str(e))
+
+    dsns = read_dsns(args)
+    if not dsns:
+        parser.error("give at least one --dsn or a --dsn-file")
+    shards = []
+    try:
+        with ThreadPoolExecutor(max_workers=len(dsns)) as executor:
+            futures = [executor.submit(Shard, dsn, args.timeout) for dsn in dsns]
+            for dsn, future in zip(dsns, futures):
+                try:
+                    shards.append(future.result())
+                except Exception as e:
+                    raise RuntimeError(f"cannot connect to shard {dsn!r}: {str(e).strip()}")
+        print(f"Connected to {len(shards)} shards: {', '.join(s.label for s in shards)}")
+        run(shards, args, params)
+        print("\nAll queries completed.")
+    except Exception as e:
+        print("Fan-out failed:", e, file=sys.stderr)
+        sys.exit(1)
+    finally:
+        for shard in shards:
+            shard.close()
+
+
+if __name__ == "__main__":
+    main()
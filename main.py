@@ -14,13 +14,16 @@ Install deps:
 
 import argparse
 import csv
+import gzip
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 
 try:
     import psycopg2
     import psycopg2.extras
+    import psycopg2.pool
 except Exception as e:
     print("Missing dependency 'psycopg2'. Install with: pip install psycopg2-binary", file=sys.stderr)
     raise
@@ -31,131 +34,170 @@ try:
 except Exception:
     HAVE_TABULATE = False
 
-QUERIES = [
-    ("1_total_revenue_by_country",
-     "-- Total revenue (sales) by customer country\n"
-     "SELECT c.country,\n"
-     "       SUM(od.quantityordered * od.priceeach) AS total_revenue\n"
-     "FROM classicmodels.orderdetails od\n"
-     "JOIN classicmodels.orders o ON od.ordernumber = o.ordernumber\n"
-     "JOIN classicmodels.customers c ON o.customernumber = c.customernumber\n"
-     "GROUP BY c.country\n"
-     "ORDER BY total_revenue DESC;"),
-    ("2_top10_products_by_revenue",
-     "-- Top 10 products by revenue\n"
-     "SELECT p.productcode,\n"
-     "       p.productname,\n"
-     "       SUM(od.quantityordered * od.priceeach) AS revenue,\n"
-     "       SUM(od.quantityordered) AS units_sold\n"
-     "FROM classicmodels.orderdetails od\n"
-     "JOIN classicmodels.products p ON od.productcode = p.productcode\n"
-     "GROUP BY p.productcode, p.productname\n"
-     "ORDER BY revenue DESC\n"
-     "LIMIT 10;"),
-    ("3_monthly_sales_last_12m",
-     "-- Monthly sales trend (last 12 months)\n"
-     "SELECT date_trunc('month', o.orderdate)::date AS month,\n"
-     "       SUM(od.quantityordered * od.priceeach) AS revenue\n"
-     "FROM classicmodels.orders o\n"
-     "JOIN classicmodels.orderdetails od ON o.ordernumber = od.ordernumber\n"
-     "WHERE o.orderdate >= (current_date - INTERVAL '12 months')\n"
-     "GROUP BY 1\n"
-     "ORDER BY 1;"),
-    ("4_avg_order_value_per_customer",
-     "-- Average order value per customer (top 20)\n"
-     "SELECT c.customernumber,\n"
-     "       c.customername,\n"
-     "       AVG(order_total) AS avg_order_value\n"
-     "FROM (\n"
-     "  SELECT o.ordernumber, o.customernumber, SUM(od.quantityordered * od.priceeach) AS order_total\n"
-     "  FROM classicmodels.orders o\n"
-     "  JOIN classicmodels.orderdetails od USING (ordernumber)\n"
-     "  GROUP BY o.ordernumber, o.customernumber\n"
-     ") t\n"
-     "JOIN classicmodels.customers c ON t.customernumber = c.customernumber\n"
-     "GROUP BY c.customernumber, c.customername\n"
-     "ORDER BY avg_order_value DESC\n"
-     "LIMIT 20;"),
-    ("5_orders_by_year_and_status",
-     "-- Number of orders by year and status\n"
-     "SELECT EXTRACT(YEAR FROM orderdate)::INT AS year,\n"
-     "       status,\n"
-     "       COUNT(*) AS orders_count\n"
-     "FROM classicmodels.orders\n"
-     "GROUP BY year, status\n"
-     "ORDER BY year DESC, orders_count DESC;"),
-    ("6_sales_rep_performance",
-     "-- Sales representative performance\n"
-     "SELECT e.employeenumber,\n"
-     "       (e.firstname || ' ' || e.lastname) AS sales_rep,\n"
-     "       COUNT(DISTINCT c.customernumber) AS customers_managed,\n"
-     "       COUNT(DISTINCT o.ordernumber) AS orders_count,\n"
-     "       SUM(od.quantityordered * od.priceeach) AS total_revenue\n"
-     "FROM classicmodels.employees e\n"
-     "LEFT JOIN classicmodels.customers c ON c.salesrepemployeenumber = e.employeenumber\n"
-     "LEFT JOIN classicmodels.orders o ON o.customernumber = c.customernumber\n"
-     "LEFT JOIN classicmodels.orderdetails od ON od.ordernumber = o.ordernumber\n"
-     "GROUP BY e.employeenumber, sales_rep\n"
-     "ORDER BY total_revenue DESC NULLS LAST\n"
-     "LIMIT 20;"),
-    ("7_avg_delivery_days_for_shipped_orders",
-     "-- Average delivery time (in days) for shipped orders\n"
-     "SELECT AVG((shippeddate - orderdate))::NUMERIC(10,2) AS avg_delivery_days\n"
-     "FROM classicmodels.orders\n"
-     "WHERE shippeddate IS NOT NULL;"),
-    ("8_payment_coverage_ratio_per_customer",
-     "-- Payment coverage ratio per customer\n"
-     "SELECT c.customernumber,\n"
-     "       c.customername,\n"
-     "       COALESCE(pay.total_payments,0) AS total_payments,\n"
-     "       COALESCE(inv.total_invoiced,0) AS total_invoiced,\n"
-     "       CASE WHEN COALESCE(inv.total_invoiced,0) = 0 THEN NULL\n"
-     "            ELSE ROUND(pay.total_payments / inv.total_invoiced::NUMERIC, 4)\n"
-     "       END AS payment_coverage_ratio\n"
-     "FROM classicmodels.customers c\n"
-     "LEFT JOIN (\n"
-     "  SELECT customernumber, SUM(amount) AS total_payments\n"
-     "  FROM classicmodels.payments\n"
-     "  GROUP BY customernumber\n"
-     ") pay ON pay.customernumber = c.customernumber\n"
-     "LEFT JOIN (\n"
-     "  SELECT o.customernumber, SUM(od.quantityordered * od.priceeach) AS total_invoiced\n"
-     "  FROM classicmodels.orders o\n"
-     "  JOIN classicmodels.orderdetails od ON o.ordernumber = od.ordernumber\n"
-     "  GROUP BY o.customernumber\n"
-     ") inv ON inv.customernumber = c.customernumber\n"
-     "ORDER BY payment_coverage_ratio ASC NULLS LAST\n"
-     "LIMIT 20;"),
-    ("9_low_stock_products_with_sales_last_6m",
-     "-- Low-stock products with sales in the last 6 months\n"
-     "SELECT p.productcode,\n"
-     "       p.productname,\n"
-     "       p.quantityinstock,\n"
-     "       COALESCE(s.units_sold,0) AS units_sold_last_6m\n"
-     "FROM classicmodels.products p\n"
-     "LEFT JOIN (\n"
-     "  SELECT od.productcode, SUM(od.quantityordered) AS units_sold\n"
-     "  FROM classicmodels.orderdetails od\n"
-     "  JOIN classicmodels.orders o ON od.ordernumber = o.ordernumber\n"
-     "  WHERE o.orderdate >= current_date - INTERVAL '6 months'\n"
-     "  GROUP BY od.productcode\n"
-     ") s ON s.productcode = p.productcode\n"
-     "WHERE p.quantityinstock < 20\n"
-     "ORDER BY p.quantityinstock ASC, units_sold_last_6m DESC;"),
-    ("10_avg_items_and_lines_per_order",
-     "-- Average number of items and lines per order\n"
-     "SELECT ROUND(AVG(order_lines)::NUMERIC,2) AS avg_lines_per_order,\n"
-     "       ROUND(AVG(total_units)::NUMERIC,2) AS avg_units_per_order\n"
-     "FROM (\n"
-     "  SELECT o.ordernumber,\n"
-     "         COUNT(od.productcode) AS order_lines,\n"
-     "         SUM(od.quantityordered) AS total_units\n"
-     "  FROM classicmodels.orders o\n"
-     "  JOIN classicmodels.orderdetails od ON o.ordernumber = od.ordernumber\n"
-     "  GROUP BY o.ordernumber\n"
-     ") t;"),
+from advisor import advise
+from columnar import FORMATS, SUFFIXES, write_rows
+from metrics import Metrics, approx_bytes
+from offline import DEFAULT_SNAPSHOT, SnapshotEngine
+from partitions import PRUNED_QUERIES
+from report_cache import ResultCache, fetch_watermark
+from reports import REPORTS
+
+# read size for COPY ... TO STDOUT streaming (bytes)
+COPY_BUFFER_SIZE = 1 << 20
+
+# the report SQL lives in reports.py with typed parameters; QUERIES is every report rendered with its
+# default parameters, i.e. the same literal text this list always had
+QUERIES = [(report.key, report.render()) for report in REPORTS.values()]
+
+# Detail-level exports: too large to print, only available with --copy --detail.
+# Same order-line join as the Superset "Full Sales Data" dataset.
+FULL_SALES_DATA_SQL = (
+    "-- Full Sales Data (order-line detail)\n"
+    "SELECT o.orderdate,\n"
+    "       o.status,\n"
+    "       c.customername,\n"
+    "       c.country,\n"
+    "       od.quantityordered,\n"
+    "       od.priceeach,\n"
+    "       p.productline,\n"
+    "       p.productname\n"
+    "FROM classicmodels.orders o\n"
+    "JOIN classicmodels.orderdetails od ON o.ordernumber = od.ordernumber\n"
+    "JOIN classicmodels.products p ON od.productcode = p.productcode\n"
+    "JOIN classicmodels.customers c ON o.customernumber = c.customernumber;"
+)
+
+DETAIL_QUERIES = [
+    ("full_sales_data", FULL_SALES_DATA_SQL),
 ]
 
+# --shared-scan: orders LEFT JOIN orderdetails is materialized once per run into a temp table and
+# the overlapping reports read it instead of re-joining the base tables. The LEFT JOIN keeps orders
+# without lines (query 6 counts them); the other reports filter them out with productcode IS NOT NULL,
+# which reproduces their inner joins, so every result is identical to the QUERIES version.
+ORDER_LINE_FACT_SQL = (
+    "CREATE TEMP TABLE order_line_fact AS\n"
+    "SELECT o.ordernumber,\n"
+    "       o.orderdate,\n"
+    "       o.customernumber,\n"
+    "       od.productcode,\n"
+    "       od.quantityordered,\n"
+    "       od.quantityordered * od.priceeach AS line_total\n"
+    "FROM classicmodels.orders o\n"
+    "LEFT JOIN classicmodels.orderdetails od ON od.ordernumber = o.ordernumber;"
+)
+
+SHARED_SCAN_QUERIES = {
+    "1_total_revenue_by_country":
+        "-- Total revenue (sales) by customer country\n"
+        "SELECT c.country,\n"
+        "       SUM(f.line_total) AS total_revenue\n"
+        "FROM order_line_fact f\n"
+        "JOIN classicmodels.customers c ON f.customernumber = c.customernumber\n"
+        "WHERE f.productcode IS NOT NULL\n"
+        "GROUP BY c.country\n"
+        "ORDER BY total_revenue DESC;",
+    "2_top10_products_by_revenue":
+        "-- Top 10 products by revenue\n"
+        "SELECT p.productcode,\n"
+        "       p.productname,\n"
+        "       SUM(f.line_total) AS revenue,\n"
+        "       SUM(f.quantityordered) AS units_sold\n"
+        "FROM order_line_fact f\n"
+        "JOIN classicmodels.products p ON f.productcode = p.productcode\n"
+        "GROUP BY p.productcode, p.productname\n"
+        "ORDER BY revenue DESC\n"
+        "LIMIT 10;",
+    "3_monthly_sales_last_12m":
+        "-- Monthly sales trend (last 12 months)\n"
+        "SELECT date_trunc('month', f.orderdate)::date AS month,\n"
+        "       SUM(f.line_total) AS revenue\n"
+        "FROM order_line_fact f\n"
+        "WHERE f.productcode IS NOT NULL\n"
+        "  AND f.orderdate >= (current_date - INTERVAL '12 months')\n"
+        "GROUP BY 1\n"
+        "ORDER BY 1;",
+    "4_avg_order_value_per_customer":
+        "-- Average order value per customer (top 20)\n"
+        "SELECT c.customernumber,\n"
+        "       c.customername,\n"
+        "       AVG(order_total) AS avg_order_value\n"
+        "FROM (\n"
+        "  SELECT f.ordernumber, f.customernumber, SUM(f.line_total) AS order_total\n"
+        "  FROM order_line_fact f\n"
+        "  WHERE f.productcode IS NOT NULL\n"
+        "  GROUP BY f.ordernumber, f.customernumber\n"
+        ") t\n"
+        "JOIN classicmodels.customers c ON t.customernumber = c.customernumber\n"
+        "GROUP BY c.customernumber, c.customername\n"
+        "ORDER BY avg_order_value DESC\n"
+        "LIMIT 20;",
+    "6_sales_rep_performance":
+        "-- Sales representative performance\n"
+        "SELECT e.employeenumber,\n"
+        "       (e.firstname || ' ' || e.lastname) AS sales_rep,\n"
+        "       COUNT(DISTINCT c.customernumber) AS customers_managed,\n"
+        "       COUNT(DISTINCT f.ordernumber) AS orders_count,\n"
+        "       SUM(f.line_total) AS total_revenue\n"
+        "FROM classicmodels.employees e\n"
+        "LEFT JOIN classicmodels.customers c ON c.salesrepemployeenumber = e.employeenumber\n"
+        "LEFT JOIN order_line_fact f ON f.customernumber = c.customernumber\n"
+        "GROUP BY e.employeenumber, sales_rep\n"
+        "ORDER BY total_revenue DESC NULLS LAST\n"
+        "LIMIT 20;",
+    "8_payment_coverage_ratio_per_customer":
+        "-- Payment coverage ratio per customer\n"
+        "SELECT c.customernumber,\n"
+        "       c.customername,\n"
+        "       COALESCE(pay.total_payments,0) AS total_payments,\n"
+        "       COALESCE(inv.total_invoiced,0) AS total_invoiced,\n"
+        "       CASE WHEN COALESCE(inv.total_invoiced,0) = 0 THEN NULL\n"
+        "            ELSE ROUND(pay.total_payments / inv.total_invoiced::NUMERIC, 4)\n"
+        "       END AS payment_coverage_ratio\n"
+        "FROM classicmodels.customers c\n"
+        "LEFT JOIN (\n"
+        "  SELECT customernumber, SUM(amount) AS total_payments\n"
+        "  FROM classicmodels.payments\n"
+        "  GROUP BY customernumber\n"
+        ") pay ON pay.customernumber = c.customernumber\n"
+        "LEFT JOIN (\n"
+        "  SELECT f.customernumber, SUM(f.line_total) AS total_invoiced\n"
+        "  FROM order_line_fact f\n"
+        "  WHERE f.productcode IS NOT NULL\n"
+        "  GROUP BY f.customernumber\n"
+        ") inv ON inv.customernumber = c.customernumber\n"
+        "ORDER BY payment_coverage_ratio ASC NULLS LAST\n"
+        "LIMIT 20;",
+    "9_low_stock_products_with_sales_last_6m":
+        "-- Low-stock products with sales in the last 6 months\n"
+        "SELECT p.productcode,\n"
+        "       p.productname,\n"
+        "       p.quantityinstock,\n"
+        "       COALESCE(s.units_sold,0) AS units_sold_last_6m\n"
+        "FROM classicmodels.products p\n"
+        "LEFT JOIN (\n"
+        "  SELECT f.productcode, SUM(f.quantityordered) AS units_sold\n"
+        "  FROM order_line_fact f\n"
+        "  WHERE f.productcode IS NOT NULL\n"
+        "    AND f.orderdate >= current_date - INTERVAL '6 months'\n"
+        "  GROUP BY f.productcode\n"
+        ") s ON s.productcode = p.productcode\n"
+        "WHERE p.quantityinstock < 20\n"
+        "ORDER BY p.quantityinstock ASC, units_sold_last_6m DESC;",
+    "10_avg_items_and_lines_per_order":
+        "-- Average number of items and lines per order\n"
+        "SELECT ROUND(AVG(order_lines)::NUMERIC,2) AS avg_lines_per_order,\n"
+        "       ROUND(AVG(total_units)::NUMERIC,2) AS avg_units_per_order\n"
+        "FROM (\n"
+        "  SELECT f.ordernumber,\n"
+        "         COUNT(f.productcode) AS order_lines,\n"
+        "         SUM(f.quantityordered) AS total_units\n"
+        "  FROM order_line_fact f\n"
+        "  WHERE f.productcode IS NOT NULL\n"
+        "  GROUP BY f.ordernumber\n"
+        ") t;",
+}
+
 
 def normalize_value(v):
     """Convert Decimal and other non-serializable types to str for printing/csv."""
@@ -187,6 +229,10 @@ def print_table(title, columns, rows):
             print(fmt.format(*r))
 
 
+def csv_path(key, args, suffix=".csv"):
+    return f"{key}{suffix}" if not args.csv_dir else f"{args.csv_dir.rstrip('/')}/{key}{suffix}"
+
+
 def save_csv(path, columns, rows):
     with open(path, "w", newline="", encoding="utf-8") as f:
         w = csv.writer(f)
@@ -195,42 +241,293 @@ def save_csv(path, columns, rows):
             w.writerow([normalize_value(col) for col in row])
 
 
-def run_all(conn, args):
+class CountingWriter:
+    """File wrapper handed to copy_expert: forwards COPY chunks and counts bytes and lines."""
+
+    def __init__(self, f):
+        self.f = f
+        self.bytes = 0
+        self.lines = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+        # one line per row (plus the header); fields with embedded newlines would count extra
+        self.lines += data.count(b"\n")
+        return self.f.write(data)
+
+
+def copy_sql(sql):
+    """Drop comment lines and the trailing ';' so the query can be wrapped in COPY (...)."""
+    lines = [line for line in sql.splitlines() if not line.lstrip().startswith("--")]
+    return "\n".join(lines).strip().rstrip(";")
+
+
+def export_copy(conn, key, sql, args):
+    """
+    Stream the result of `sql` from the server straight into a CSV (optionally gzipped) file with
+    COPY ... TO STDOUT, without materializing rows in Python. Returns (path, rows, bytes, elapsed).
+    """
+    fname = csv_path(key, args, ".csv.gz" if args.gzip else ".csv")
+    start = time.time()
+    with (gzip.open(fname, "wb") if args.gzip else open(fname, "wb")) as f:
+        out = CountingWriter(f)
+        cur = conn.cursor()
+        try:
+            cur.copy_expert(f"COPY ({copy_sql(sql)}) TO STDOUT WITH CSV HEADER", out, size=COPY_BUFFER_SIZE)
+        finally:
+            cur.close()
+    elapsed = time.time() - start
+    return fname, max(out.lines - 1, 0), out.bytes, elapsed
+
+
+def report_export(fname, rows, nbytes, elapsed):
+    rate = elapsed if elapsed > 0 else 1e-9
+    print(f"Exported {rows} rows ({nbytes / 1048576:.2f} MiB uncompressed) in {elapsed:.3f}s "
+          f"— {rows / rate:,.0f} rows/s, {nbytes / 1048576 / rate:.2f} MiB/s")
+    print(f"Saved CSV -> {fname}")
+
+
+def fetch_result(cur, sql, record=None):
+    """
+    Execute `sql` on a RealDictCursor and return (columns, row tuples, elapsed seconds).
+    With a metrics `record`, the execute (server execution + transfer of the whole result) and conversion
+    phases are timed separately.
+    """
+    start = time.time()
+    cur.execute(sql)
+    executed = time.time()
+    rows = cur.fetchall()
+    # convert RealDict rows to list of tuples to preserve column order
+    columns = list(rows[0].keys()) if rows else []
+    row_tuples = [tuple(r[col] for col in columns) for r in rows] if rows else []
+    end = time.time()
+    if record is not None:
+        record.update(execute_transfer=executed - start, fetch=end - executed, rows=len(row_tuples),
+                      bytes=approx_bytes(row_tuples))
+    return columns, row_tuples, end - start
+
+
+def query_result(conn, sql, record=None):
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    for key, sql in QUERIES:
+    try:
+        return fetch_result(cur, sql, record)
+    finally:
+        cur.close()
+
+
+def render_result(record, *report_args):
+    """report_result(), with the printing/saving time added to the metrics record."""
+    start = time.time()
+    report_result(*report_args)
+    if record is not None:
+        record["render"] = time.time() - start
+
+
+def export_result(record, export):
+    fname, rows, nbytes, elapsed = export
+    if record is not None:
+        record.update(rows=rows, bytes=nbytes)
+    report_export(fname, rows, nbytes, elapsed)
+
+
+def report_result(key, sql, columns, row_tuples, elapsed, args):
+    print(f"Query finished in {elapsed:.3f}s — {len(row_tuples)} rows")
+    print_table(f"{key} — {sql.splitlines()[0]}", columns, row_tuples)
+    if args.save_csv:
+        if args.format == "csv":
+            fname = csv_path(key, args)
+            save_csv(fname, columns, row_tuples)
+        else:
+            fname = csv_path(key, args, SUFFIXES[args.format])
+            write_rows(fname, columns, row_tuples, args.format)
+        print(f"Saved {args.format.upper()} -> {fname}")
+
+
+def selected_queries(args):
+    return QUERIES + DETAIL_QUERIES if args.detail else QUERIES
+
+
+def build_order_line_fact(conn):
+    """Materialize the shared order-line fact on this connection (temp table, lives until disconnect)."""
+    start = time.time()
+    cur = conn.cursor()
+    try:
+        cur.execute("DROP TABLE IF EXISTS order_line_fact;")
+        cur.execute(ORDER_LINE_FACT_SQL)
+        rows = cur.rowcount
+        cur.execute("ANALYZE order_line_fact;")
+        conn.commit()
+    finally:
+        cur.close()
+    print(f"Built shared order-line fact in {time.time() - start:.3f}s — {rows} rows")
+
+
+def execution_sql(key, sql, args):
+    """The text actually sent for a report: its shared-scan or partition-pruned form when requested."""
+    if args.shared_scan:
+        return SHARED_SCAN_QUERIES.get(key, sql)
+    if args.partitioned:
+        return PRUNED_QUERIES.get(key, sql)
+    return sql
+
+
+def run_all(conn, args, cache=None, metrics=None):
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    fact_ready = False
+    for key, sql in selected_queries(args):
         print(f"\nRunning [{key}] ...")
-        start = time.time()
+        # in shared-scan mode the overlapping reports read the temp fact (with --partitioned, 3 and 9 add
+        # an od.orderdate window); `sql` stays the QUERIES text for titles and cache keys since the
+        # results are identical
+        exec_sql = execution_sql(key, sql, args)
+        record = metrics.start(key, exec_sql) if metrics else None
+        error = None
         try:
-            cur.execute(sql)
-            rows = cur.fetchall()
-            elapsed = time.time() - start
-            # convert RealDict rows to list of tuples to preserve column order
-            columns = list(rows[0].keys()) if rows else []
-            row_tuples = [tuple(r[col] for col in columns) for r in rows] if rows else []
-            print(f"Query finished in {elapsed:.3f}s — {len(row_tuples)} rows")
-            print_table(f"{key} — {sql.splitlines()[0]}", columns, row_tuples)
-            if args.save_csv:
-                fname = f"{key}.csv" if not args.csv_dir else f"{args.csv_dir.rstrip('/')}/{key}.csv"
-                save_csv(fname, columns, row_tuples)
-                print(f"Saved CSV -> {fname}")
+            cached = cache.get(key, sql) if cache and not args.refresh else None
+            if cached:
+                print("(served from result cache)")
+                if record is not None:
+                    record["status"] = "cached"
+                render_result(record, key, sql, *cached, 0.0, args)
+            else:
+                if args.shared_scan and exec_sql is not sql and not fact_ready:
+                    build_order_line_fact(conn)
+                    fact_ready = True
+                if args.copy:
+                    export_result(record, export_copy(conn, key, exec_sql, args))
+                    conn.commit()
+                else:
+                    columns, row_tuples, elapsed = fetch_result(cur, exec_sql, record)
+                    if cache:
+                        cache.put(key, sql, columns, row_tuples)
+                    render_result(record, key, sql, columns, row_tuples, elapsed, args)
         except Exception as e:
+            error = e
             print(f"Error running query [{key}]: {e}", file=sys.stderr)
-            # don't stop: continue to next query
+            # don't stop: clear the aborted transaction and continue to next query
+            conn.rollback()
+        if record is not None:
+            metrics.finish(record, error)
     cur.close()
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Run the 10 classicmodels queries and display/save results.")
+def run_snapshot(engine, args, metrics=None):
+    """--engine snapshot: the reports on the local SQLite snapshot (offline.py), no server involved."""
+    for key, sql in selected_queries(args):
+        print(f"\nRunning [{key}] ...")
+        record = metrics.start(key, sql) if metrics else None
+        error = None
+        try:
+            columns, row_tuples, elapsed = engine.fetch(key, sql, record)
+            render_result(record, key, sql, columns, row_tuples, elapsed, args)
+        except Exception as e:
+            error = e
+            print(f"Error running query [{key}]: {e}", file=sys.stderr)
+        if record is not None:
+            metrics.finish(record, error)
+
+
+def run_pooled(pool, func, *func_args):
+    """Borrow a connection from the pool, run func(conn, ...) and hand the connection back clean."""
+    conn = pool.getconn()
+    try:
+        return func(conn, *func_args)
+    finally:
+        # end the read transaction so the connection goes back idle (or un-aborted)
+        conn.rollback()
+        pool.putconn(conn)
+
+
+def run_parallel(pool, args, cache=None, metrics=None):
+    """
+    Run all QUERIES concurrently on pooled connections (one query per worker at a time).
+    Results are printed in QUERIES order, each as soon as it and all queries before it are done,
+    so the output is identical to the serial run. Metrics totals include the wait for a free worker.
+    """
+    wall_start = time.time()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = []
+        for key, sql in selected_queries(args):
+            cached = None
+            exec_sql = execution_sql(key, sql, args)
+            record = metrics.start(key, exec_sql) if metrics else None
+            if args.copy:
+                future = executor.submit(run_pooled, pool, export_copy, key, exec_sql, args)
+            else:
+                cached = cache.get(key, sql) if cache and not args.refresh else None
+                future = None if cached else executor.submit(run_pooled, pool, query_result, exec_sql, record)
+            futures.append((key, sql, future, cached, record))
+        for key, sql, future, cached, record in futures:
+            print(f"\nRunning [{key}] ...")
+            error = None
+            try:
+                if args.copy:
+                    export_result(record, future.result())
+                elif cached:
+                    print("(served from result cache)")
+                    if record is not None:
+                        record["status"] = "cached"
+                    render_result(record, key, sql, *cached, 0.0, args)
+                else:
+                    columns, row_tuples, elapsed = future.result()
+                    if cache:
+                        cache.put(key, sql, columns, row_tuples)
+                    render_result(record, key, sql, columns, row_tuples, elapsed, args)
+            except Exception as e:
+                error = e
+                print(f"Error running query [{key}]: {e}", file=sys.stderr)
+            if record is not None:
+                metrics.finish(record, error)
+    print(f"\nParallel run with {args.workers} workers finished in {time.time() - wall_start:.3f}s")
+
+
+def open_cache(conn, args):
+    """Build the result cache for this run (reads the table watermark), or None when disabled."""
+    if args.no_cache or args.copy:
+        return None
+    cache = ResultCache(args.cache_dir, fetch_watermark(conn), ttl=args.cache_ttl,
+                        max_bytes=args.cache_max_mb * 1024 * 1024)
+    conn.rollback()
+    return cache
+
+
+def print_cache_summary(cache):
+    if cache:
+        print(f"Result cache: {cache.hits} hits, {cache.misses} misses ({cache.directory})")
+
+
+def open_metrics(args):
+    """Metrics collector for --metrics-json/--metrics-prom/--metrics-hook, or None when none is given."""
+    if not (args.metrics_json or args.metrics_prom or args.metrics_hook):
+        return None
+    metrics = Metrics(args.metrics_hook)
+    metrics.load(args.metrics_json)
+    return metrics
+
+
+def write_metrics(metrics, args):
+    if metrics is None:
+        return
+    print("\nQuery metrics (execute_transfer = server execution + result transfer; fetch = conversion; render = print/save):")
+    print(metrics.summary())
+    if args.metrics_json:
+        metrics.write_json(args.metrics_json)
+        print(f"Saved metrics JSON -> {args.metrics_json}")
+    if args.metrics_prom:
+        metrics.write_prometheus(args.metrics_prom)
+        print(f"Saved Prometheus metrics -> {args.metrics_prom}")
+
+
+def add_connection_args(parser):
+    """Connection flags shared by main.py and the other command-line tools in this repo."""
     parser.add_argument("--host", default="localhost", help="DB host (default: localhost)")
     parser.add_argument("--port", default="5432", help="DB port (default: 5432)")
     parser.add_argument("--dbname", default="postgres", help="Database name")
     parser.add_argument("--user", default=None, help="DB user")
     parser.add_argument("--password", default=None, help="DB password")
-    parser.add_argument("--save-csv", dest="save_csv", action="store_true", help="Save each result to CSV files")
-    parser.add_argument("--csv-dir", dest="csv_dir", default="", help="Directory to save CSVs to (default: current dir)")
-    parser.add_argument("--timeout", type=int, default=60, help="Statement timeout in seconds")
-    args = parser.parse_args()
 
+
+def connection_info(args):
     conn_info = {
         "host": args.host,
         "port": args.port,
@@ -240,18 +537,135 @@ def main():
         conn_info["user"] = args.user
     if args.password:
         conn_info["password"] = args.password
+    return conn_info
+
 
-    print("Connecting to PostgreSQL with:", {k: conn_info[k] for k in ("host", "port", "dbname", "user")})
+def main():
+    parser = argparse.ArgumentParser(description="Run the 10 classicmodels queries and display/save results.")
+    add_connection_args(parser)
+    parser.add_argument("--save-csv", dest="save_csv", action="store_true", help="Save each result to CSV files")
+    parser.add_argument("--csv-dir", dest="csv_dir", default="", help="Directory to save CSVs to (default: current dir)")
+    parser.add_argument("--format", choices=FORMATS, default="csv",
+                        help="File format for --save-csv: csv, parquet or arrow (Arrow IPC); the last two need pyarrow")
+    parser.add_argument("--timeout", type=int, default=60, help="Statement timeout in seconds")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Run queries concurrently on a pool of N connections (default: 1, serial)")
+    parser.add_argument("--copy", action="store_true",
+                        help="Export results by streaming COPY ... TO STDOUT into CSV files (no table printing)")
+    parser.add_argument("--gzip", action="store_true", help="With --copy: write gzip-compressed .csv.gz files")
+    parser.add_argument("--detail", action="store_true",
+                        help="With --copy: also export the order-line 'Full Sales Data' detail query")
+    parser.add_argument("--cache-dir", dest="cache_dir", default=".report_cache",
+                        help="Directory of the on-disk result cache (default: .report_cache)")
+    parser.add_argument("--cache-ttl", dest="cache_ttl", type=int, default=3600,
+                        help="Maximum age of a cached result in seconds (default: 3600)")
+    parser.add_argument("--cache-max-mb", dest="cache_max_mb", type=int, default=256,
+                        help="Size budget of the cache directory; least recently used entries are evicted (default: 256)")
+    parser.add_argument("--no-cache", dest="no_cache", action="store_true", help="Bypass the result cache")
+    parser.add_argument("--refresh", action="store_true", help="Re-run every query and rebuild its cache entry")
+    parser.add_argument("--shared-scan", dest="shared_scan", action="store_true",
+                        help="Join orders/orderdetails once into a temp fact table and derive the overlapping reports from it")
+    parser.add_argument("--partitioned", action="store_true",
+                        help="Tables were migrated with partitions.py: window reports 3 and 9 on od.orderdate too, "
+                             "so orderdetails partitions are pruned")
+    parser.add_argument("--engine", choices=("postgres", "snapshot"), default="postgres",
+                        help="Where the reports run: the PostgreSQL server (default) or the local SQLite snapshot "
+                             "written by `offline.py snapshot` (no connection needed)")
+    parser.add_argument("--snapshot-file", dest="snapshot_file", default=DEFAULT_SNAPSHOT,
+                        help=f"With --engine snapshot: the snapshot file (default: {DEFAULT_SNAPSHOT})")
+    parser.add_argument("--advise", action="store_true",
+                        help="Instead of printing reports, EXPLAIN them and test candidate indexes (see advisor.py)")
+    parser.add_argument("--hypothetical", action="store_true",
+                        help="With --advise: test candidates as hypopg hypothetical indexes (plan cost only, no locks)")
+    parser.add_argument("--advise-runs", dest="advise_runs", type=int, default=3,
+                        help="With --advise: timed executions per query and candidate, median is reported (default: 3)")
+    parser.add_argument("--advise-min-rows", dest="advise_min_rows", type=int, default=1000,
+                        help="With --advise: ignore tables with fewer estimated rows (default: 1000)")
+    parser.add_argument("--advise-min-gain", dest="advise_min_gain", type=float, default=0.1,
+                        help="With --advise: minimum relative plan-cost reduction to recommend an index (default: 0.1)")
+    parser.add_argument("--emit-ddl", dest="emit_ddl", default="",
+                        help="With --advise: write the recommended CREATE INDEX statements to this file")
+    parser.add_argument("--metrics-json", dest="metrics_json", default="",
+                        help="Write per-query metrics (phases, rows, bytes, failures, cumulative latency histograms) "
+                             "to this JSON file; an existing file's histograms are continued")
+    parser.add_argument("--metrics-prom", dest="metrics_prom", default="",
+                        help="Write the same metrics in Prometheus text format (for a textfile collector)")
+    parser.add_argument("--metrics-hook", dest="metrics_hook", action="append", default=[],
+                        help="Import this module and call its before_query(key, sql) / after_query(key, record) "
+                             "around every query (repeatable)")
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be >= 1")
+    if args.shared_scan and args.workers > 1:
+        parser.error("--shared-scan builds a per-connection temp table and cannot be combined with --workers")
+    if args.shared_scan and args.partitioned:
+        parser.error("--shared-scan and --partitioned are alternatives; pick one")
+    if (args.gzip or args.detail) and not args.copy:
+        parser.error("--gzip and --detail require --copy")
+    if args.format != "csv" and args.copy:
+        parser.error("--copy always writes CSV; use --save-csv --format parquet|arrow instead")
+    if args.emit_ddl and not args.advise:
+        parser.error("--emit-ddl requires --advise")
+    if args.engine == "snapshot" and (args.copy or args.workers > 1 or args.shared_scan or args.partitioned
+                                      or args.advise):
+        parser.error("--copy, --workers, --shared-scan, --partitioned and --advise need the postgres engine")
+
+    if args.engine == "snapshot":
+        try:
+            engine = SnapshotEngine(args.snapshot_file, timeout=args.timeout)
+            print(f"Using snapshot {args.snapshot_file} (taken {engine.created} from {engine.source})")
+            metrics = open_metrics(args)
+            run_snapshot(engine, args, metrics)
+            engine.close()
+            write_metrics(metrics, args)
+            print("\nAll queries completed.")
+        except Exception as e:
+            print("Snapshot engine failed:", e, file=sys.stderr)
+            sys.exit(1)
+        return
+
+    conn_info = connection_info(args)
+
+    print("Connecting to PostgreSQL with:", {k: conn_info.get(k) for k in ("host", "port", "dbname", "user")})
     try:
-        conn = psycopg2.connect(**conn_info)
-        # set statement timeout (ms)
-        cur = conn.cursor()
-        cur.execute("SET statement_timeout = %s;", (args.timeout * 1000,))
-        conn.commit()
-        cur.close()
+        if args.workers > 1 and not args.advise:
+            # every pooled connection gets the statement timeout (ms) at connect time
+            pool = psycopg2.pool.ThreadedConnectionPool(
+                1, args.workers, options=f"-c statement_timeout={args.timeout * 1000}", **conn_info)
+            try:
+                cache = run_pooled(pool, open_cache, args)
+                metrics = open_metrics(args)
+                if metrics:
+                    run_pooled(pool, metrics.server_before)
+                run_parallel(pool, args, cache, metrics)
+                print_cache_summary(cache)
+                if metrics:
+                    run_pooled(pool, metrics.server_after, selected_queries(args))
+                write_metrics(metrics, args)
+            finally:
+                pool.closeall()
+        else:
+            conn = psycopg2.connect(**conn_info)
+            # set statement timeout (ms)
+            cur = conn.cursor()
+            cur.execute("SET statement_timeout = %s;", (args.timeout * 1000,))
+            conn.commit()
+            cur.close()
 
-        run_all(conn, args)
-        conn.close()
+            if args.advise:
+                advise(conn, selected_queries(args), args)
+                conn.close()
+                return
+            cache = open_cache(conn, args)
+            metrics = open_metrics(args)
+            if metrics:
+                metrics.server_before(conn)
+            run_all(conn, args, cache, metrics)
+            print_cache_summary(cache)
+            if metrics:
+                metrics.server_after(conn, selected_queries(args))
+            write_metrics(metrics, args)
+            conn.close()
         print("\nAll queries completed.")
     except Exception as e:
         print("Connection or execution failed:", e, file=sys.stderr)
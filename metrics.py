@@ -0,0 +1,214 @@
+"""
+Per-query metrics for main.py runs (--metrics-json / --metrics-prom / --metrics-hook).
+
+For every executed query a record is kept with
+  - execute_transfer: server execution + network transfer. psycopg2's default cursor returns from
+               execute() only once the whole result has arrived, so this is not a time to first row;
+  - fetch:     turning the received result into Python rows (type conversion, tuple building);
+  - render:    printing (tabulate) and writing CSV/Parquet;
+  - total, rows, approximate bytes on the wire (text protocol), and the status: ok, error or timeout.
+
+When pg_stat_statements is installed, its counters are read before and after the run and the per-query
+delta (calls, server execution time, shared buffer hits/reads) is added, so execute_transfer minus server
+time shows how much was network and queueing.
+
+Latency histograms (per query and phase) and failure counters are cumulative: if the --metrics-json file
+already exists its histograms are loaded and extended, so repeated scheduled runs build up a distribution.
+The same data is written in Prometheus text format for a node_exporter textfile collector.
+
+Hooks: --metrics-hook mymodule imports `mymodule`; if it defines before_query(key, sql) and/or
+after_query(key, record) they are called around every query (record is the dict described above).
+"""
+
+import importlib
+import json
+import math
+import os
+import time
+from datetime import datetime, timezone
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+PHASES = ("execute_transfer", "fetch", "render", "total")
+
+STAT_STATEMENTS_SQL = (
+    "SELECT query, calls, {exec_time} AS exec_ms, rows, shared_blks_hit, shared_blks_read\n"
+    "FROM pg_stat_statements\n"
+    "WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database());"
+)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram (Prometheus semantics)."""
+
+    def __init__(self, counts=None, total=0.0, count=0):
+        self.counts = list(counts) if counts else [0] * len(LATENCY_BUCKETS)
+        self.sum = total
+        self.count = count
+
+    def observe(self, seconds):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def to_dict(self):
+        return {"counts": self.counts, "sum": self.sum, "count": self.count}
+
+
+def approx_bytes(rows):
+    """Rough size of the result as the server sends it (text protocol)."""
+    return sum(len(str(v)) for row in rows for v in row if v is not None)
+
+
+def ms(seconds):
+    return f"{seconds * 1000:.1f}" if seconds is not None else "-"
+
+
+class Metrics:
+    def __init__(self, hook_modules=()):
+        self.records = []
+        self.histograms = {}     # (query, phase) -> Histogram
+        self.failures = {}       # (query, reason) -> count
+        self.server = {}
+        self.hooks = [importlib.import_module(name) for name in hook_modules]
+        self._stat_before = None
+
+    def load(self, path):
+        """Continue the cumulative histograms and failure counters of a previous JSON report."""
+        if not path or not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as f:
+            previous = json.load(f)
+        if previous.get("buckets") != [b if math.isfinite(b) else "+Inf" for b in LATENCY_BUCKETS]:
+            return  # bucket layout changed, start over
+        for key, phases in previous.get("histograms", {}).items():
+            for phase, h in phases.items():
+                phase = "execute_transfer" if phase == "ttfr" else phase   # files written before the rename
+                self.histograms[(key, phase)] = Histogram(h["counts"], h["sum"], h["count"])
+        for key, reasons in previous.get("failures", {}).items():
+            for reason, n in reasons.items():
+                self.failures[(key, reason)] = n
+
+    def start(self, key, sql):
+        for hook in self.hooks:
+            if hasattr(hook, "before_query"):
+                hook.before_query(key, sql)
+        return {"query": key, "status": "ok", "started": time.time(), "rows": 0, "bytes": 0,
+                "execute_transfer": None, "fetch": None, "render": None, "total": None}
+
+    def finish(self, record, error=None):
+        if error is not None:
+            timeout = type(error).__name__ == "QueryCanceled"
+            record["status"] = "timeout" if timeout else "error"
+            record["error"] = str(error).strip()
+            reason = (record["query"], record["status"])
+            self.failures[reason] = self.failures.get(reason, 0) + 1
+        record["total"] = time.time() - record.pop("started")
+        for phase in PHASES:
+            if record.get(phase) is not None and record["status"] != "cached":
+                self.histograms.setdefault((record["query"], phase), Histogram()).observe(record[phase])
+        self.records.append(record)
+        for hook in self.hooks:
+            if hasattr(hook, "after_query"):
+                hook.after_query(record["query"], record)
+
+    def read_stat_statements(self, conn):
+        """{first SQL line: (calls, exec_ms, rows, hit, read)} or None without pg_stat_statements."""
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'pg_stat_statements';")
+            if not cur.fetchone():
+                return None
+            cur.execute("SELECT 1 FROM information_schema.columns "
+                        "WHERE table_name = 'pg_stat_statements' AND column_name = 'total_exec_time';")
+            exec_time = "total_exec_time" if cur.fetchone() else "total_time"   # PostgreSQL 13 renamed it
+            cur.execute(STAT_STATEMENTS_SQL.format(exec_time=exec_time))
+            stats = {}
+            for query, calls, exec_ms, rows, hit, read in cur.fetchall():
+                # comments are not normalized, so the leading "-- title" line identifies a report
+                head = query.splitlines()[0] if query else ""
+                old = stats.get(head, (0, 0.0, 0, 0, 0))
+                stats[head] = tuple(a + b for a, b in zip(old, (calls, exec_ms, rows, hit, read)))
+            return stats
+        except Exception:
+            return None   # no permission on the view, or the library is not preloaded
+        finally:
+            cur.close()
+            conn.rollback()
+
+    def server_before(self, conn):
+        self._stat_before = self.read_stat_statements(conn)
+
+    def server_after(self, conn, queries):
+        after = self.read_stat_statements(conn)
+        if after is None or self._stat_before is None:
+            return
+        for key, sql in queries:
+            head = sql.splitlines()[0]
+            if head not in after:
+                continue
+            old = self._stat_before.get(head, (0, 0.0, 0, 0, 0))
+            calls, exec_ms, rows, hit, read = (a - b for a, b in zip(after[head], old))
+            if calls:
+                self.server[key] = {"calls": calls, "exec_ms": exec_ms, "rows": rows,
+                                    "shared_blks_hit": hit, "shared_blks_read": read}
+
+    def summary(self):
+        lines = [f"{'query':<42} {'status':>8} {'exec+xfer ms':>13} {'fetch ms':>9} {'render ms':>10} {'rows':>7} {'server ms':>10}"]
+        for r in self.records:
+            server = self.server.get(r["query"], {}).get("exec_ms")
+            server = server / 1000 if server is not None else None
+            lines.append(f"{r['query']:<42} {r['status']:>8} {ms(r['execute_transfer']):>13} {ms(r['fetch']):>9} "
+                         f"{ms(r['render']):>10} {r['rows']:>7} {ms(server):>10}")
+        return "\n".join(lines)
+
+    def to_dict(self):
+        histograms = {}
+        for (key, phase), h in self.histograms.items():
+            histograms.setdefault(key, {})[phase] = h.to_dict()
+        failures = {}
+        for (key, reason), n in self.failures.items():
+            failures.setdefault(key, {})[reason] = n
+        return {
+            "generated": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "buckets": [b if math.isfinite(b) else "+Inf" for b in LATENCY_BUCKETS],
+            "last_run": self.records,
+            "server": self.server,
+            "histograms": histograms,
+            "failures": failures,
+        }
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def write_prometheus(self, path):
+        out = ["# HELP report_query_seconds Report query latency by phase (execute_transfer, fetch, render, total).",
+               "# TYPE report_query_seconds histogram"]
+        for (key, phase), h in sorted(self.histograms.items()):
+            labels = f'query="{key}",phase="{phase}"'
+            for bound, n in zip(LATENCY_BUCKETS, h.counts):
+                le = "+Inf" if math.isinf(bound) else repr(bound)
+                out.append(f'report_query_seconds_bucket{{{labels},le="{le}"}} {n}')
+            out.append(f"report_query_seconds_sum{{{labels}}} {h.sum}")
+            out.append(f"report_query_seconds_count{{{labels}}} {h.count}")
+        out += ["# HELP report_query_failures_total Failed report queries by reason (error, timeout).",
+                "# TYPE report_query_failures_total counter"]
+        for (key, reason), n in sorted(self.failures.items()):
+            out.append(f'report_query_failures_total{{query="{key}",reason="{reason}"}} {n}')
+        out += ["# HELP report_query_rows Rows returned by the last run.", "# TYPE report_query_rows gauge"]
+        out += [f'report_query_rows{{query="{r["query"]}"}} {r["rows"]}' for r in self.records]
+        out += ["# HELP report_query_bytes Approximate result bytes of the last run.",
+                "# TYPE report_query_bytes gauge"]
+        out += [f'report_query_bytes{{query="{r["query"]}"}} {r["bytes"]}' for r in self.records]
+        if self.server:
+            out += ["# HELP report_query_server_seconds Server execution time in the last run (pg_stat_statements).",
+                    "# TYPE report_query_server_seconds gauge"]
+            out += [f'report_query_server_seconds{{query="{k}"}} {s["exec_ms"] / 1000}'
+                    for k, s in sorted(self.server.items())]
+        # write-then-rename so a textfile collector never reads a half-written file
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("\n".join(out) + "\n")
+        os.replace(tmp, path)
@@ -0,0 +1,757 @@
+#!/usr/bin/env python3
+"""
+Offline snapshot engine: the classicmodels reports without a PostgreSQL server.
+
+`snapshot` copies every classicmodels table into one indexed SQLite file (stdlib sqlite3), inside a single
+REPEATABLE READ transaction so the tables are mutually consistent. Before disconnecting it runs the reports on
+Postgres and records their result column types. It then runs them again on the new file and prints whether
+each result matches.
+
+  python offline.py snapshot --dbname classicmodels --user postgres --out classicmodels.sqlite
+  python main.py --engine snapshot --snapshot-file classicmodels.sqlite --save-csv
+
+SnapshotEngine runs the report SQL unchanged. The file is ATTACHed as `classicmodels`, and translate() rewrites
+the Postgres-specific parts into functions registered from Python:
+  - date_trunc, EXTRACT, current_date and `date ± INTERVAL 'n months|days|years'` (month arithmetic clamps
+    to the month end like Postgres);
+  - `::NUMERIC[(p,s)]`, `::INT` and `::date` casts;
+  - SUM, AVG, MIN, MAX, ROUND, `*`, `/` and comparisons with numeric literals, evaluated in exact decimal
+    arithmetic with Postgres' result scales (AVG and division follow numeric.c's select_div_scale);
+  - every ORDER BY item gets the numeric collation and Postgres' NULLS placement (NULLS LAST for ASC,
+    NULLS FIRST for DESC, unless given).
+
+Storage: NUMERIC values are TEXT (exact decimal strings), dates are INTEGER proleptic ordinals (so date - date
+is a day count, as in Postgres), integers are INTEGER. Rows come back converted to the types Postgres returned
+when the snapshot was taken: Decimal, datetime.date and int.
+
+Rows that tie on every ORDER BY key can come back in a different order than on Postgres, whose order among
+them depends on the plan. Comparisons between two numeric expressions (rather than against a literal) are not
+rewritten. An unsupported construct (another cast, a bare INTERVAL) raises ValueError instead of returning
+different results.
+
+The numeric helpers and translate() carry doctests with PostgreSQL's own outputs; they need no server:
+
+  python -m doctest -v offline.py
+"""
+
+import argparse
+import calendar
+import os
+import re
+import sqlite3
+import sys
+import time
+from datetime import date, datetime, time as datetime_time
+from decimal import ROUND_HALF_UP, Context, Decimal, InvalidOperation
+from pathlib import Path
+
+try:
+    import psycopg2
+except Exception as e:
+    print("Missing dependency 'psycopg2'. Install with: pip install psycopg2-binary", file=sys.stderr)
+    raise
+
+SCHEMA = "classicmodels"
+DEFAULT_SNAPSHOT = "classicmodels.sqlite"
+BATCH_SIZE = 10000
+
+# PostgreSQL type OIDs the copy and the result conversion care about
+BOOL, INT8, INT2, INT4, FLOAT4, FLOAT8, DATE, TIMESTAMP, NUMERIC = 16, 20, 21, 23, 700, 701, 1082, 1114, 1700
+INTEGER_TYPES = (INT8, INT2, INT4)
+
+# exact decimal arithmetic; the precision only has to exceed any value the reports produce
+CONTEXT = Context(prec=1000, rounding=ROUND_HALF_UP)
+
+TABLES_SQL = (
+    "SELECT c.relname\n"
+    "FROM pg_class c\n"
+    "JOIN pg_namespace n ON n.oid = c.relnamespace\n"
+    "WHERE n.nspname = %s AND c.relkind IN ('r', 'p') AND NOT c.relispartition\n"
+    "ORDER BY 1;"
+)
+
+COLUMNS_SQL = (
+    "SELECT attname, atttypid\n"
+    "FROM pg_attribute\n"
+    "WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped\n"
+    "ORDER BY attnum;"
+)
+
+# the primary key, plus the column lists of foreign keys and plain (non-expression, non-partial) indexes
+KEYS_SQL = (
+    "SELECT con.contype, array_agg(a.attname ORDER BY k.ord)\n"
+    "FROM pg_constraint con\n"
+    "CROSS JOIN LATERAL unnest(con.conkey) WITH ORDINALITY AS k(attnum, ord)\n"
+    "JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum\n"
+    "WHERE con.conrelid = %(table)s::regclass AND con.contype IN ('p', 'f')\n"
+    "GROUP BY con.oid, con.contype\n"
+    "UNION ALL\n"
+    "SELECT 'i', array_agg(a.attname ORDER BY k.ord)\n"
+    "FROM pg_index i\n"
+    "CROSS JOIN LATERAL unnest(i.indkey::int2[]) WITH ORDINALITY AS k(attnum, ord)\n"
+    "JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum\n"
+    "WHERE i.indrelid = %(table)s::regclass AND NOT i.indisprimary\n"
+    "  AND i.indexprs IS NULL AND i.indpred IS NULL\n"
+    "GROUP BY i.indexrelid;"
+)
+
+
+# ---------------------------------------------------------------------------------------------------------
+# PostgreSQL semantics on SQLite values (decimals arrive as TEXT, dates as ordinals)
+
+def dec(value):
+    if isinstance(value, float):
+        return Decimal(repr(value))
+    return Decimal(value)
+
+
+def dscale(x):
+    return max(0, -x.as_tuple().exponent)
+
+
+def unscaled(x):
+    """x as (integer, exponent) with x == integer * 10**exponent."""
+    sign, digits, exponent = x.as_tuple()
+    n = int("".join(map(str, digits)) or "0")
+    return (-n if sign else n), exponent
+
+
+def base10000(x):
+    """Weight and first digit of |x| in Postgres' base-10000 NUMERIC representation, (0, 0) for zero."""
+    if not x:
+        return 0, 0
+    weight = x.adjusted() // 4
+    return weight, int(CONTEXT.scaleb(abs(x), -4 * weight))
+
+
+def round_scale(x, scale):
+    """
+    round(numeric, scale): half away from zero; a negative scale rounds to tens, hundreds, ...
+
+    >>> round_scale(Decimal("0.00005"), 4), round_scale(Decimal("-2.5"), 0), str(round_scale(Decimal(1250), -2))
+    (Decimal('0.0001'), Decimal('-3'), '1300')
+    """
+    if scale >= 0:
+        return x.quantize(Decimal(1).scaleb(-scale), context=CONTEXT)
+    return x.quantize(Decimal(1).scaleb(-scale), context=CONTEXT).quantize(Decimal(1), context=CONTEXT)
+
+
+def numeric_divide(a, b):
+    """
+    a / b for NUMERIC, with the result scale chosen by select_div_scale() in numeric.c (exactly rounded).
+    The expected values are what PostgreSQL prints for 1::numeric / 3, 10::numeric / 4 and 1000::numeric / 3:
+
+    >>> numeric_divide(Decimal(1), Decimal(3))
+    Decimal('0.33333333333333333333')
+    >>> numeric_divide(Decimal(10), Decimal(4))
+    Decimal('2.5000000000000000')
+    >>> numeric_divide(Decimal(1000), Decimal(3))
+    Decimal('333.3333333333333333')
+    """
+    if not b:
+        raise ZeroDivisionError("division by zero")
+    weight1, first1 = base10000(a)
+    weight2, first2 = base10000(b)
+    qweight = weight1 - weight2 - (1 if first1 <= first2 else 0)
+    rscale = min(max(16 - qweight * 4, dscale(a), dscale(b), 0), 1000)
+    n, ea = unscaled(a)
+    d, eb = unscaled(b)
+    shift = ea - eb + rscale
+    if shift >= 0:
+        n *= 10 ** shift
+    else:
+        d *= 10 ** -shift
+    negative = (n < 0) != (d < 0)
+    q = (2 * abs(n) + abs(d)) // (2 * abs(d))
+    return Decimal(f"{'-' if negative else ''}{q}E{-rscale}")
+
+
+def pg_mul(a, b):
+    if a is None or b is None:
+        return None
+    if isinstance(a, int) and isinstance(b, int):
+        return a * b
+    return str(CONTEXT.multiply(dec(a), dec(b)))
+
+
+def pg_div(a, b):
+    if a is None or b is None:
+        return None
+    if isinstance(a, int) and isinstance(b, int):
+        if b == 0:
+            raise ZeroDivisionError("division by zero")
+        q = abs(a) // abs(b)   # integer division truncates toward zero
+        return -q if (a < 0) != (b < 0) else q
+    return str(numeric_divide(dec(a), dec(b)))
+
+
+def pg_round(x, scale=0):
+    if x is None:
+        return None
+    return str(round_scale(dec(x), scale))
+
+
+def pg_numeric(x, precision=None, scale=None):
+    if x is None:
+        return None
+    value = dec(x)
+    if precision is not None and scale is None:
+        scale = 0   # NUMERIC(p) is NUMERIC(p,0)
+    if scale is not None:
+        value = round_scale(value, scale)
+    if precision is not None and value and value.adjusted() + 1 > precision - scale:
+        raise ValueError(f"numeric field overflow: {value} does not fit NUMERIC({precision},{scale})")
+    return str(value)
+
+
+def pg_int(x):
+    if x is None or isinstance(x, int):
+        return x
+    return int(round_scale(dec(x), 0))
+
+
+def pg_cmp(a, b):
+    if a is None or b is None:
+        return None
+    x, y = dec(a), dec(b)
+    return (x > y) - (x < y)
+
+
+def numeric_collation(a, b):
+    """ORDER BY on TEXT decimals compares them as numbers; other text falls back to code-point order."""
+    try:
+        x, y = Decimal(a), Decimal(b)
+    except InvalidOperation:
+        x, y = a, b
+    return (x > y) - (x < y)
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    year, month = day.year + month // 12, month % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def pg_add_interval(ordinal, n, unit):
+    if ordinal is None:
+        return None
+    unit = unit.lower()
+    if unit == "day":
+        return ordinal + n
+    months = n * 12 if unit == "year" else n
+    return add_months(date.fromordinal(ordinal), months).toordinal()
+
+
+def pg_date_trunc(unit, ordinal):
+    if ordinal is None:
+        return None
+    day = date.fromordinal(ordinal)
+    unit = unit.lower()
+    if unit == "year":
+        day = day.replace(month=1, day=1)
+    elif unit == "quarter":
+        day = day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    elif unit == "month":
+        day = day.replace(day=1)
+    elif unit == "week":
+        return ordinal - day.weekday()
+    elif unit != "day":
+        raise ValueError(f"date_trunc unit {unit!r} is not supported on the snapshot engine")
+    return day.toordinal()
+
+
+def pg_extract(field, ordinal):
+    if ordinal is None:
+        return None
+    day = date.fromordinal(ordinal)
+    field = field.lower()
+    fields = {
+        "year": day.year,
+        "quarter": (day.month - 1) // 3 + 1,
+        "month": day.month,
+        "day": day.day,
+        "dow": day.isoweekday() % 7,
+        "isodow": day.isoweekday(),
+        "doy": day.timetuple().tm_yday,
+        "week": day.isocalendar()[1],
+    }
+    if field not in fields:
+        raise ValueError(f"EXTRACT({field.upper()} ...) is not supported on the snapshot engine")
+    return fields[field]
+
+
+def pg_current_date():
+    return date.today().toordinal()
+
+
+class Sum:
+    """
+    SUM: integers stay integers (bigint), any decimal input makes the result NUMERIC.
+
+    >>> total = Sum()
+    >>> for value in (1, 2, None):
+    ...     total.step(value)
+    >>> total.finalize()
+    3
+    >>> total.step("1.305")
+    >>> total.finalize()
+    '4.305'
+    """
+
+    def __init__(self):
+        self.total = None
+
+    def step(self, value):
+        if value is None:
+            return
+        if isinstance(value, int) and (self.total is None or isinstance(self.total, int)):
+            self.total = (self.total or 0) + value
+        else:
+            self.total = CONTEXT.add(dec(self.total or 0), dec(value))
+
+    def finalize(self):
+        return str(self.total) if isinstance(self.total, Decimal) else self.total
+
+
+class Avg:
+    """
+    AVG of integers or decimals: NUMERIC sum / count, as numeric_avg() computes it.
+    PostgreSQL: AVG over 1, 2, 2 is 1.6666666666666667, AVG over 1.5, 2.5 is 2.0000000000000000.
+
+    >>> avg = Avg()
+    >>> for value in (1, 2, 2):
+    ...     avg.step(value)
+    >>> avg.finalize()
+    '1.6666666666666667'
+    >>> avg = Avg()
+    >>> for value in ("1.5", "2.5", None):
+    ...     avg.step(value)
+    >>> avg.finalize()
+    '2.0000000000000000'
+    """
+
+    def __init__(self):
+        self.total = Decimal(0)
+        self.count = 0
+
+    def step(self, value):
+        if value is not None:
+            self.total = CONTEXT.add(self.total, dec(value))
+            self.count += 1
+
+    def finalize(self):
+        return str(numeric_divide(self.total, Decimal(self.count))) if self.count else None
+
+
+class Extreme:
+    """MIN/MAX that compare TEXT decimals as numbers."""
+    sign = 1
+
+    def __init__(self):
+        self.best = None
+
+    def step(self, value):
+        if value is None:
+            return
+        if isinstance(value, str) and isinstance(self.best, str):
+            better = numeric_collation(value, self.best) * self.sign > 0
+        else:
+            better = self.best is None or (value > self.best if self.sign > 0 else value < self.best)
+        if better:
+            self.best = value
+
+    def finalize(self):
+        return self.best
+
+
+class Min(Extreme):
+    sign = -1
+
+
+class Max(Extreme):
+    sign = 1
+
+
+# ---------------------------------------------------------------------------------------------------------
+# Postgres SQL -> SQLite SQL
+
+# a function call (two levels of nested parentheses), a parenthesized expression, or a (qualified) name
+CALL = r"\w+\((?:[^()]|\((?:[^()]|\([^()]*\))*\))*\)"
+OPERAND = rf"(?:{CALL}|\((?:[^()]|\([^()]*\))*\)|[\w.]+)"
+
+CAST_RE = re.compile(rf"({OPERAND})::(\w+)(?:\(\s*(\d+)\s*(?:,\s*(\d+)\s*)?\))?", re.I)
+INTERVAL_RE = re.compile(rf"({OPERAND})\s*([+-])\s*INTERVAL\s*'(-?\d+)\s*(day|month|year)s?'", re.I)
+ARITHMETIC_RE = re.compile(rf"({OPERAND})\s*([*/])\s*({OPERAND})")
+LITERAL_COMPARISON_RE = re.compile(
+    rf"(\b(?:WHEN|WHERE|AND|OR|ON|HAVING)\s+|\(\s*)({OPERAND})\s*(<>|!=|<=|>=|=|<|>)\s*(-?\d+(?:\.\d+)?)\b", re.I)
+ORDER_BY_RE = re.compile(r"\bORDER\s+BY\s+(.+?)(?=\s*(?:\bLIMIT\b|\bOFFSET\b|;|\)|$))", re.I | re.S)
+ORDER_ITEM_RE = re.compile(r"^(.*?)(?:\s+(ASC|DESC))?(?:\s+NULLS\s+(FIRST|LAST))?$", re.I | re.S)
+
+RENAMES = [
+    (re.compile(r"\bdate_trunc\(\s*'(\w+)'\s*,", re.I), r"pg_date_trunc('\1',"),
+    (re.compile(r"\bEXTRACT\(\s*(\w+)\s+FROM\s+", re.I), r"pg_extract('\1', "),
+    (re.compile(r"\bcurrent_date\b", re.I), "pg_current_date()"),
+    (re.compile(r"\bSUM\(", re.I), "pg_sum("),
+    (re.compile(r"\bAVG\(", re.I), "pg_avg("),
+    (re.compile(r"\bMIN\(", re.I), "pg_min("),
+    (re.compile(r"\bMAX\(", re.I), "pg_max("),
+    (re.compile(r"\bROUND\(", re.I), "pg_round("),
+]
+
+
+def cast(match):
+    operand, type_name, precision, scale = match.groups()
+    type_name = type_name.lower()
+    if type_name in ("numeric", "decimal"):
+        args = [operand] + [n for n in (precision, scale) if n is not None]
+        return f"pg_numeric({', '.join(args)})"
+    if type_name in ("int", "integer", "int4", "bigint", "int8", "smallint", "int2"):
+        return f"pg_int({operand})"
+    if type_name == "date":
+        return operand   # dates are already day ordinals
+    if type_name in ("text", "varchar"):
+        return f"CAST({operand} AS TEXT)"
+    raise ValueError(f"cast ::{type_name} is not supported on the snapshot engine")
+
+
+def interval(match):
+    operand, sign, n, unit = match.groups()
+    n = int(n) if sign == "+" else -int(n)
+    return f"pg_add_interval({operand}, {n}, '{unit.lower()}')"
+
+
+def arithmetic(match):
+    left, operator, right = match.groups()
+    return f"{'pg_mul' if operator == '*' else 'pg_div'}({left}, {right})"
+
+
+def split_top_level(text):
+    items, depth, start = [], 0, 0
+    for i, ch in enumerate(text):
+        depth += ch == "("
+        depth -= ch == ")"
+        if ch == "," and depth == 0:
+            items.append(text[start:i])
+            start = i + 1
+    return items + [text[start:]]
+
+
+def order_by(match):
+    items = []
+    for item in split_top_level(match.group(1)):
+        expr, direction, nulls = ORDER_ITEM_RE.match(item.strip()).groups()
+        direction = (direction or "ASC").upper()
+        nulls = (nulls or ("FIRST" if direction == "DESC" else "LAST")).upper()
+        items.append(f"{expr} COLLATE numeric {direction} NULLS {nulls}")
+    return "ORDER BY " + ", ".join(items)
+
+
+def substitute(pattern, replacement, sql):
+    """Apply until nothing changes, so nested and chained occurrences are all rewritten."""
+    while True:
+        sql, n = pattern.subn(replacement, sql)
+        if not n:
+            return sql
+
+
+def translate(sql):
+    """
+    PostgreSQL report SQL -> SQLite SQL for a SnapshotEngine connection (see the module docstring).
+
+    >>> print(translate("SELECT SUM(price * qty)::NUMERIC(14,2) AS r FROM t ORDER BY r DESC;"))
+    SELECT pg_numeric(pg_sum(pg_mul(price, qty)), 14, 2) AS r FROM t ORDER BY r COLLATE numeric DESC NULLS FIRST;
+    >>> print(translate("SELECT o.status FROM t WHERE o.orderdate >= current_date - INTERVAL '12 months'"))
+    SELECT o.status FROM t WHERE o.orderdate >= pg_add_interval(pg_current_date(), -12, 'month')
+    """
+    sql = "\n".join(line for line in sql.splitlines() if not line.lstrip().startswith("--"))
+    for pattern, replacement in RENAMES:
+        sql = pattern.sub(replacement, sql)
+    sql = substitute(INTERVAL_RE, interval, sql)
+    if re.search(r"\bINTERVAL\b", sql, re.I):
+        raise ValueError("only `date ± INTERVAL 'n days|months|years'` is supported on the snapshot engine")
+    sql = substitute(CAST_RE, cast, sql)
+    sql = substitute(ARITHMETIC_RE, arithmetic, sql)
+    sql = LITERAL_COMPARISON_RE.sub(lambda m: f"{m.group(1)}pg_cmp({m.group(2)}, {m.group(4)}) {m.group(3)} 0", sql)
+    return ORDER_BY_RE.sub(order_by, sql)
+
+
+# ---------------------------------------------------------------------------------------------------------
+# Engine
+
+def to_decimal(value):
+    return dec(value) if not isinstance(value, Decimal) else value
+
+
+CONVERTERS = {
+    NUMERIC: to_decimal,
+    DATE: date.fromordinal,
+    # date_trunc() without ::date yields a day ordinal; timestamp columns are copied as ISO text
+    TIMESTAMP: lambda v: datetime.combine(date.fromordinal(v), datetime_time()) if isinstance(v, int)
+    else datetime.fromisoformat(v),
+    BOOL: bool,
+    INT8: int, INT4: int, INT2: int,
+}
+
+
+class SnapshotEngine:
+    """Runs report SQL on a snapshot file; results are typed as Postgres returned them."""
+
+    def __init__(self, path, timeout=None):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"snapshot {path} not found; create it with: python offline.py snapshot ...")
+        if sqlite3.sqlite_version_info < (3, 30, 0):
+            raise RuntimeError(f"SQLite {sqlite3.sqlite_version} is too old for NULLS FIRST/LAST (needs 3.30+)")
+        self.timeout = timeout
+        self.conn = sqlite3.connect("file::memory:", uri=True)
+        self.conn.execute("ATTACH DATABASE ? AS classicmodels;", (Path(path).resolve().as_uri() + "?mode=ro",))
+        for name, func, nargs in [
+            ("pg_mul", pg_mul, 2), ("pg_div", pg_div, 2), ("pg_round", pg_round, 1), ("pg_round", pg_round, 2),
+            ("pg_numeric", pg_numeric, 1), ("pg_numeric", pg_numeric, 2), ("pg_numeric", pg_numeric, 3),
+            ("pg_int", pg_int, 1), ("pg_cmp", pg_cmp, 2), ("pg_add_interval", pg_add_interval, 3),
+            ("pg_date_trunc", pg_date_trunc, 2), ("pg_extract", pg_extract, 2),
+        ]:
+            self.conn.create_function(name, nargs, func, deterministic=True)
+        self.conn.create_function("pg_current_date", 0, pg_current_date)
+        for name, aggregate in [("pg_sum", Sum), ("pg_avg", Avg), ("pg_min", Min), ("pg_max", Max)]:
+            self.conn.create_aggregate(name, 1, aggregate)
+        self.conn.create_collation("numeric", numeric_collation)
+
+        meta = dict(self.conn.execute("SELECT key, value FROM classicmodels._snapshot_meta;"))
+        self.created = meta.get("created", "?")
+        self.source = meta.get("source", "?")
+        self.report_types = {}
+        for report, oid in self.conn.execute(
+                "SELECT report, type_oid FROM classicmodels._report_columns ORDER BY report, position;"):
+            self.report_types.setdefault(report, []).append(oid)
+        # fallback for SQL without recorded types: output columns named like a base column
+        self.column_types = {}
+        for name, oid in self.conn.execute("SELECT column_name, type_oid FROM classicmodels._snapshot_columns;"):
+            self.column_types[name] = oid if self.column_types.get(name, oid) == oid else None
+        self._translated = {}
+
+    def close(self):
+        self.conn.close()
+
+    def sqlite_sql(self, sql):
+        if sql not in self._translated:
+            self._translated[sql] = translate(sql)
+        return self._translated[sql]
+
+    def _interrupt_after(self, seconds):
+        deadline = time.time() + seconds
+        self.conn.set_progress_handler(lambda: time.time() > deadline, 10000)
+
+    def fetch(self, key, sql, record=None):
+        """Like main.fetch_result(): (columns, row tuples, elapsed seconds); fills a metrics `record`."""
+        start = time.time()
+        if self.timeout:
+            self._interrupt_after(self.timeout)
+        try:
+            cur = self.conn.execute(self.sqlite_sql(sql))
+            executed = time.time()
+            rows = cur.fetchall()
+        finally:
+            self.conn.set_progress_handler(None, 0)
+        columns = [d[0] for d in cur.description]
+        types = self.report_types.get(key)
+        if not types or len(types) != len(columns):
+            types = [self.column_types.get(name) for name in columns]
+        converters = [CONVERTERS.get(oid) for oid in types]
+        row_tuples = [tuple(v if v is None or c is None else c(v) for v, c in zip(row, converters)) for row in rows]
+        end = time.time()
+        if record is not None:
+            from metrics import approx_bytes
+            record.update(execute_transfer=executed - start, fetch=end - executed, rows=len(row_tuples),
+                          bytes=approx_bytes(row_tuples))
+        return columns, row_tuples, end - start
+
+
+# ---------------------------------------------------------------------------------------------------------
+# Snapshot creation
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def sqlite_column(oid):
+    """(declared SQLite type, value conversion) for a Postgres column type."""
+    if oid in INTEGER_TYPES:
+        return "INTEGER", None
+    if oid == BOOL:
+        return "INTEGER", int
+    if oid in (FLOAT4, FLOAT8):
+        return "REAL", None
+    if oid == DATE:
+        return "INTEGER", date.toordinal
+    if oid == NUMERIC:
+        # TEXT affinity keeps the exact digits; a NUMERIC column would turn them into floats
+        return "TEXT", str
+    return "TEXT", str
+
+
+def copy_table(pg_conn, db, table, batch_size):
+    qualified = f"{SCHEMA}.{quote(table)}"
+    cur = pg_conn.cursor()
+    cur.execute(COLUMNS_SQL, (qualified,))
+    columns = cur.fetchall()
+    cur.execute(KEYS_SQL, {"table": qualified})
+    keys = cur.fetchall()
+    cur.close()
+
+    primary_key = next((cols for kind, cols in keys if kind == "p"), None)
+    definitions = [f"{quote(name)} {sqlite_column(oid)[0]}" for name, oid in columns]
+    if primary_key:
+        definitions.append(f"PRIMARY KEY ({', '.join(map(quote, primary_key))})")
+    db.execute(f"CREATE TABLE {quote(table)} ({', '.join(definitions)});")
+    db.executemany("INSERT INTO _snapshot_columns VALUES (?, ?, ?);", [(table, name, oid) for name, oid in columns])
+
+    conversions = [sqlite_column(oid)[1] for _, oid in columns]
+    insert = f"INSERT INTO {quote(table)} VALUES ({', '.join('?' * len(columns))});"
+    source = pg_conn.cursor(name=f"offline_snapshot_{table}")
+    source.itersize = batch_size
+    source.execute(f"SELECT {', '.join(quote(name) for name, _ in columns)} FROM {qualified};")
+    copied = 0
+    while True:
+        batch = source.fetchmany(batch_size)
+        if not batch:
+            break
+        db.executemany(insert, [tuple(v if v is None or f is None else f(v) for v, f in zip(row, conversions))
+                                for row in batch])
+        copied += len(batch)
+    source.close()
+
+    index_columns = {tuple(cols) for kind, cols in keys if kind in ("f", "i")} - {tuple(primary_key or ())}
+    for n, cols in enumerate(sorted(index_columns)):
+        db.execute(f"CREATE INDEX {quote(f'{table}_idx{n}')} ON {quote(table)} ({', '.join(map(quote, cols))});")
+    return copied, len(index_columns) + bool(primary_key)
+
+
+def capture_reports(pg_conn, queries, detail_queries):
+    """Run the reports on Postgres: {key: (columns, rows)} to verify against, and {key: [(name, type oid)]}."""
+    from main import copy_sql
+
+    expected, types = {}, {}
+    cur = pg_conn.cursor()
+    for key, sql in queries:
+        cur.execute(sql)
+        expected[key] = ([d[0] for d in cur.description], cur.fetchall())
+        types[key] = [(d[0], d[1]) for d in cur.description]
+    for key, sql in detail_queries:
+        # too large to run in full here; only the column types are needed
+        cur.execute(f"SELECT * FROM ({copy_sql(sql)}) q LIMIT 0;")
+        types[key] = [(d[0], d[1]) for d in cur.description]
+    cur.close()
+    return expected, types
+
+
+def same_rows(expected, got):
+    """'match', 'tie order' (same rows, differently ordered) or 'DIFFERS'. repr() keeps Decimal scales apart."""
+    expected, got = [tuple(map(repr, r)) for r in expected], [tuple(map(repr, r)) for r in got]
+    if expected == got:
+        return "match"
+    return "tie order" if sorted(expected) == sorted(got) else "DIFFERS"
+
+
+def snapshot(pg_conn, args, conn_info):
+    from main import DETAIL_QUERIES, QUERIES
+
+    start = time.time()
+    # one snapshot for every table and for the report run that the copy is verified against
+    pg_conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+    cur = pg_conn.cursor()
+    cur.execute(TABLES_SQL, (SCHEMA,))
+    tables = [name for (name,) in cur.fetchall()]
+    cur.execute("SHOW server_version;")
+    server_version = cur.fetchone()[0]
+    cur.close()
+    if args.tables:
+        wanted = [t.strip() for t in args.tables.split(",") if t.strip()]
+        missing = sorted(set(wanted) - set(tables))
+        if missing:
+            raise RuntimeError(f"no such table(s) in {SCHEMA}: {', '.join(missing)}")
+        tables = wanted
+    if not tables:
+        raise RuntimeError(f"schema {SCHEMA} has no tables")
+
+    tmp = args.out + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    db = sqlite3.connect(tmp)
+    try:
+        db.execute("PRAGMA journal_mode = OFF;")
+        db.execute("PRAGMA synchronous = OFF;")
+        db.execute("CREATE TABLE _snapshot_meta (key TEXT PRIMARY KEY, value TEXT);")
+        db.execute("CREATE TABLE _snapshot_columns (table_name TEXT, column_name TEXT, type_oid INTEGER);")
+        db.execute("CREATE TABLE _report_columns (report TEXT, position INTEGER, name TEXT, type_oid INTEGER, "
+                   "PRIMARY KEY (report, position));")
+        for table in tables:
+            t0 = time.time()
+            rows, indexes = copy_table(pg_conn, db, table, args.batch_size)
+            print(f"  {table}: {rows} rows, {indexes} indexes in {time.time() - t0:.2f}s")
+
+        expected, types = capture_reports(pg_conn, QUERIES, DETAIL_QUERIES)
+        db.executemany("INSERT INTO _report_columns VALUES (?, ?, ?, ?);",
+                       [(key, i, name, oid) for key, cols in types.items() for i, (name, oid) in enumerate(cols)])
+        source = {k: conn_info.get(k) for k in ("host", "port", "dbname")}
+        db.executemany("INSERT INTO _snapshot_meta VALUES (?, ?);", [
+            ("created", datetime.now().isoformat(timespec="seconds")),
+            ("source", "{host}:{port}/{dbname}".format(**source)),
+            ("server_version", server_version),
+            ("tables", ",".join(tables)),
+        ])
+        db.commit()
+        db.execute("ANALYZE;")
+        db.commit()
+    finally:
+        db.close()
+    pg_conn.rollback()
+    os.replace(tmp, args.out)
+    print(f"Saved snapshot -> {args.out} ({os.path.getsize(args.out) / 1048576:.2f} MiB) "
+          f"in {time.time() - start:.2f}s")
+
+    engine = SnapshotEngine(args.out)
+    differs = 0
+    try:
+        for key, sql in QUERIES:
+            try:
+                columns, rows, elapsed = engine.fetch(key, sql)
+                outcome = same_rows(expected[key][1], rows) if columns == expected[key][0] else "DIFFERS"
+            except Exception as e:
+                outcome, elapsed = f"DIFFERS ({e})", 0.0
+            differs += outcome.startswith("DIFFERS")
+            print(f"  {key:<42} {elapsed * 1000:8.1f} ms  {outcome}")
+    finally:
+        engine.close()
+    if differs:
+        print(f"{differs} report(s) differ from PostgreSQL on this snapshot", file=sys.stderr)
+        sys.exit(1)
+    print("All reports match PostgreSQL ('tie order': rows that tie on the ORDER BY keys came back in another order).")
+
+
+def main():
+    from main import add_connection_args, connection_info   # main imports this module
+
+    parser = argparse.ArgumentParser(description="Offline SQLite snapshot of classicmodels for main.py --engine snapshot.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    snap_p = sub.add_parser("snapshot", help="Copy the classicmodels tables into an indexed SQLite file and verify the reports")
+    snap_p.add_argument("--out", default=DEFAULT_SNAPSHOT, help=f"Snapshot file (default: {DEFAULT_SNAPSHOT})")
+    snap_p.add_argument("--tables", default="", help="Comma-separated tables to copy (default: every table in the schema)")
+    snap_p.add_argument("--batch-size", dest="batch_size", type=int, default=BATCH_SIZE,
+                        help=f"Rows per fetch from the server-side cursor (default: {BATCH_SIZE})")
+    add_connection_args(snap_p)
+    args = parser.parse_args()
+
+    conn_info = connection_info(args)
+    try:
+        conn = psycopg2.connect(**conn_info)
+        try:
+            snapshot(conn, args, conn_info)
+        finally:
+            conn.close()
+    except Exception as e:
+        print("Snapshot failed:", e, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,507 @@
+#!/usr/bin/env python3
+"""
+Monthly range partitions for classicmodels.orders, orderdetails and payments.
+
+  migrate   rebuild the three tables as tables partitioned by month, in one transaction:
+              orders        PARTITION BY RANGE (orderdate),   PK (ordernumber, orderdate)
+              orderdetails  PARTITION BY RANGE (orderdate),   PK (ordernumber, productcode, orderdate)
+              payments      PARTITION BY RANGE (paymentdate), PK (customernumber, checknumber, paymentdate)
+            orderdetails gets a copy of its order's orderdate, since it has no date of its own. The re-loading
+            writers (script.py, datagen.py load) look the date up from orders when the column exists, so
+            their ON CONFLICT DO NOTHING still finds an existing line. Writers that don't know the column
+            (Assignment3/script.py, backfill_data.py) insert it as 'infinity', i.e. into the DEFAULT partition,
+            and a statement trigger moves those rows to their month right away; for them ON CONFLICT cannot
+            see the existing line (it has the real date), so a duplicate raises a unique violation when moved.
+            The foreign key to orders becomes (ordernumber, orderdate), DEFERRABLE INITIALLY DEFERRED and
+            ON UPDATE CASCADE, so a changed orderdate moves the lines along. That cascade needs
+            PostgreSQL 15: older servers run an UPDATE that moves a row to another partition as DELETE +
+            INSERT, which fails the foreign key instead of cascading, so migrate refuses them.
+            Non-unique indexes, foreign keys and triggers are recreated; views and materialized views that read the tables
+            (rollups.py, compile_aggregates.py) are dropped and recreated with their indexes. The old tables stay
+            as <table>_unpartitioned unless --drop-old. The partitioned tables are built and filled as
+            <table>_partitioned while writers are blocked and readers keep working; only the final swap
+            (renames, triggers, recreating dependent views) takes ACCESS EXCLUSIVE locks and makes readers
+            wait, for as long as it takes to refill dependent materialized views.
+  maintain  create partitions from the current month up to --premake months ahead, create partitions for rows
+            that landed in the DEFAULT partitions (moving them), and with --retain-months N detach partitions
+            older than N months (payments and orderdetails before orders), then move them to --archive-schema
+            or drop them (--drop-detached). Run it from cron, e.g. daily.
+  status    partitions per table with estimated rows and size.
+  verify    EXPLAIN the date-windowed reports (3 and 9) and count the partitions each one still scans.
+
+Note: ordernumber alone is no longer unique (a partitioned table's keys must contain the partition key).
+Two writers can only collide on the same number for the same date, which still raises a unique violation.
+
+The main.py reports join orderdetails on ordernumber only, so their window on o.orderdate prunes orders but
+not orderdetails (the planner does not carry range conditions across a join). `main.py --partitioned` runs
+reports 3 and 9 with an extra od.orderdate predicate (PRUNED_QUERIES) so both tables prune; `verify` shows both.
+
+  python partitions.py migrate --dbname classicmodels --user postgres
+  python partitions.py maintain --premake 3 --retain-months 120 --archive-schema classicmodels_archive ...
+  python partitions.py verify --dbname classicmodels --user postgres
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from datetime import date
+
+try:
+    import psycopg2
+except Exception as e:
+    print("Missing dependency 'psycopg2'. Install with: pip install psycopg2-binary", file=sys.stderr)
+    raise
+
+from reports import REPORTS, Report
+
+SCHEMA = "classicmodels"
+
+# table -> (partition key, primary key); orders first: orderdetails copies its dates
+TABLES = {
+    "orders": ("orderdate", ("ordernumber", "orderdate")),
+    "orderdetails": ("orderdate", ("ordernumber", "productcode", "orderdate")),
+    "payments": ("paymentdate", ("customernumber", "checknumber", "paymentdate")),
+}
+# detach order: referencing tables first
+DETACH_ORDER = ("payments", "orderdetails", "orders")
+
+PARTITION_NAME = re.compile(r"_p(\d{4})_(\d{2})$")
+
+ROUTE_ORDERDETAILS_SQL = """
+CREATE OR REPLACE FUNCTION classicmodels.route_orderdetails() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    -- lines inserted without orderdate sit in the DEFAULT partition as 'infinity'; updating through the
+    -- parent moves them into their month's partition
+    UPDATE classicmodels.orderdetails od
+    SET orderdate = o.orderdate
+    FROM classicmodels.orders o
+    WHERE od.orderdate = 'infinity' AND o.ordernumber = od.ordernumber;
+    RETURN NULL;
+END;
+$$;
+CREATE TRIGGER route_orderdetails AFTER INSERT ON classicmodels.orderdetails
+    FOR EACH STATEMENT EXECUTE FUNCTION classicmodels.route_orderdetails();
+"""
+
+# views and materialized views reading the tables, directly or through other views, in creation order
+DEPENDENTS_SQL = """
+WITH RECURSIVE deps(oid) AS (
+    SELECT r.ev_class
+    FROM pg_depend d
+    JOIN pg_rewrite r ON r.oid = d.objid
+    WHERE d.classid = 'pg_rewrite'::regclass AND d.refobjid = ANY(%s::regclass[]::oid[]) AND r.ev_class <> d.refobjid
+    UNION
+    SELECT r.ev_class
+    FROM deps
+    JOIN pg_depend d ON d.refobjid = deps.oid
+    JOIN pg_rewrite r ON r.oid = d.objid
+    WHERE d.classid = 'pg_rewrite'::regclass AND r.ev_class <> deps.oid
+)
+SELECT c.oid::regclass::text, c.relkind, pg_get_viewdef(c.oid)
+FROM (SELECT DISTINCT oid FROM deps) s
+JOIN pg_class c ON c.oid = s.oid
+ORDER BY c.oid;
+"""
+
+# reports windowed on o.orderdate: the same window on the denormalized od.orderdate lets orderdetails prune
+DATE_KEYED = {
+    "3_monthly_sales_last_12m": ("WHERE o.orderdate >= (current_date - {months})\n",
+                                 "  AND od.orderdate >= (current_date - {months})\n"),
+    "9_low_stock_products_with_sales_last_6m": ("  WHERE o.orderdate >= current_date - {months}\n",
+                                                "    AND od.orderdate >= current_date - {months}\n"),
+}
+
+
+def date_keyed_report(key):
+    report = REPORTS[key]
+    where, extra = DATE_KEYED[key]
+    return Report(key, report.title, report.body.replace(where, where + extra), list(report.params.values()))
+
+
+PRUNED_QUERIES = {key: date_keyed_report(key).render() for key in DATE_KEYED}
+
+
+def month_start(d):
+    return date(d.year, d.month, 1)
+
+
+def add_months(d, n):
+    index = d.year * 12 + d.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y_%m}"
+
+
+def qualified(name):
+    return f"{SCHEMA}.{name}"
+
+
+def is_partitioned(cur, table):
+    cur.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s);", (qualified(table),))
+    return cur.fetchone() is not None
+
+
+def partitions(cur, table):
+    """{month: partition name} of the monthly partitions, plus the name of the DEFAULT partition (or None)."""
+    cur.execute("SELECT c.relname, c.relpartbound IS NOT NULL AND pg_get_expr(c.relpartbound, c.oid) = 'DEFAULT' "
+                "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = %s::regclass;", (qualified(table),))
+    months, default = {}, None
+    for name, is_default in cur.fetchall():
+        match = PARTITION_NAME.search(name)
+        if is_default:
+            default = name
+        elif match:
+            months[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return months, default
+
+
+def create_partition(cur, table, month, default, parent=None):
+    """
+    Create the partition for `month` (of `parent`, default `table`). Rows of that month already in the DEFAULT
+    partition would make a plain CREATE ... PARTITION OF fail, so the partition is built standalone, the rows
+    are moved in, then it is attached.
+    """
+    key = TABLES[table][0]
+    name = qualified(partition_name(table, month))
+    lower, upper = month, add_months(month, 1)
+    if default is None:
+        cur.execute(f"CREATE TABLE {name} PARTITION OF {qualified(parent or table)} FOR VALUES FROM (%s) TO (%s);",
+                    (lower, upper))
+        return 0
+    cur.execute(f"CREATE TABLE {name} (LIKE {qualified(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);")
+    cur.execute(f"WITH moved AS (DELETE FROM {qualified(default)} WHERE {key} >= %s AND {key} < %s RETURNING *) "
+                f"INSERT INTO {name} SELECT * FROM moved;", (lower, upper))
+    moved = cur.rowcount
+    cur.execute(f"ALTER TABLE {qualified(table)} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s);",
+                (lower, upper))
+    return moved
+
+
+def fetch_catalog(cur):
+    """Everything migrate has to carry over from the plain tables, read before they are renamed."""
+    names = [qualified(t) for t in TABLES]
+    # pg_catalog-only search_path: view definitions and index DDL come out schema-qualified
+    cur.execute("SET LOCAL search_path = pg_catalog;")
+    cur.execute("SELECT conrelid::regclass::text FROM pg_constraint "
+                "WHERE contype = 'f' AND confrelid = ANY(%s::regclass[]::oid[]) AND NOT conrelid = ANY(%s::regclass[]::oid[]);",
+                (names, names))
+    foreign = sorted({r[0] for r in cur.fetchall()})
+    if foreign:
+        raise RuntimeError(f"other tables reference orders/orderdetails/payments: {', '.join(foreign)}")
+    cur.execute(DEPENDENTS_SQL, (names,))
+    dependents = []
+    for name, kind, definition in cur.fetchall():
+        cur.execute("SELECT indexdef FROM pg_indexes WHERE schemaname || '.' || tablename = %s;", (name,))
+        dependents.append((name, kind, definition.strip().rstrip(";"), [r[0] for r in cur.fetchall()]))
+    catalog = {"dependents": dependents, "tables": {}}
+    for table in TABLES:
+        cur.execute("SELECT i.indexrelid::regclass::text, i.indisprimary, i.indisunique, pg_get_indexdef(i.indexrelid) "
+                    "FROM pg_index i WHERE i.indrelid = %s::regclass;", (qualified(table),))
+        indexes = cur.fetchall()
+        cur.execute("SELECT conname, confrelid::regclass::text, pg_get_constraintdef(oid) FROM pg_constraint "
+                    "WHERE contype = 'f' AND conrelid = %s::regclass;", (qualified(table),))
+        fks = cur.fetchall()
+        cur.execute("SELECT a.attname, pg_get_serial_sequence(%s, a.attname) FROM pg_attribute a "
+                    "WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped;",
+                    (qualified(table), qualified(table)))
+        sequences = [(col, seq) for col, seq in cur.fetchall() if seq]
+        # e.g. the changefeed.py statement triggers
+        cur.execute("SELECT pg_get_triggerdef(oid) FROM pg_trigger WHERE tgrelid = %s::regclass AND NOT tgisinternal;",
+                    (qualified(table),))
+        triggers = [r[0] for r in cur.fetchall()]
+        catalog["tables"][table] = {"indexes": indexes, "fks": fks, "sequences": sequences, "triggers": triggers}
+    cur.execute("RESET search_path;")
+    return catalog
+
+
+def migrate(conn, args):
+    cur = conn.cursor()
+    cur.execute("SHOW server_version_num;")
+    if int(cur.fetchone()[0]) < 150000:
+        # before 15 a cross-partition UPDATE of orders is DELETE + INSERT and ON UPDATE CASCADE never fires
+        raise RuntimeError("moving order lines along with a changed orderdate needs PostgreSQL 15 or newer")
+    for table in TABLES:
+        if is_partitioned(cur, table):
+            raise RuntimeError(f"{qualified(table)} is already partitioned; use maintain")
+    start = time.time()
+    # EXCLUSIVE still lets readers in while the copies are built; only the final swap takes ACCESS EXCLUSIVE
+    cur.execute("LOCK TABLE classicmodels.orders, classicmodels.orderdetails, classicmodels.payments "
+                "IN EXCLUSIVE MODE;")
+    catalog = fetch_catalog(cur)
+
+    cur.execute("SELECT LEAST(MIN(orderdate), (SELECT MIN(paymentdate) FROM classicmodels.payments)) "
+                "FROM classicmodels.orders;")
+    first = month_start(cur.fetchone()[0] or date.today())
+    last = add_months(month_start(date.today()), args.premake)
+
+    # build and fill the partitioned tables as <table>_partitioned, with their keys and indexes under
+    # <name>_new, next to the live tables
+    new_names = {table: f"{table}_partitioned" for table in TABLES}
+    index_names = []   # (index being built, final name)
+    created = 0
+    for table, (key, primary) in TABLES.items():
+        extra = ", orderdate DATE NOT NULL DEFAULT 'infinity'" if table == "orderdetails" else ""
+        cur.execute(f"CREATE TABLE {qualified(new_names[table])} (LIKE {qualified(table)} INCLUDING DEFAULTS "
+                    f"INCLUDING CONSTRAINTS INCLUDING STORAGE INCLUDING COMMENTS{extra}) PARTITION BY RANGE ({key});")
+        cur.execute(f"CREATE TABLE {qualified(table + '_default')} PARTITION OF {qualified(new_names[table])} DEFAULT;")
+        month = first
+        while month <= last:
+            create_partition(cur, table, month, None, parent=new_names[table])
+            created += 1
+            month = add_months(month, 1)
+
+    copied = {}
+    cur.execute("INSERT INTO classicmodels.orders_partitioned SELECT * FROM classicmodels.orders;")
+    copied["orders"] = cur.rowcount
+    cur.execute("INSERT INTO classicmodels.orderdetails_partitioned "
+                "SELECT od.*, o.orderdate FROM classicmodels.orderdetails od "
+                "JOIN classicmodels.orders o ON o.ordernumber = od.ordernumber;")
+    copied["orderdetails"] = cur.rowcount
+    cur.execute("INSERT INTO classicmodels.payments_partitioned SELECT * FROM classicmodels.payments;")
+    copied["payments"] = cur.rowcount
+
+    for table, info in catalog["tables"].items():
+        _, primary = TABLES[table]
+        new = qualified(new_names[table])
+        pk_name = next((name.split(".")[-1] for name, is_pk, _, _ in info["indexes"] if is_pk), f"{table}_pkey")
+        index_names.append((f"{pk_name}_new"[:63], pk_name))
+        cur.execute(f"ALTER TABLE {new} ADD CONSTRAINT {index_names[-1][0]} PRIMARY KEY ({', '.join(primary)});")
+        for name, is_pk, is_unique, definition in info["indexes"]:
+            if is_pk:
+                continue
+            if is_unique:
+                print(f"   skipped unique index {name}: on a partitioned table it would have to include "
+                      f"{TABLES[table][0]}")
+                continue
+            short = name.split(".")[-1]
+            index_names.append((f"{short}_new"[:63], short))
+            cur.execute(definition.replace(f" {short} ON {qualified(table)} ",
+                                           f" {index_names[-1][0]} ON {new} ", 1) + ";")
+        for name, referenced, definition in info["fks"]:
+            if table == "orderdetails" and referenced == qualified("orders"):
+                cur.execute(f"ALTER TABLE {new} ADD CONSTRAINT {name} "
+                            "FOREIGN KEY (ordernumber, orderdate) "
+                            "REFERENCES classicmodels.orders_partitioned (ordernumber, orderdate) "
+                            "ON UPDATE CASCADE DEFERRABLE INITIALLY DEFERRED;")
+            elif referenced in map(qualified, TABLES):
+                cur.execute(f"ALTER TABLE {new} ADD CONSTRAINT {name} "
+                            + definition.replace(f"REFERENCES {referenced}(", f"REFERENCES {referenced}_partitioned(", 1)
+                            + ";")
+            else:
+                cur.execute(f"ALTER TABLE {new} ADD CONSTRAINT {name} {definition};")
+
+    # the swap: renames take ACCESS EXCLUSIVE on the live tables until commit, so readers wait from here on;
+    # everything below is catalog work, apart from refilling dependent materialized views
+    for name, kind, _, _ in reversed(catalog["dependents"]):
+        cur.execute(f"DROP {'MATERIALIZED VIEW' if kind == 'm' else 'VIEW'} {name};")
+    old_names = {}
+    for table, info in catalog["tables"].items():
+        old = f"{table}_unpartitioned"
+        old_names[table] = old
+        cur.execute(f"ALTER TABLE {qualified(table)} RENAME TO {old};")
+        for index, _, _, _ in info["indexes"]:
+            cur.execute(f"ALTER INDEX {index} RENAME TO {(index.split('.')[-1] + '_unpartitioned')[:63]};")
+    for table in TABLES:
+        cur.execute(f"ALTER TABLE {qualified(new_names[table])} RENAME TO {table};")
+    for building, final in index_names:
+        cur.execute(f"ALTER INDEX {qualified(building)} RENAME TO {final};")
+    for table, info in catalog["tables"].items():
+        for column, sequence in info["sequences"]:
+            cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY {qualified(table)}.{column};")
+        # after the copy, so e.g. the changefeed.py and aggregates.py triggers don't see it as new rows
+        for definition in info["triggers"]:
+            cur.execute(definition + ";")
+    cur.execute(ROUTE_ORDERDETAILS_SQL)
+
+    for name, kind, definition, indexes in catalog["dependents"]:
+        cur.execute(f"CREATE {'MATERIALIZED VIEW' if kind == 'm' else 'VIEW'} {name} AS {definition};")
+        for index in indexes:
+            cur.execute(index + ";")
+    if args.drop_old:
+        for table in DETACH_ORDER:
+            cur.execute(f"DROP TABLE {qualified(old_names[table])};")
+    conn.commit()
+    for table in TABLES:
+        cur.execute(f"ANALYZE {qualified(table)};")
+    conn.commit()
+    cur.close()
+
+    print(f"Migrated in {time.time() - start:.1f}s: " + ", ".join(f"{t} {n} rows" for t, n in copied.items())
+          + f"; {created} monthly partitions {first:%Y-%m}..{last:%Y-%m} (+ DEFAULT each)")
+    if catalog["dependents"]:
+        print("Recreated: " + ", ".join(name for name, _, _, _ in catalog["dependents"]))
+    if not args.drop_old:
+        print("Old tables kept as " + ", ".join(old_names.values()) + " (drop them once verified)")
+
+
+def maintain(conn, args):
+    cur = conn.cursor()
+    for table in TABLES:
+        if not is_partitioned(cur, table):
+            raise RuntimeError(f"{qualified(table)} is not partitioned; run migrate first")
+    this_month = month_start(date.today())
+    created, moved, detached = [], 0, []
+
+    # stragglers from writers that bypassed the trigger path
+    cur.execute("UPDATE classicmodels.orderdetails od SET orderdate = o.orderdate FROM classicmodels.orders o "
+                "WHERE od.orderdate = 'infinity' AND o.ordernumber = od.ordernumber;")
+    moved += cur.rowcount
+
+    for table, (key, _) in TABLES.items():
+        months, default = partitions(cur, table)
+        wanted = {add_months(this_month, n) for n in range(args.premake + 1)}
+        if default:
+            cur.execute(f"SELECT DISTINCT date_trunc('month', {key})::date FROM {qualified(default)} "
+                        f"WHERE {key} <> 'infinity';")
+            wanted |= {r[0] for r in cur.fetchall()}
+        for month in sorted(wanted - set(months)):
+            moved += create_partition(cur, table, month, default)
+            created.append(partition_name(table, month))
+
+    if args.retain_months is not None:
+        cutoff = add_months(this_month, -args.retain_months)
+        if args.archive_schema:
+            cur.execute(f"CREATE SCHEMA IF NOT EXISTS {args.archive_schema};")
+        for table in DETACH_ORDER:
+            months, _ = partitions(cur, table)
+            for month in sorted(m for m in months if m < cutoff):
+                name = qualified(months[month])
+                cur.execute(f"ALTER TABLE {qualified(table)} DETACH PARTITION {name};")
+                if args.archive_schema:
+                    cur.execute(f"ALTER TABLE {name} SET SCHEMA {args.archive_schema};")
+                elif args.drop_detached:
+                    cur.execute(f"DROP TABLE {name};")
+                detached.append(months[month])
+
+    if args.dry_run:
+        conn.rollback()
+        print("Dry run, rolled back:")
+    else:
+        conn.commit()
+    print(f"Created {len(created)} partition(s)" + (f": {', '.join(created)}" if created else "")
+          + f"; moved {moved} row(s) out of DEFAULT partitions")
+    if detached:
+        where = (f"moved to schema {args.archive_schema}" if args.archive_schema
+                 else "dropped" if args.drop_detached else f"left as standalone tables in {SCHEMA}")
+        print(f"Detached {len(detached)} partition(s) older than {cutoff:%Y-%m} ({where})")
+    cur.close()
+
+
+def status(conn, args):
+    cur = conn.cursor()
+    for table in TABLES:
+        if not is_partitioned(cur, table):
+            print(f"{qualified(table)}: not partitioned")
+            continue
+        cur.execute("SELECT c.relname, c.reltuples::bigint, pg_total_relation_size(c.oid) "
+                    "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                    "WHERE i.inhparent = %s::regclass ORDER BY c.relname;", (qualified(table),))
+        rows = cur.fetchall()
+        size = sum(r[2] for r in rows)
+        print(f"\n{qualified(table)}: {len(rows)} partitions, {size / 1048576:.1f} MiB")
+        if not args.all and len(rows) > 9:
+            rows = rows[:3] + [None] + rows[-6:]
+        for row in rows:
+            if row is None:
+                print("   ...")
+                continue
+            name, tuples, nbytes = row
+            print(f"   {name:<32} ~{max(tuples, 0):>9} rows  {nbytes / 1024:>8.0f} KiB")
+    cur.close()
+    conn.rollback()
+
+
+def scanned_relations(plan, found):
+    """Collect (relation name) of every scan node and the pruned-at-startup count of Append nodes."""
+    if "Relation Name" in plan:
+        found["relations"].add(plan["Relation Name"])
+    found["removed"] += plan.get("Subplans Removed", 0)
+    for child in plan.get("Plans", []):
+        scanned_relations(child, found)
+    return found
+
+
+def verify(conn, args):
+    cur = conn.cursor()
+    totals = {}
+    for table in ("orders", "orderdetails"):
+        months, default = partitions(cur, table)
+        totals[table] = len(months) + (1 if default else 0)
+    if not any(totals.values()):
+        print("orders/orderdetails are not partitioned; run migrate first")
+        return
+    failed = False
+    for key in DATE_KEYED:
+        for label, sql in (("report as in main.py", REPORTS[key].render()),
+                           ("with od.orderdate window (--partitioned)", PRUNED_QUERIES[key])):
+            cur.execute("EXPLAIN (FORMAT JSON) " + sql)
+            plan = cur.fetchone()[0]
+            plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+            relations = scanned_relations(plan, {"relations": set(), "removed": 0})["relations"]
+            parts = []
+            for table, total in totals.items():
+                scanned = sum(1 for r in relations if r.startswith(table + "_p") or r == table + "_default")
+                pruned = scanned < total
+                failed |= not pruned and label.startswith("with")
+                parts.append(f"{table} {scanned}/{total} partitions{'' if pruned else ' (NOT pruned)'}")
+            print(f"{key} — {label}: " + ", ".join(parts))
+    cur.close()
+    conn.rollback()
+    if failed:
+        sys.exit(1)
+
+
+def main():
+    from main import add_connection_args, connection_info   # main imports this module
+
+    parser = argparse.ArgumentParser(description="Monthly range partitions for orders, orderdetails and payments.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    commands = {
+        "migrate": "Rebuild the tables as monthly partitioned tables",
+        "maintain": "Create upcoming partitions, empty the DEFAULT partitions, detach old partitions",
+        "status": "Partitions with estimated rows and size",
+        "verify": "Check with EXPLAIN that the date-windowed reports prune partitions",
+    }
+    for name, help_text in commands.items():
+        p = sub.add_parser(name, help=help_text)
+        add_connection_args(p)
+        if name in ("migrate", "maintain"):
+            p.add_argument("--premake", type=int, default=3,
+                           help="Months of partitions to keep ready ahead of the current month (default: 3)")
+        if name == "migrate":
+            p.add_argument("--drop-old", dest="drop_old", action="store_true",
+                           help="Drop the unpartitioned tables instead of keeping them as <table>_unpartitioned")
+        if name == "maintain":
+            p.add_argument("--retain-months", dest="retain_months", type=int, default=None,
+                           help="Detach partitions that end more than N months before the current month")
+            p.add_argument("--archive-schema", dest="archive_schema", default="",
+                           help="Move detached partitions into this schema")
+            p.add_argument("--drop-detached", dest="drop_detached", action="store_true",
+                           help="Drop detached partitions (ignored with --archive-schema)")
+            p.add_argument("--dry-run", dest="dry_run", action="store_true", help="Report the changes and roll back")
+        if name == "status":
+            p.add_argument("--all", action="store_true", help="List every partition")
+    args = parser.parse_args()
+    if getattr(args, "retain_months", None) is not None and args.retain_months < 1:
+        parser.error("--retain-months must be >= 1")
+    if getattr(args, "archive_schema", "") and not re.fullmatch(r"[a-z_][a-z0-9_]*", args.archive_schema):
+        parser.error("--archive-schema must be a plain lower-case identifier")
+
+    conn = psycopg2.connect(**connection_info(args))
+    try:
+        {"migrate": migrate, "maintain": maintain, "status": status, "verify": verify}[args.command](conn, args)
+    except Exception as e:
+        conn.rollback()
+        print(f"{args.command} failed:", e, file=sys.stderr)
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
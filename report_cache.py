@@ -0,0 +1,120 @@
+"""
+Persistent on-disk result cache for the main.py reports.
+
+Entries are keyed by query key + a hash of the SQL text, so editing a query never serves a stale
+result. Each entry remembers the table watermark it was computed under; a run first reads the
+current watermark with one cheap catalog query and only entries with a matching watermark are
+served, without running the report SQL at all.
+
+The watermark combines:
+  - MAX(ordernumber) of classicmodels.orders (answered from the primary key index),
+  - pg_stat_user_tables n_tup_ins/n_tup_upd/n_tup_del of the tables the reports read, summed over
+    pg_partition_tree() for each table: after `partitions.py migrate` the counters move on the leaf
+    partitions and stay at zero on the partitioned parents,
+  - the server's current_date (queries 3 and 9 use date windows relative to today).
+
+Entries also expire after a TTL, and the cache directory is kept under a size budget by evicting
+the least recently used entries (hits refresh the file mtime).
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import time
+
+# tables read by the reports; any insert/update/delete on them invalidates cached results
+WATCHED_TABLES = ["orders", "orderdetails", "payments", "customers", "products", "employees"]
+
+WATERMARK_SQL = (
+    "SELECT current_date::text AS today,\n"
+    "       (SELECT MAX(ordernumber) FROM classicmodels.orders) AS max_ordernumber,\n"
+    "       (SELECT json_object_agg(t, stats ORDER BY t) FROM (\n"
+    "          SELECT t, json_build_array(SUM(st.n_tup_ins), SUM(st.n_tup_upd), SUM(st.n_tup_del)) AS stats\n"
+    "          FROM unnest(%s::text[]) AS t\n"
+    "          CROSS JOIN LATERAL pg_partition_tree(to_regclass('classicmodels.' || t)) AS p\n"
+    "          JOIN pg_stat_user_tables st ON st.relid = p.relid\n"
+    "          GROUP BY t) w) AS table_stats;"
+)
+
+ENTRY_SUFFIX = ".pkl"
+
+
+def fetch_watermark(conn):
+    """Read the current change watermark (one round trip, no table scans)."""
+    cur = conn.cursor()
+    try:
+        cur.execute(WATERMARK_SQL, (WATCHED_TABLES,))
+        today, max_ordernumber, table_stats = cur.fetchone()
+    finally:
+        cur.close()
+    return {"today": today, "max_ordernumber": max_ordernumber, "table_stats": table_stats or {}}
+
+
+def watermark_digest(watermark):
+    return hashlib.sha256(json.dumps(watermark, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Directory of pickled (columns, rows) results with TTL, watermark check and LRU size limit."""
+
+    def __init__(self, directory, watermark, ttl=3600, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.watermark = watermark_digest(watermark)
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key, sql):
+        sql_hash = hashlib.sha256(sql.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.directory, f"{key}-{sql_hash}{ENTRY_SUFFIX}")
+
+    def get(self, key, sql):
+        """Return (columns, rows) for a fresh entry computed under the current watermark, else None."""
+        path = self._path(key, sql)
+        try:
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        if entry["watermark"] != self.watermark or time.time() - entry["created"] > self.ttl:
+            self.misses += 1
+            return None
+        # mark as recently used for LRU eviction
+        os.utime(path)
+        self.hits += 1
+        return entry["columns"], entry["rows"]
+
+    def put(self, key, sql, columns, rows):
+        path = self._path(key, sql)
+        entry = {"watermark": self.watermark, "created": time.time(), "columns": columns, "rows": rows}
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self.evict()
+
+    def evict(self):
+        """Drop the least recently used entries until the directory fits in max_bytes."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(ENTRY_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Local HTTP/JSON service for the report QUERIES of main.py.
+
+  GET /reports               -> list of report keys
+  GET /reports/<key>         -> {"key", "columns", "rows", "cached"} for that report
+  GET /reports/<key>?refresh=1  bypasses the in-memory cache
+  GET /stats                 -> executions, coalesced requests and cache hits so far
+
+Queries run on a ThreadedConnectionPool. Concurrent requests for the same report share one in-flight
+execution: the first request runs the query on a server-side cursor and appends batches to a shared
+buffer, and every request for that key (including ones that arrive mid-query) streams the rows out of
+that buffer with chunked transfer encoding as they arrive. Finished results up to --cache-max-rows are
+kept in memory for --cache-ttl seconds (LRU-bounded by --cache-entries). A result that grows past
+--cache-max-rows is streamed only: the buffer drops rows once every attached reader has them, holds about
+--cache-max-rows rows for the slowest reader (the query waits for it), and later requests start their own
+execution instead of joining.
+
+Example:
+  python report_server.py --dbname classicmodels --user postgres --listen-port 8765
+  curl -s localhost:8765/reports/1_total_revenue_by_country
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+try:
+    import psycopg2
+    import psycopg2.pool
+except Exception as e:
+    print("Missing dependency 'psycopg2'. Install with: pip install psycopg2-binary", file=sys.stderr)
+    raise
+
+from main import QUERIES, connection_info
+
+FETCH_BATCH = 2000
+
+
+def json_value(v):
+    # Decimal goes out as a string so no precision is lost in the client
+    if isinstance(v, Decimal):
+        return str(v)
+    if isinstance(v, (date, datetime)):
+        return v.isoformat()
+    raise TypeError(f"not JSON serializable: {type(v).__name__}")
+
+
+class InFlight:
+    """
+    One execution of a report; rows are appended in batches while readers stream them.
+
+    Every reader is attached with the number of rows it has been sent. Once the result grows past `max_rows`
+    it will not be cached, so the flight stops retaining rows: rows every attached reader has already been
+    sent are dropped, no new readers can join, and the producer waits while more than `max_rows` rows are
+    buffered for the slowest reader.
+    """
+
+    def __init__(self, max_rows):
+        self.cond = threading.Condition()
+        self.max_rows = max_rows
+        self.columns = None
+        self.rows = []
+        self.start = 0          # row number of rows[0]
+        self.readers = {}       # reader id -> rows sent
+        self.next_reader = 0
+        self.overflowed = False
+        self.done = False
+        self.error = None
+        self.finished_at = None
+
+    def attach(self):
+        """Register a reader starting at the first row; None once earlier rows have been dropped."""
+        with self.cond:
+            if self.overflowed:
+                return None
+            reader = self.next_reader
+            self.next_reader += 1
+            self.readers[reader] = 0
+            return reader
+
+    def trim(self):
+        if self.overflowed:
+            keep = min(self.readers.values(), default=self.start + len(self.rows))
+            del self.rows[:keep - self.start]
+            self.start = keep
+
+    def publish(self, columns=None, batch=(), done=False, error=None):
+        """Append a batch; returns False once the result is over `max_rows` and nobody is left to read it."""
+        with self.cond:
+            if columns is not None:
+                self.columns = columns
+            self.rows.extend(batch)
+            if self.start + len(self.rows) > self.max_rows:
+                self.overflowed = True
+                self.trim()
+            if error is not None:
+                self.error = error
+            if done:
+                self.done = True
+                self.finished_at = time.monotonic()
+            self.cond.notify_all()
+            if self.overflowed and not done:
+                self.cond.wait_for(lambda: len(self.rows) <= self.max_rows or not self.readers)
+            return not (self.overflowed and not self.readers)
+
+    def wait_columns(self):
+        with self.cond:
+            self.cond.wait_for(lambda: self.columns is not None or self.done)
+            if self.error is not None and self.columns is None:
+                raise self.error
+            return self.columns
+
+    def iter_batches(self, reader):
+        sent = 0
+        while True:
+            with self.cond:
+                self.readers[reader] = sent
+                self.trim()
+                self.cond.notify_all()
+                self.cond.wait_for(lambda: self.start + len(self.rows) > sent or self.done)
+                batch = self.rows[sent - self.start:]
+                finished, error, total = self.done, self.error, self.start + len(self.rows)
+            sent += len(batch)
+            if batch:
+                yield batch
+            if finished and sent >= total:
+                if error is not None:
+                    raise error
+                return
+
+    def detach(self, reader):
+        """Drop a reader that is done or gone, so it no longer holds back trimming."""
+        with self.cond:
+            self.readers.pop(reader, None)
+            self.trim()
+            self.cond.notify_all()
+
+
+class ReportService:
+    def __init__(self, pool, queries, ttl, max_entries, max_rows):
+        self.pool = pool
+        self.queries = dict(queries)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        # ThreadedConnectionPool raises instead of blocking when exhausted, so gate executions here
+        self.slots = threading.BoundedSemaphore(pool.maxconn)
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.cache = OrderedDict()
+        self.executions = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+
+    def get(self, key, refresh=False):
+        """
+        Return (InFlight, reader id, served_from_cache) for `key`, starting an execution only if needed.
+        A running execution that is already past --cache-max-rows has dropped its first rows, so a request
+        arriving then gets an execution of its own.
+        """
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry and not refresh and time.monotonic() - entry.finished_at <= self.ttl:
+                self.cache.move_to_end(key)
+                self.cache_hits += 1
+                return entry, entry.attach(), True
+            running = self.in_flight.get(key)
+            reader = running.attach() if running else None
+            if reader is not None:
+                self.coalesced += 1
+                return running, reader, False
+            flight = InFlight(self.max_rows)
+            reader = flight.attach()
+            self.in_flight[key] = flight
+            self.executions += 1
+        threading.Thread(target=self.execute, args=(key, flight), daemon=True).start()
+        return flight, reader, False
+
+    def execute(self, key, flight):
+        with self.slots:
+            self.run_query(key, flight)
+
+    def run_query(self, key, flight):
+        conn = self.pool.getconn()
+        try:
+            # server-side cursor: the first batch reaches readers before the whole result is on the client
+            cur = conn.cursor(name=f"report_{key}")
+            cur.itersize = FETCH_BATCH
+            cur.execute(self.queries[key])
+            batch = cur.fetchmany(FETCH_BATCH)
+            flight.publish(columns=[d[0] for d in cur.description])
+            while batch and flight.publish(batch=batch):
+                batch = cur.fetchmany(FETCH_BATCH)
+            cur.close()
+            flight.publish(done=True)
+        except Exception as e:
+            flight.publish(done=True, error=e)
+        finally:
+            conn.rollback()
+            self.pool.putconn(conn)
+            with self.lock:
+                if self.in_flight.get(key) is flight:
+                    del self.in_flight[key]
+                if flight.error is None and not flight.overflowed:
+                    self.cache[key] = flight
+                    self.cache.move_to_end(key)
+                    while len(self.cache) > self.max_entries:
+                        self.cache.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {"executions": self.executions, "coalesced": self.coalesced, "cache_hits": self.cache_hits,
+                    "cached_reports": list(self.cache), "in_flight": list(self.in_flight)}
+
+
+class ReportHandler(BaseHTTPRequestHandler):
+    service = None
+    protocol_version = "HTTP/1.1"
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, default=json_value).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def write_chunk(self, text):
+        data = text.encode("utf-8")
+        if data:
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        if parts == ["reports"]:
+            return self.send_json(200, {"reports": list(self.service.queries)})
+        if parts == ["stats"]:
+            return self.send_json(200, self.service.stats())
+        if len(parts) != 2 or parts[0] != "reports" or parts[1] not in self.service.queries:
+            return self.send_json(404, {"error": f"unknown path {url.path}"})
+
+        key = parts[1]
+        refresh = parse_qs(url.query).get("refresh", ["0"])[0] not in ("0", "")
+        flight, reader, cached = self.service.get(key, refresh)
+        try:
+            self.stream(key, flight, reader, cached)
+        finally:
+            # also when the client went away mid-stream
+            flight.detach(reader)
+
+    def stream(self, key, flight, reader, cached):
+        try:
+            columns = flight.wait_columns()
+        except Exception as e:
+            return self.send_json(500, {"key": key, "error": str(e)})
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.write_chunk(f'{{"key": {json.dumps(key)}, "cached": {json.dumps(cached)}, '
+                         f'"columns": {json.dumps(columns)}, "rows": [')
+        first = True
+        try:
+            for batch in flight.iter_batches(reader):
+                rows = ", ".join(json.dumps(list(r), default=json_value) for r in batch)
+                self.write_chunk(rows if first else ", " + rows)
+                first = False
+            self.write_chunk("]}")
+        except Exception as e:
+            # the status line is already out: close the array and report the error in the body
+            self.write_chunk(f'], "error": {json.dumps(str(e))}}}')
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, fmt, *args):
+        sys.stderr.write(f"[{self.log_date_time_string()}] {fmt % args}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the classicmodels report queries over HTTP/JSON.")
+    parser.add_argument("--db-host", dest="host", default="localhost", help="DB host (default: localhost)")
+    parser.add_argument("--db-port", dest="port", default="5432", help="DB port (default: 5432)")
+    parser.add_argument("--dbname", default="postgres", help="Database name")
+    parser.add_argument("--user", default=None, help="DB user")
+    parser.add_argument("--password", default=None, help="DB password")
+    parser.add_argument("--bind", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--listen-port", dest="listen_port", type=int, default=8765,
+                        help="HTTP port (default: 8765)")
+    parser.add_argument("--pool-size", dest="pool_size", type=int, default=4,
+                        help="Maximum database connections (default: 4)")
+    parser.add_argument("--timeout", type=int, default=60, help="Statement timeout in seconds")
+    parser.add_argument("--cache-ttl", dest="cache_ttl", type=float, default=30,
+                        help="Seconds a finished result is served from memory (default: 30)")
+    parser.add_argument("--cache-entries", dest="cache_entries", type=int, default=32,
+                        help="Maximum cached reports, least recently used evicted first (default: 32)")
+    parser.add_argument("--cache-max-rows", dest="cache_max_rows", type=int, default=100000,
+                        help="Results with more rows are streamed but not cached (default: 100000)")
+    args = parser.parse_args()
+    if args.pool_size < 1:
+        parser.error("--pool-size must be >= 1")
+
+    try:
+        pool = psycopg2.pool.ThreadedConnectionPool(
+            1, args.pool_size, options=f"-c statement_timeout={args.timeout * 1000}", **connection_info(args))
+    except Exception as e:
+        print("Connection failed:", e, file=sys.stderr)
+        sys.exit(1)
+    ReportHandler.service = ReportService(pool, QUERIES, args.cache_ttl, args.cache_entries, args.cache_max_rows)
+    server = ThreadingHTTPServer((args.bind, args.listen_port), ReportHandler)
+    print(f"Serving {len(QUERIES)} reports on http://{args.bind}:{args.listen_port}/reports")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.closeall()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Registry of the classicmodels reports with typed parameters.
+
+Each report has a title and an SQL body with `{param}` slots. A slot renders two ways:
+  - literal (render()): the default-valued SQL text; main.QUERIES is built from it, so the plain
+    report run, --copy exports, the result cache and the benchmark see exactly the same text as before;
+  - prepared (run_report()): `$n` placeholders in a server-side prepared statement. The statement is
+    PREPAREd once per connection and re-EXECUTEd for every parameter combination, so a scheduler running
+    hundreds of variants skips parsing and (after a few executions, once Postgres switches to a generic
+    plan) planning.
+
+  from reports import run_report
+  columns, rows = run_report(conn, "3_monthly_sales_last_12m", months=24)
+
+CLI:
+  python reports.py list
+  python reports.py run 2_top10_products_by_revenue --param limit=25 --dbname classicmodels --user postgres
+"""
+
+import argparse
+import hashlib
+import sys
+import time
+import weakref
+
+try:
+    import psycopg2
+    import psycopg2.errors
+except Exception as e:
+    print("Missing dependency 'psycopg2'. Install with: pip install psycopg2-binary", file=sys.stderr)
+    raise
+
+
+class Param:
+    """A typed report parameter. kind "int" is a plain integer, "months" an interval of whole months."""
+
+    def __init__(self, name, kind, default, help, minimum=0):
+        self.name = name
+        self.kind = kind
+        self.default = default
+        self.help = help
+        self.minimum = minimum
+
+    def coerce(self, value):
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"parameter {self.name!r} must be an integer, got {value!r}")
+        if value < self.minimum:
+            raise ValueError(f"parameter {self.name!r} must be >= {self.minimum}, got {value}")
+        return value
+
+    def literal(self, value):
+        return f"INTERVAL '{value} months'" if self.kind == "months" else str(value)
+
+    def placeholder(self, n):
+        return f"make_interval(months => ${n}::int)" if self.kind == "months" else f"${n}::int"
+
+
+class Report:
+    def __init__(self, key, title, body, params=()):
+        self.key = key
+        self.title = title
+        self.body = body
+        self.params = {p.name: p for p in params}
+
+    def values(self, overrides):
+        unknown = set(overrides) - set(self.params)
+        if unknown:
+            raise ValueError(f"report {self.key!r} has no parameter(s) {', '.join(sorted(unknown))}; "
+                             f"known: {', '.join(self.params) or 'none'}")
+        return {name: p.coerce(overrides.get(name, p.default)) for name, p in self.params.items()}
+
+    def render(self, **overrides):
+        """Literal SQL text for the given (or default) parameter values."""
+        values = self.values(overrides)
+        slots = {name: self.params[name].literal(v) for name, v in values.items()}
+        return f"-- {self.title.format(**values)}\n" + self.body.format(**slots)
+
+    def prepared_sql(self):
+        """SQL with $1..$n placeholders, parameters numbered in declaration order."""
+        slots = {name: p.placeholder(i) for i, (name, p) in enumerate(self.params.items(), start=1)}
+        return self.body.format(**slots).rstrip().rstrip(";")
+
+
+REPORTS = {r.key: r for r in [
+    Report("1_total_revenue_by_country",
+           "Total revenue (sales) by customer country",
+           "SELECT c.country,\n"
+           "       SUM(od.quantityordered * od.priceeach) AS total_revenue\n"
+           "FROM classicmodels.orderdetails od\n"
+           "JOIN classicmodels.orders o ON od.ordernumber = o.ordernumber\n"
+           "JOIN classicmodels.customers c ON o.customernumber = c.customernumber\n"
+           "GROUP BY c.country\n"
+           "ORDER BY total_revenue DESC;"),
+    Report("2_top10_products_by_revenue",
+           "Top {limit} products by revenue",
+           "SELECT p.productcode,\n"
+           "       p.productname,\n"
+           "       SUM(od.quantityordered * od.priceeach) AS revenue,\n"
+           "       SUM(od.quantityordered) AS units_sold\n"
+           "FROM classicmodels.orderdetails od\n"
+           "JOIN classicmodels.products p ON od.productcode = p.productcode\n"
+           "GROUP BY p.productcode, p.productname\n"
+           "ORDER BY revenue DESC\n"
+           "LIMIT {limit};",
+           [Param("limit", "int", 10, "Number of products", minimum=1)]),
+    Report("3_monthly_sales_last_12m",
+           "Monthly sales trend (last {months} months)",
+           "SELECT date_trunc('month', o.orderdate)::date AS month,\n"
+           "       SUM(od.quantityordered * od.priceeach) AS revenue\n"
+           "FROM classicmodels.orders o\n"
+           "JOIN classicmodels.orderdetails od ON o.ordernumber = od.ordernumber\n"
+           "WHERE o.orderdate >= (current_date - {months})\n"
+           "GROUP BY 1\n"
+           "ORDER BY 1;",
+           [Param("months", "months", 12, "Window in months back from today", minimum=1)]),
+    Report("4_avg_order_value_per_customer",
+           "Average order value per customer (top {limit})",
+           "SELECT c.customernumber,\n"
+           "       c.customername,\n"
+           "       AVG(order_total) AS avg_order_value\n"
+           "FROM (\n"
+           "  SELECT o.ordernumber, o.customernumber, SUM(od.quantityordered * od.priceeach) AS order_total\n"
+           "  FROM classicmodels.orders o\n"
+           "  JOIN classicmodels.orderdetails od USING (ordernumber)\n"
+           "  GROUP BY o.ordernumber, o.customernumber\n"
+           ") t\n"
+           "JOIN classicmodels.customers c ON t.customernumber = c.customernumber\n"
+           "GROUP BY c.customernumber, c.customername\n"
+           "ORDER BY avg_order_value DESC\n"
+           "LIMIT {limit};",
+           [Param("limit", "int", 20, "Number of customers", minimum=1)]),
+    Report("5_orders_by_year_and_status",
+           "Number of orders by year and status",
+           "SELECT EXTRACT(YEAR FROM orderdate)::INT AS year,\n"
+           "       status,\n"
+           "       COUNT(*) AS orders_count\n"
+           "FROM classicmodels.orders\n"
+           "GROUP BY year, status\n"
+           "ORDER BY year DESC, orders_count DESC;"),
+    Report("6_sales_rep_performance",
+           "Sales representative performance",
+           "SELECT e.employeenumber,\n"
+           "       (e.firstname || ' ' || e.lastname) AS sales_rep,\n"
+           "       COUNT(DISTINCT c.customernumber) AS customers_managed,\n"
+           "       COUNT(DISTINCT o.ordernumber) AS orders_count,\n"
+           "       SUM(od.quantityordered * od.priceeach) AS total_revenue\n"
+           "FROM classicmodels.employees e\n"
+           "LEFT JOIN classicmodels.customers c ON c.salesrepemployeenumber = e.employeenumber\n"
+           "LEFT JOIN classicmodels.orders o ON o.customernumber = c.customernumber\n"
+           "LEFT JOIN classicmodels.orderdetails od ON od.ordernumber = o.ordernumber\n"
+           "GROUP BY e.employeenumber, sales_rep\n"
+           "ORDER BY total_revenue DESC NULLS LAST\n"
+           "LIMIT {limit};",
+           [Param("limit", "int", 20, "Number of sales reps", minimum=1)]),
+    Report("7_avg_delivery_days_for_shipped_orders",
+           "Average delivery time (in days) for shipped orders",
+           "SELECT AVG((shippeddate - orderdate))::NUMERIC(10,2) AS avg_delivery_days\n"
+           "FROM classicmodels.orders\n"
+           "WHERE shippeddate IS NOT NULL;"),
+    Report("8_payment_coverage_ratio_per_customer",
+           "Payment coverage ratio per customer",
+           "SELECT c.customernumber,\n"
+           "       c.customername,\n"
+           "       COALESCE(pay.total_payments,0) AS total_payments,\n"
+           "       COALESCE(inv.total_invoiced,0) AS total_invoiced,\n"
+           "       CASE WHEN COALESCE(inv.total_invoiced,0) = 0 THEN NULL\n"
+           "            ELSE ROUND(pay.total_payments / inv.total_invoiced::NUMERIC, 4)\n"
+           "       END AS payment_coverage_ratio\n"
+           "FROM classicmodels.customers c\n"
+           "LEFT JOIN (\n"
+           "  SELECT customernumber, SUM(amount) AS total_payments\n"
+           "  FROM classicmodels.payments\n"
+           "  GROUP BY customernumber\n"
+           ") pay ON pay.customernumber = c.customernumber\n"
+           "LEFT JOIN (\n"
+           "  SELECT o.customernumber, SUM(od.quantityordered * od.priceeach) AS total_invoiced\n"
+           "  FROM classicmodels.orders o\n"
+           "  JOIN classicmodels.orderdetails od ON o.ordernumber = od.ordernumber\n"
+           "  GROUP BY o.customernumber\n"
+           ") inv ON inv.customernumber = c.customernumber\n"
+           "ORDER BY payment_coverage_ratio ASC NULLS LAST\n"
+           "LIMIT {limit};",
+           [Param("limit", "int", 20, "Number of customers", minimum=1)]),
+    Report("9_low_stock_products_with_sales_last_6m",
+           "Low-stock products with sales in the last {months} months",
+           "SELECT p.productcode,\n"
+           "       p.productname,\n"
+           "       p.quantityinstock,\n"
+           "       COALESCE(s.units_sold,0) AS units_sold_last_6m\n"
+           "FROM classicmodels.products p\n"
+           "LEFT JOIN (\n"
+           "  SELECT od.productcode, SUM(od.quantityordered) AS units_sold\n"
+           "  FROM classicmodels.orderdetails od\n"
+           "  JOIN classicmodels.orders o ON od.ordernumber = o.ordernumber\n"
+           "  WHERE o.orderdate >= current_date - {months}\n"
+           "  GROUP BY od.productcode\n"
+           ") s ON s.productcode = p.productcode\n"
+           "WHERE p.quantityinstock < {stock_below}\n"
+           "ORDER BY p.quantityinstock ASC, units_sold_last_6m DESC;",
+           [Param("months", "months", 6, "Sales window in months back from today", minimum=1),
+            Param("stock_below", "int", 20, "Products with quantityinstock below this")]),
+    Report("10_avg_items_and_lines_per_order",
+           "Average number of items and lines per order",
+           "SELECT ROUND(AVG(order_lines)::NUMERIC,2) AS avg_lines_per_order,\n"
+           "       ROUND(AVG(total_units)::NUMERIC,2) AS avg_units_per_order\n"
+           "FROM (\n"
+           "  SELECT o.ordernumber,\n"
+           "         COUNT(od.productcode) AS order_lines,\n"
+           "         SUM(od.quantityordered) AS total_units\n"
+           "  FROM classicmodels.orders o\n"
+           "  JOIN classicmodels.orderdetails od ON o.ordernumber = od.ordernumber\n"
+           "  GROUP BY o.ordernumber\n"
+           ") t;"),
+]}
+
+# connection -> names of the statements PREPAREd on it (entries vanish with the connection)
+_prepared = weakref.WeakKeyDictionary()
+
+
+def statement_name(report):
+    # named after the SQL text, so an edited report never reuses a stale statement
+    return "rpt_" + hashlib.sha1(report.prepared_sql().encode("utf-8")).hexdigest()[:16]
+
+
+def prepare(cur, report):
+    name = statement_name(report)
+    if name not in _prepared.setdefault(cur.connection, set()):
+        types = ", ".join("int" for _ in report.params)
+        cur.execute(f"PREPARE {name}{f'({types})' if types else ''} AS {report.prepared_sql()}")
+        _prepared[cur.connection].add(name)
+    return name
+
+
+def run_report(conn, key, **params):
+    """
+    Run report `key` with typed parameters on `conn` through a server-side prepared statement.
+    Returns (columns, row tuples). Raises KeyError for an unknown report, ValueError for bad parameters.
+    A transaction already open on `conn` is left open and intact.
+    """
+    report = REPORTS[key]
+    values = report.values(params)
+    args = [values[name] for name in report.params]
+    # inside a transaction the caller already opened, a failed EXECUTE is undone with a savepoint
+    # rather than rolling back the caller's work
+    savepoint = (not conn.autocommit
+                 and conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE)
+    cur = conn.cursor()
+    try:
+        name = prepare(cur, report)
+        execute = f"EXECUTE {name}({', '.join(['%s'] * len(args))})" if args else f"EXECUTE {name}"
+        if savepoint:
+            cur.execute("SAVEPOINT run_report")
+        try:
+            cur.execute(execute, args)
+        except psycopg2.errors.InvalidSqlStatementName:
+            # the session lost its statements (DISCARD ALL, pooler reset): prepare again once
+            if savepoint:
+                cur.execute("ROLLBACK TO SAVEPOINT run_report")
+            else:
+                conn.rollback()
+            _prepared[conn].discard(name)
+            prepare(cur, report)
+            cur.execute(execute, args)
+        columns = [d[0] for d in cur.description]
+        rows = cur.fetchall()
+        if savepoint:
+            cur.execute("RELEASE SAVEPOINT run_report")
+        return columns, rows
+    finally:
+        cur.close()
+
+
+def parse_params(pairs):
+    params = {}
+    for pair in pairs:
+        name, sep, value = pair.partition("=")
+        if not sep:
+            raise ValueError(f"--param expects name=value, got {pair!r}")
+        params[name.strip()] = value.strip()
+    return params
+
+
+def main():
+    # main.py builds QUERIES from this module, so its helpers are imported here rather than at the top
+    from main import add_connection_args, connection_info, print_table
+
+    parser = argparse.ArgumentParser(description="Run classicmodels reports with parameters.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="List reports and their parameters")
+    run_p = sub.add_parser("run", help="Run one report through a prepared statement")
+    run_p.add_argument("report", choices=list(REPORTS))
+    run_p.add_argument("--param", action="append", default=[], help="Parameter as name=value (repeatable)")
+    run_p.add_argument("--timeout", type=int, default=60, help="Statement timeout in seconds")
+    add_connection_args(run_p)
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for report in REPORTS.values():
+            print(report.key)
+            for p in report.params.values():
+                print(f"    {p.name}: {p.kind} (default {p.default}) — {p.help}")
+        return
+
+    try:
+        params = parse_params(args.param)
+        REPORTS[args.report].values(params)
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        conn = psycopg2.connect(**connection_info(args))
+        try:
+            cur = conn.cursor()
+            cur.execute("SET statement_timeout = %s;", (args.timeout * 1000,))
+            cur.close()
+            start = time.time()
+            columns, rows = run_report(conn, args.report, **params)
+            print(f"Query finished in {time.time() - start:.3f}s — {len(rows)} rows")
+            report = REPORTS[args.report]
+            print_table(f"{report.key} — -- {report.title.format(**report.values(params))}", columns, rows)
+        finally:
+            conn.close()
+    except Exception as e:
+        print("Connection or execution failed:", e, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
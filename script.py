@@ -1,7 +1,11 @@
+import argparse
+import io
 import random
 import decimal
 import datetime
+import time
 import psycopg2
+import psycopg2.extras
 from faker import Faker
 import traceback
 
@@ -13,6 +17,7 @@ NUM_EMPLOYEES = 30
 NUM_PRODUCTS = 120
 NUM_CUSTOMERS = 150
 NUM_ORDERS = 400
+BATCH_SIZE = 5000   # rows buffered per table in --bulk mode
 # ----------------
 
 fake = Faker()
@@ -69,24 +74,163 @@ def connect():
     conn.autocommit = False
     return conn
 
-def insert_productlines(cur):
-    lines = [
-        ("Motorcycles","Two-wheeled motor vehicles"),
-        ("Classic Cars","Classic and antique cars"),
-        ("Trucks and Buses","Heavier vehicles"),
-        ("Vintage Cars","Collectible old models"),
-        ("Planes","Model aircraft"),
-        ("Ships","Model ships"),
-    ]
+# column order of the rows produced by the insert_* functions
+COLUMNS = {
+    "productlines": ("productline", "textdescription"),
+    "offices": ("officecode", "city", "phone", "addressline1", "country", "postalcode", "territory"),
+    "employees": ("employeenumber", "lastname", "firstname", "extension", "email", "officecode", "reportsto", "jobtitle"),
+    "products": ("productcode", "productname", "productline", "productscale", "productvendor",
+                 "productdescription", "quantityinstock", "buyprice", "msrp"),
+    "customers": ("customernumber", "customername", "contactlastname", "contactfirstname", "phone",
+                  "addressline1", "city", "country", "salesrepemployeenumber", "creditlimit"),
+    "orders": ("ordernumber", "orderdate", "requireddate", "shippeddate", "status", "comments", "customernumber"),
+    "orderdetails": ("ordernumber", "productcode", "quantityordered", "priceeach", "orderlinenumber"),
+    "payments": ("customernumber", "checknumber", "paymentdate", "amount"),
+}
+# parents before children, so flushing a table never violates a foreign key
+TABLE_ORDER = list(COLUMNS)
+
+def has_orderdate(cur):
+    """True once partitions.py has migrated orderdetails, which then carries its order's orderdate."""
+    cur.execute("SELECT 1 FROM pg_attribute WHERE attrelid = 'orderdetails'::regclass "
+                "AND attname = 'orderdate' AND NOT attisdropped")
+    return cur.fetchone() is not None
+
+def merge_sql(table, source, dated=False):
+    """
+    INSERT ... SELECT from `source` (a staging table or a VALUES list aliased as s) ON CONFLICT DO NOTHING.
+    With `dated`, orderdetails rows get their order's orderdate: a row without it would go to the DEFAULT
+    partition as 'infinity', miss the existing row in ON CONFLICT and fail when it is moved to its month.
+    """
+    cols = ", ".join(COLUMNS[table])
+    if table == "orderdetails" and dated:
+        return (f"INSERT INTO {table} ({cols}, orderdate) "
+                f"SELECT {', '.join('s.' + c for c in COLUMNS[table])}, "
+                "COALESCE((SELECT o.orderdate FROM orders o WHERE o.ordernumber = s.ordernumber LIMIT 1), 'infinity') "
+                f"FROM {source} ON CONFLICT DO NOTHING")
+    return f"INSERT INTO {table} ({cols}) SELECT {cols} FROM {source} ON CONFLICT DO NOTHING"
+
+def insert_sql(table, dated=False, values=None):
+    """INSERT ... VALUES ... ON CONFLICT DO NOTHING; `values` defaults to one row of placeholders."""
+    cols = COLUMNS[table]
+    values = values or f"({', '.join(['%s'] * len(cols))})"
+    if table == "orderdetails" and dated:
+        return merge_sql(table, f"(VALUES {values}) AS s ({', '.join(cols)})", dated)
+    return f"INSERT INTO {table} ({', '.join(cols)}) VALUES {values} ON CONFLICT DO NOTHING"
+
+def copy_text(val):
+    """Format one value for COPY ... FROM STDIN (text format)."""
+    if val is None:
+        return "\\N"
+    return str(val).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+def copy_rows(cur, table, rows, dated=False):
+    """
+    Load rows with COPY into a temp staging table, then move them with INSERT ... SELECT
+    ON CONFLICT DO NOTHING: COPY speed while keeping the skip-duplicates semantics.
+    """
+    cols = ", ".join(COLUMNS[table])
+    stage = f"stage_{table}"
+    cur.execute(f"CREATE TEMP TABLE IF NOT EXISTS {stage} (LIKE {table} INCLUDING DEFAULTS)")
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join(copy_text(v) for v in row))
+        buf.write("\n")
+    buf.seek(0)
+    cur.copy_expert(f"COPY {stage} ({cols}) FROM STDIN", buf)
+    cur.execute(merge_sql(table, f"{stage} s", dated))
+    cur.execute(f"TRUNCATE {stage}")
+
+class RowWriter:
+    """Per-row path: one INSERT round trip for every generated row."""
+
+    def __init__(self, cur):
+        self.cur = cur
+        self.dated = has_orderdate(cur)
+        self.rows = {t: 0 for t in TABLE_ORDER}
+        self.seconds = {t: 0.0 for t in TABLE_ORDER}
+
+    def write(self, table, row):
+        start = time.time()
+        self.cur.execute(insert_sql(table, self.dated), row)
+        self.seconds[table] += time.time() - start
+        self.rows[table] += 1
+
+    def flush(self):
+        pass
+
+    def report(self):
+        for t in TABLE_ORDER:
+            if self.rows[t]:
+                secs = self.seconds[t] or 1e-9
+                print(f"  {t:<13} {self.rows[t]:>10} rows  {self.seconds[t]:8.3f}s  {self.rows[t] / secs:12,.0f} rows/s")
+
+class BulkWriter(RowWriter):
+    """
+    Buffers rows per table and writes them batch_size at a time with COPY (via a staging table)
+    or with multi-row execute_values INSERTs.
+    """
+
+    def __init__(self, cur, batch_size=BATCH_SIZE, method="copy"):
+        super().__init__(cur)
+        self.batch_size = batch_size
+        self.method = method
+        self.buffers = {t: [] for t in TABLE_ORDER}
+
+    def write(self, table, row):
+        self.buffers[table].append(row)
+        if len(self.buffers[table]) >= self.batch_size:
+            # parents first: buffered orders must exist before their orderdetails go in
+            for t in TABLE_ORDER[:TABLE_ORDER.index(table) + 1]:
+                self.flush_table(t)
+
+    def flush_table(self, table):
+        rows = self.buffers[table]
+        if not rows:
+            return
+        start = time.time()
+        if self.method == "values":
+            psycopg2.extras.execute_values(
+                self.cur, insert_sql(table, self.dated, values="%s"), rows, page_size=self.batch_size)
+        else:
+            copy_rows(self.cur, table, rows, self.dated)
+        self.seconds[table] += time.time() - start
+        self.rows[table] += len(rows)
+        self.buffers[table] = []
+
+    def flush(self):
+        for t in TABLE_ORDER:
+            self.flush_table(t)
+
+PRODUCTLINES = [
+    ("Motorcycles","Two-wheeled motor vehicles"),
+    ("Classic Cars","Classic and antique cars"),
+    ("Trucks and Buses","Heavier vehicles"),
+    ("Vintage Cars","Collectible old models"),
+    ("Planes","Model aircraft"),
+    ("Ships","Model ships"),
+]
+
+def scaled_counts(scale_factor):
+    """Entity counts for a scale factor (1.0 = the CONFIG defaults). Product lines stay fixed."""
+    def scale(n):
+        return max(1, int(round(n * scale_factor)))
+    return {
+        "productlines": NUM_PRODUCTLINES,
+        "offices": scale(NUM_OFFICES),
+        "employees": max(6, scale(NUM_EMPLOYEES)),  # 1001..1005 are the managers others report to
+        "products": scale(NUM_PRODUCTS),
+        "customers": scale(NUM_CUSTOMERS),
+        "orders": scale(NUM_ORDERS),
+    }
+
+def insert_productlines(out):
+    lines = PRODUCTLINES
     for pl, desc in lines[:NUM_PRODUCTLINES]:
-        cur.execute("""
-            INSERT INTO productlines (productline, textdescription)
-            VALUES (%s, %s)
-            ON CONFLICT (productline) DO NOTHING
-        """, (safe_str(pl, "productline"), desc))
+        out.write("productlines", (safe_str(pl, "productline"), desc))
     return [pl for pl,_ in lines[:NUM_PRODUCTLINES]]
 
-def insert_offices(cur):
+def insert_offices(out):
     offices = []
     for i in range(1, NUM_OFFICES+1):
         code = safe_str(str(100 + i), "officecode")
@@ -96,15 +240,11 @@ def insert_offices(cur):
         country = safe_str(fake.country(), "country")
         postal = safe_str(fake.postcode(), "postalcode")
         territory = safe_str(fake.bothify(text='T??')[:MAX["territory"]], "territory")
-        cur.execute("""
-            INSERT INTO offices (officecode, city, phone, addressline1, country, postalcode, territory)
-            VALUES (%s,%s,%s,%s,%s,%s,%s)
-            ON CONFLICT (officecode) DO NOTHING
-        """, (code, city, phone, addr, country, postal, territory))
+        out.write("offices", (code, city, phone, addr, country, postal, territory))
         offices.append(code)
     return offices
 
-def insert_employees(cur, office_codes):
+def insert_employees(out, office_codes):
     employees = []
     for i in range(1, NUM_EMPLOYEES+1):
         emp_no = 1000 + i
@@ -117,15 +257,11 @@ def insert_employees(cur, office_codes):
         reports_to = None
         if i > 5:
             reports_to = 1001 + random.randint(0, min(4, NUM_EMPLOYEES-1))
-        cur.execute("""
-            INSERT INTO employees (employeenumber, lastname, firstname, extension, email, officecode, reportsto, jobtitle)
-            VALUES (%s,%s,%s,%s,%s,%s,%s,%s)
-            ON CONFLICT (employeenumber) DO NOTHING
-        """, (emp_no, last, first, ext, email, office, reports_to, job))
+        out.write("employees", (emp_no, last, first, ext, email, office, reports_to, job))
         employees.append(emp_no)
     return employees
 
-def insert_products(cur, productlines):
+def insert_products(out, productlines):
     product_codes = []
     vendors = ["Min Lin Diecast", "Highway 66", "AutoArt Studio", "ClassicVendor", "VendorCo"]
     for i in range(1, NUM_PRODUCTS+1):
@@ -138,15 +274,11 @@ def insert_products(cur, productlines):
         qty = safe_smallint(random.randint(0,1000))
         buy = round(decimal.Decimal(random.uniform(10,500)),2)
         msrp = round(buy * decimal.Decimal(random.uniform(1.1,2.5)), 2)
-        cur.execute("""
-            INSERT INTO products (productcode, productname, productline, productscale, productvendor, productdescription, quantityinstock, buyprice, msrp)
-            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
-            ON CONFLICT (productcode) DO NOTHING
-        """, (code, name, line, scale, vendor, desc, qty, buy, msrp))
+        out.write("products", (code, name, line, scale, vendor, desc, qty, buy, msrp))
         product_codes.append((code, float(msrp)))
     return product_codes
 
-def insert_customers(cur, employees):
+def insert_customers(out, employees):
     customers = []
     for i in range(1, NUM_CUSTOMERS+1):
         cust_no = 3000 + i
@@ -159,15 +291,11 @@ def insert_customers(cur, employees):
         country = safe_str(fake.country(), "country")
         sales_rep = random.choice(employees + [None]*5)
         credit = round(decimal.Decimal(random.uniform(1000,50000)),2)
-        cur.execute("""
-            INSERT INTO customers (customernumber, customername, contactlastname, contactfirstname, phone, addressline1, city, country, salesrepemployeenumber, creditlimit)
-            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-            ON CONFLICT (customernumber) DO NOTHING
-        """, (cust_no, name, contact_last, contact_first, phone, addr, city, country, sales_rep, credit))
+        out.write("customers", (cust_no, name, contact_last, contact_first, phone, addr, city, country, sales_rep, credit))
         customers.append(cust_no)
     return customers
 
-def insert_orders_and_details(cur, customers, products):
+def insert_orders_and_details(out, customers, products):
     orders = []
     order_id = 5000
     for i in range(NUM_ORDERS):
@@ -177,11 +305,7 @@ def insert_orders_and_details(cur, customers, products):
         req_date = order_date + datetime.timedelta(days=random.randint(7,30))
         ship_date = order_date + datetime.timedelta(days=random.randint(1,10)) if random.random() < 0.9 else None
         status = safe_str(random.choice(["Shipped","Resolved","In Process","On Hold"]), "status")
-        cur.execute("""
-            INSERT INTO orders (ordernumber, orderdate, requireddate, shippeddate, status, comments, customernumber)
-            VALUES (%s,%s,%s,%s,%s,%s,%s)
-            ON CONFLICT (ordernumber) DO NOTHING
-        """, (order_id, order_date, req_date, ship_date, status, None, cust))
+        out.write("orders", (order_id, order_date, req_date, ship_date, status, None, cust))
         # orderdetails: 1..5 lines
         lines = random.randint(1,5)
         line_no = 1
@@ -189,44 +313,55 @@ def insert_orders_and_details(cur, customers, products):
             product, msrp = random.choice(products)
             qty = int(random.randint(1,50))
             price_each = round(random.uniform(max(0.01, msrp*0.7), msrp),2)
-            cur.execute("""
-                INSERT INTO orderdetails (ordernumber, productcode, quantityordered, priceeach, orderlinenumber)
-                VALUES (%s,%s,%s,%s,%s)
-                ON CONFLICT DO NOTHING
-            """, (order_id, safe_str(product, "productcode"), qty, price_each, line_no))
+            out.write("orderdetails", (order_id, safe_str(product, "productcode"), qty, price_each, line_no))
             line_no += 1
         orders.append(order_id)
     return orders
 
-def insert_payments(cur, customers):
+def insert_payments(out, customers):
     for c in customers:
         for _ in range(random.randint(0,3)):
             check = safe_str(f"CHK{random.randint(100000,999999)}", "checknumber")
             pay_date = fake.date_between(start_date='-2y', end_date='today')
             amount = round(decimal.Decimal(random.uniform(50, 20000)),2)
             try:
-                cur.execute("""
-                    INSERT INTO payments (customernumber, checknumber, paymentdate, amount)
-                    VALUES (%s,%s,%s,%s)
-                    ON CONFLICT DO NOTHING
-                """, (c, check, pay_date, amount))
+                out.write("payments", (c, check, pay_date, amount))
             except Exception as e:
                 # log but continue
                 print(f"[PAYMENT ERROR] cust {c} check {check}: {e}")
 
 def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic classicmodels data.")
+    parser.add_argument("--bulk", action="store_true",
+                        help="Buffer rows per table and load them in batches instead of one INSERT per row")
+    parser.add_argument("--batch-size", dest="batch_size", type=int, default=BATCH_SIZE,
+                        help=f"Rows per table per batch in --bulk mode (default: {BATCH_SIZE})")
+    parser.add_argument("--method", choices=["copy", "values"], default="copy",
+                        help="--bulk load method: COPY via staging table, or multi-row execute_values (default: copy)")
+    parser.add_argument("--scale-factor", dest="scale_factor", type=float, default=1.0,
+                        help="Multiply offices/employees/products/customers/orders counts (default: 1.0)")
+    args = parser.parse_args()
+
+    global NUM_OFFICES, NUM_EMPLOYEES, NUM_PRODUCTS, NUM_CUSTOMERS, NUM_ORDERS
+    counts = scaled_counts(args.scale_factor)
+    NUM_OFFICES, NUM_EMPLOYEES = counts["offices"], counts["employees"]
+    NUM_PRODUCTS, NUM_CUSTOMERS, NUM_ORDERS = counts["products"], counts["customers"], counts["orders"]
+
     conn = connect()
     cur = conn.cursor()
+    out = BulkWriter(cur, args.batch_size, args.method) if args.bulk else RowWriter(cur)
     try:
-        productlines = insert_productlines(cur)
-        offices = insert_offices(cur)
-        employees = insert_employees(cur, offices)
-        products = insert_products(cur, productlines)
-        customers = insert_customers(cur, employees)
-        orders = insert_orders_and_details(cur, customers, products)
-        insert_payments(cur, customers)
+        productlines = insert_productlines(out)
+        offices = insert_offices(out)
+        employees = insert_employees(out, offices)
+        products = insert_products(out, productlines)
+        customers = insert_customers(out, employees)
+        orders = insert_orders_and_details(out, customers, products)
+        insert_payments(out, customers)
+        out.flush()
         conn.commit()
         print("Data inserted successfully.")
+        out.report()
     except Exception as e:
         conn.rollback()
         print("Error:", e)